@@ -16,15 +16,27 @@ FROM Compiler root DIRECTORY, one level up from compiler:
 
 The analyzer then parses the Xxx.jack file, or in case of a directory all .jacks files. A corresponding
 Xxx.xml file for each .jack file is created and placed in the same directory as the .jack file/s.  
+
+Tokens of each file are kept in a token cache, which JackAnalyzer and JackCompiler share, so 
+a file is only lexed again when it changes. 
+
+OPTIONS:
+--no-cache        lex every .jack file, instead of reading tokens of files that haven't 
+                  changed from the token cache
+--cache-dir DIR   keep token cache in DIR, instead of __jackcache__ in the Xxx directory, or 
+                  in the directory of Xxx.jack
+--cache-size MB   evict least recently used tokens files when the cache is bigger than MB
 """
 
-import os, sys, ntpath 
+import os, ntpath, argparse 
 
 if os.getcwd().endswith('Compiler'):
     from compiler import compilation_engine_xml
+    from compiler import token_cache
     
 else:
     import compilation_engine_xml
+    import token_cache
     
     
 def parse_file(file, file_full_path, writer):
@@ -35,10 +47,12 @@ def parse_file(file, file_full_path, writer):
     pass  
     
 
-def parse(arg):
+def parse(arg, use_cache=True, cache_dir=None, cache_size=256 << 20):
     """
     Checks command argument to see if its a directory of .jack files or just one .jack file.
     Writes corresponding .xml file for each .jack file, and saves to the same directory as the .jack file/s.
+    Tokens are read from the token cache in cache_dir, or __jackcache__ in the same directory, 
+    unless use_cache is false, and the cache is then evicted down to cache_size bytes. 
     """
 
     #get directory or file from arg and, if on Windows, convert to back slashes
@@ -46,20 +60,35 @@ def parse(arg):
     to_translate = arg.strip()  
     to_translate = os.path.abspath(to_translate)
     
+    #JackAnalyzer and JackCompiler share the cache, as they lex the same files
+    cache = None
+    if use_cache:
+        directory = to_translate if os.path.isdir(to_translate) else os.path.dirname(to_translate)
+        try:
+            cache = token_cache.TokenCache(cache_dir or os.path.join(directory, '__jackcache__'), 
+                                           max_size=cache_size)
+        except OSError:
+            print('\nToken cache can\'t be created, lexing every file')
+    
     if os.path.isdir(to_translate):
         print('\nParsing .jack files in directory: \n\t' + to_translate)
         
         for root, dirs, files in os.walk(to_translate):
+            dirs[:] = [dir for dir in dirs if dir != '__jackcache__']
             for file in files:
                 if file.endswith('.jack'):
                     file_full_path = os.path.join(root, file)
                     file_to_write = file_full_path.replace('.jack', '.xml')
-                    compilation_engine_xml.CompilationEngine(file_full_path, file_to_write)
+                    compilation_engine_xml.CompilationEngine(file_full_path, file_to_write, cache=cache)
         
     else:
         print('\nParsing file: \n\t' + to_translate)
         to_write = to_translate.replace('.jack', '.xml')
-        compilation_engine_xml.CompilationEngine(to_translate, to_write)
+        compilation_engine_xml.CompilationEngine(to_translate, to_write, cache=cache)
+    
+    if cache is not None:
+        cache.evict()
+        print('\nToken cache: \n' + str(cache).rstrip('\n'))
     
     print('\nParsing completed')  
     print('\n----------------------------------------------------------------------')   
@@ -70,23 +99,35 @@ def main():
     If run_all, then walks through data directory to parse all .jack files and directories.    
     """
     
-    if sys.argv[1] == 'run_all':
+    parser = argparse.ArgumentParser(description='Parses Jack code into XML.')
+    parser.add_argument('input', help='Xxx directory, Xxx.jack file, or run_all')
+    parser.add_argument('--no-cache', dest='cache', action='store_false', 
+                        help='lex every file, without the token cache')
+    parser.add_argument('--cache-dir', default=None, 
+                        help='token cache directory (default: __jackcache__ in Xxx directory)')
+    parser.add_argument('--cache-size', type=int, default=256, 
+                        help='maximum size of token cache in MB (default: 256)')
+    args = parser.parse_args()
+    options = dict(use_cache=args.cache, cache_dir=args.cache_dir, cache_size=args.cache_size << 20)
+    
+    if args.input == 'run_all':
         if os.getcwd().endswith('Compiler'):
             start_directory = 'data/'
         else:
             start_directory = '../data/'   
             
         for root, dirs, files in os.walk(start_directory):
+            dirs[:] = [dir for dir in dirs if dir != '__jackcache__']
             for file in files:
                 if file.endswith('.jack'):
                     fname = os.path.join(root, file)
-                    parse(fname)                    
+                    parse(fname, **options)                    
             for dir in dirs:
                 dname = os.path.join(root, dir)
-                parse(dname)                     
+                parse(dname, **options)                     
         
     else:
-        parse(sys.argv[1])
+        parse(args.input, **options)
     
 if __name__ == '__main__':
     main()   
\ No newline at end of file
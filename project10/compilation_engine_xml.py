@@ -26,16 +26,20 @@ class CompilationEngine:
     xxx is the next syntactic element of the input.
     """
     
-    def __init__(self, input_full_path, output_full_path, test=False):
+    def __init__(self, input_full_path, output_full_path, test=False, cache=None):
         """
         creates a new compilation engine with the given input and output. 
-        The next method called must be compileClass().
+        The next method called must be compileClass(). If cache is a token_cache.TokenCache, 
+        tokens are read from the cache, instead of lexing the input again. 
         """
         
         self._file_path = input_full_path  
         self._file_name = ntpath.basename(input_full_path)
         self._file_open = open(output_full_path, 'w') 
-        self._tokenize = tokenizer.Tokenizer(input_full_path)
+        if cache is None:
+            self._tokenize = tokenizer.StreamTokenizer(input_full_path)
+        else:
+            self._tokenize = cache.get_tokenizer(input_full_path)
         self._tokenize.get_next_token()         
         self._indent = 0
         self._IDENTIFIER_REGEX = re.compile('^[A-Za-z0-9_-][A-Za-z0-9_-]*$')
@@ -336,7 +340,7 @@ class CompilationEngine:
         self.tag('expression')
         self._indent += 1
         
-        if (self._tokenize.get_token_type() in ['integerConstant', 'stringConstant', 'identifier']
+        if (self._tokenize.get_token_code() in [tokenizer.INT_CONST, tokenizer.STRING_CONST, tokenizer.IDENTIFIER]
             or self._tokenize.get_current_token() in ['true', 'false', 'null', 'this', '(', '-', '~']):  
             
             self.compile_term()
@@ -378,9 +382,7 @@ class CompilationEngine:
             self.compile_term()
             
         else:           
-            cached_token, cached_index, cached_is_string, cached_state = self._tokenize.cache_current_token()             
-            next_token = self._tokenize.get_next_token()            
-            self._tokenize.reset_current_token(cached_token, cached_index, cached_is_string, cached_state)          
+            next_token = self._tokenize.peek()
             
             if next_token in ['(', '.']:
                 self.compile_subroutine_call()
@@ -406,7 +408,7 @@ class CompilationEngine:
         self.tag('expressionList')
         self._indent += 1
         
-        if (self._tokenize.get_token_type() in ['integerConstant', 'stringConstant', 'identifier']
+        if (self._tokenize.get_token_code() in [tokenizer.INT_CONST, tokenizer.STRING_CONST, tokenizer.IDENTIFIER]
             or self._tokenize.get_current_token() in ['true', 'false', 'null', 'this', '(', '-', '~']):
             
             self.compile_expression() 
@@ -443,29 +445,29 @@ class CompilationEngine:
         """            
 
         token = self._tokenize.get_current_token()
-        token_type = self._tokenize.get_token_type()
+        token_code = self._tokenize.get_token_code()
         
         #when a token is a keyword or symbol, it should match the terminal or a terminal option, input as a string or list 
-        if token_type in ['keyword', 'symbol'] and token not in terminal:
+        if token_code in [tokenizer.KEYWORD, tokenizer.SYMBOL] and token not in terminal:
             error = ('\nERROR 1: ' + token + ' != ' + str(terminal) + ' at tag ' + str(self._tag_count) 
                     + ' from file: ' + self._file_name)                
             self.print_error(error) 
         
         #when a token is an integer, then the terminal input should include 'integerConstant'        
-        elif token_type == 'integerConstant' and 'integerConstant' not in terminal:
-            error = ('\nERROR 2: ' + str(terminal) + ' does not include ' + token_type + ' at tag ' + str(self._tag_count)
+        elif token_code == tokenizer.INT_CONST and 'integerConstant' not in terminal:
+            error = ('\nERROR 2: ' + str(terminal) + ' does not include ' + tokenizer.type_names[token_code] + ' at tag ' + str(self._tag_count)
                      + ' from file: ' + self._file_name) 
             self.print_error(error)  
         
         #when a token is a string, then the terminal input should include 'stringConstant' 
-        elif token_type == 'stringConstant' and 'stringConstant' not in terminal:     
-            error = ('\nERROR 3: ' + str(terminal) + ' does not include ' + token_type + ' at tag ' + str(self._tag_count)
+        elif token_code == tokenizer.STRING_CONST and 'stringConstant' not in terminal:     
+            error = ('\nERROR 3: ' + str(terminal) + ' does not include ' + tokenizer.type_names[token_code] + ' at tag ' + str(self._tag_count)
                      + ' from file: ' + self._file_name) 
             self.print_error(error)           
         
         #when a token is an identifier, then the terminal or a terminal option, input as a string or list, 
         #should match an item in ['className', 'subroutineName', 'varName']
-        elif token_type == 'identifier' and not any(x in terminal for x in ['className', 'subroutineName', 'varName']):     
+        elif token_code == tokenizer.IDENTIFIER and not any(x in terminal for x in ['className', 'subroutineName', 'varName']):     
             error = ('\nERROR 4: ' + str(terminal) + ' has no match in [\'className\', \'subroutineName\', \'varName\'] '
                      + 'at tag ' + str(self._tag_count) + ' from file: ' + self._file_name) 
             self.print_error(error) 
@@ -473,7 +475,7 @@ class CompilationEngine:
         #no errors, so get current token        
         else:
             token = self._tokenize.get_current_token(xml=True)                    
-            self.tag(token_type, token)
+            self.tag(tokenizer.type_names[token_code], token)
         
         #advance to next token, if there is one       
         token = self._tokenize.get_next_token()
@@ -490,5 +492,7 @@ class CompilationEngine:
         Prints information for error and exits program.      
         """
         
+        line, column = self._tokenize.get_position()
+        
         print('\n' + self._xml)
-        sys.exit(error)        
\ No newline at end of file
+        sys.exit(error + ', line ' + str(line) + ', column ' + str(column))        
\ No newline at end of file
@@ -30,10 +30,11 @@ class CompilationEngine:
     compilexxx() may only be called if xxx is the next syntactic element of the input.
     """
    
-    def __init__(self, input_full_path, output_full_path, test=False, test_class=''):
+    def __init__(self, input_full_path, output_full_path, test=False, test_class='', cache=None):
         """
         creates a new compilation engine with the given input and output. 
-        The next method called must be compileClass().
+        The next method called must be compileClass(). If cache is a token_cache.TokenCache, 
+        tokens are read from the cache, instead of lexing the input again. 
         """
         
         self._file_path = input_full_path  
@@ -41,7 +42,10 @@ class CompilationEngine:
         self._file_open = open(output_full_path, 'w')
         self._test_class = test_class        
         
-        self._tokenize = tokenizer.Tokenizer(input_full_path)
+        if cache is None:
+            self._tokenize = tokenizer.StreamTokenizer(input_full_path)
+        else:
+            self._tokenize = cache.get_tokenizer(input_full_path)
         self._tokenize.get_next_token()
         self._var_table = symbol_table.SymbolTable()
         self._class = ''
@@ -506,9 +510,7 @@ class CompilationEngine:
             self.write(code)       
             
         else:           
-            cached_token, cached_index, cached_is_string, cached_state = self._tokenize.cache_current_token()             
-            next_token = self._tokenize.get_next_token()            
-            self._tokenize.reset_current_token(cached_token, cached_index, cached_is_string, cached_state)    
+            next_token = self._tokenize.peek()
             
             #this is a subroutine call
             if next_token in ['(', '.']:
@@ -534,17 +536,17 @@ class CompilationEngine:
             #this is a variable or a constant              
             else:       
                 token = self._tokenize.get_current_token()
-                token_type = self._tokenize.get_token_type()
+                token_code = self._tokenize.get_token_code()
                 
-                if token_type == 'identifier':
+                if token_code == tokenizer.IDENTIFIER:
                     kind = self._var_table.kind_of(token, vm=True)
                     index = self._var_table.index_of(token)
                     code = vm.write_push(kind, str(index))
                     
-                elif token_type == 'integerConstant':
+                elif token_code == tokenizer.INT_CONST:
                     code = vm.write_push('constant', token)
                 
-                elif token_type == 'stringConstant':
+                elif token_code == tokenizer.STRING_CONST:
                     code = vm.write_string(token) 
 
                 elif token in ['true', 'false', 'null', 'this']:
@@ -561,7 +563,7 @@ class CompilationEngine:
         
         num_args = 0
         
-        if (self._tokenize.get_token_type() in ['integerConstant', 'stringConstant', 'identifier']
+        if (self._tokenize.get_token_code() in [tokenizer.INT_CONST, tokenizer.STRING_CONST, tokenizer.IDENTIFIER]
             or self._tokenize.get_current_token() in ['true', 'false', 'null', 'this', '(', '-', '~']):
             
             self.compile_expression()
@@ -580,29 +582,29 @@ class CompilationEngine:
         """            
 
         token = self._tokenize.get_current_token()
-        token_type = self._tokenize.get_token_type()
+        token_code = self._tokenize.get_token_code()
         
         #when a token is a keyword or symbol, it should match the terminal or a terminal option, input as a string or list 
-        if token_type in ['keyword', 'symbol'] and token not in terminal:
+        if token_code in [tokenizer.KEYWORD, tokenizer.SYMBOL] and token not in terminal:
             error = ('\nERROR 1: token ' + token + ' != terminal ' + str(terminal) 
                     + ' from file: ' + self._file_name)                
             self.print_error(error) 
         
         #when a token is an integer, then the terminal input should include 'integerConstant'        
-        elif token_type == 'integerConstant' and 'integerConstant' not in terminal:
-            error = ('\nERROR 2: terminal ' + str(terminal) + ' does not include token type ' + token_type
+        elif token_code == tokenizer.INT_CONST and 'integerConstant' not in terminal:
+            error = ('\nERROR 2: terminal ' + str(terminal) + ' does not include token type ' + tokenizer.type_names[token_code]
                      + ' from file: ' + self._file_name) 
             self.print_error(error)  
         
         #when a token is a string, then the terminal input should include 'stringConstant' 
-        elif token_type == 'stringConstant' and 'stringConstant' not in terminal:     
-            error = ('\nERROR 3: terminal ' + str(terminal) + ' does not include token type ' + token_type
+        elif token_code == tokenizer.STRING_CONST and 'stringConstant' not in terminal:     
+            error = ('\nERROR 3: terminal ' + str(terminal) + ' does not include token type ' + tokenizer.type_names[token_code]
                      + ' from file: ' + self._file_name) 
             self.print_error(error)           
         
         #when a token is an identifier, then the terminal or a terminal option, input as a string or list, 
         #should match an item in ['className', 'subroutineName', 'varName']
-        elif token_type == 'identifier' and not any(x in terminal for x in ['className', 'subroutineName', 'varName']):     
+        elif token_code == tokenizer.IDENTIFIER and not any(x in terminal for x in ['className', 'subroutineName', 'varName']):     
             error = ('\nERROR 4: terminal ' + str(terminal) + ' has no match in [\'className\', \'subroutineName\', \'varName\'] '
                      + ' from file: ' + self._file_name) 
             self.print_error(error)
@@ -629,4 +631,5 @@ class CompilationEngine:
         Prints information for error and exits program.      
         """
         
-        sys.exit(error)           
\ No newline at end of file
+        line, column = self._tokenize.get_position()
+        sys.exit(error + ', line ' + str(line) + ', column ' + str(column))           
\ No newline at end of file
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+
+"""
+Tests of how RegexTokenizer and StreamTokenizer split words that a comment separates, where
+the old Tokenizer joins them into one token.
+"""
+
+import os, tempfile, unittest
+
+import tokenizer
+
+
+def get_texts(tokenizer_class, content):
+    """
+    Writes content to a temporary .jack file, and returns list of texts of its tokens.
+    """
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        full_path = os.path.join(temp_dir, 'Main.jack')
+        with open(full_path, 'w') as f:
+            f.write(content)
+
+        tokens = tokenizer_class(full_path)
+        texts = []
+        while tokens.has_more_to_process():
+            if tokens.advance():
+                texts.append(tokens._current_token)
+
+    return texts
+
+
+class CommentBetweenWordsTest(unittest.TestCase):
+    """
+    A comment between two words ends the first word.
+    """
+
+    cases = [
+        ('let x/*c*/y;', ['let', 'x', 'y', ';']),
+        ('let a=23//c\nxx;', ['let', 'a', '=', '23', 'xx', ';']),
+        ('let/** doc */return;', ['let', 'return', ';'])
+    ]
+
+    def test_lex(self):
+        """
+        Lexes with lex().
+        """
+
+        for content, texts in self.cases:
+            self.assertEqual(tokenizer.lex(content).texts, texts)
+
+    def test_regex_tokenizer(self):
+        """
+        Tokenizes with RegexTokenizer.
+        """
+
+        for content, texts in self.cases:
+            self.assertEqual(get_texts(tokenizer.RegexTokenizer, content), texts)
+
+    def test_stream_tokenizer(self):
+        """
+        Tokenizes with StreamTokenizer.
+        """
+
+        for content, texts in self.cases:
+            self.assertEqual(get_texts(tokenizer.StreamTokenizer, content), texts)
+
+    def test_old_tokenizer_joins_words(self):
+        """
+        Tokenizer joins the words, which the others split.
+        """
+
+        for content, texts in self.cases:
+            self.assertNotEqual(get_texts(tokenizer.Tokenizer, content), texts)
+
+
+if __name__ == '__main__':
+    unittest.main()
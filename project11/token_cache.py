@@ -0,0 +1,324 @@
+# -*- coding: utf-8 -*-
+
+"""
+This class keeps an on-disk cache of the tokens of .jack files, so JackAnalyzer and JackCompiler,
+which both lex the same files on every build, only lex a file once until it changes.
+
+Each file's tokens are stored in one binary file, keyed by a hash of its content and of the
+tokenizer version, which is a hash of the tokenizer's own source code. project10 and project11
+have the same tokenizer, so they have the same version, and share a cache directory, which is
+__jackcache__ in the Xxx directory by default.
+
+A cache file is a header, followed by three unsigned 32-bit words for each token, which are the
+index of its text in the vocabulary shifted left by 3 with its type code in the low 3 bits, its
+line and its column, and then the vocabulary, which is a JSON list of each distinct text. A file
+is memory-mapped to read it, so only the vocabulary is decoded, and tokens are read from the
+mapped words as the compilation engine asks for them.
+"""
+
+import os, sys, json, mmap, struct, hashlib
+from array import array
+
+if os.getcwd().endswith('Compiler'):
+    from compiler import tokenizer
+    from compiler import lexical_elements
+
+else:
+    import tokenizer
+    import lexical_elements
+
+
+#magic, number of tokens and offset of vocabulary, in native byte order, which is in the version
+_HEADER = struct.Struct('=4sII')
+_MAGIC = b'JTOK'
+
+#bytes read at a time to hash a file
+_HASH_CHUNK_SIZE = 1 << 20
+
+
+def get_version():
+    """
+    Returns hash of the source code of the tokenizer, lexical elements and cache format, which
+    changes whenever the tokens of a file may.
+    """
+
+    version = hashlib.sha256(sys.byteorder.encode('utf-8'))
+
+    for module in [tokenizer, lexical_elements, sys.modules[__name__]]:
+        with open(module.__file__, 'rb') as f:
+            version.update(f.read())
+
+    return version.hexdigest()
+
+
+class TokenCache:
+    """
+    Stores tokens of .jack files in a directory, one .tok file for each file content.
+    """
+
+    def __init__(self, cache_dir, max_size=256 << 20):
+        """
+        Accepts cache directory, which is created if it doesn't exist, and maximum size of
+        cache in bytes. Least recently used files are removed by evict() when the cache is
+        bigger than max_size.
+        """
+
+        self._cache_dir = cache_dir
+        self._version = get_version()
+        self._max_size = max_size
+        self._hits = 0
+        self._misses = 0
+
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def __str__(self):
+        to_print =  '  Cache directory: ' + self._cache_dir + '\n'
+        to_print += '       Cache hits: ' + str(self._hits) + '\n'
+        to_print += '     Cache misses: ' + str(self._misses) + '\n'
+        return to_print
+
+    def get_key(self, full_path):
+        """
+        Accepts path of .jack file, and returns key of its tokens.
+        """
+
+        key = hashlib.sha256(self._version.encode('utf-8'))
+        key.update(b'\0')
+
+        with open(full_path, 'rb') as f:
+            for block in iter(lambda: f.read(_HASH_CHUNK_SIZE), b''):
+                key.update(block)
+
+        return key.hexdigest()
+
+    def _get_path(self, key):
+        """
+        Returns path of tokens file for key.
+        """
+
+        return os.path.join(self._cache_dir, key + '.tok')
+
+    def _map(self, path):
+        """
+        Returns (words, texts) of tokens file, where words is a memoryview of its mapped
+        32-bit words, and texts is its vocabulary, or None if it can't be read.
+        """
+
+        mapped = None
+
+        try:
+            with open(path, 'rb') as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+            #tokens are read in order, so pages can be read ahead and dropped behind
+            if hasattr(mmap, 'MADV_SEQUENTIAL'):
+                mapped.madvise(mmap.MADV_SEQUENTIAL)
+
+            magic, count, vocabulary_offset = _HEADER.unpack_from(mapped)
+            if magic != _MAGIC or vocabulary_offset != _HEADER.size + 12 * count:
+                mapped.close()
+                return None
+
+            texts = json.loads(mapped[vocabulary_offset:].decode('utf-8'))
+
+        except (OSError, ValueError, struct.error):
+            if mapped is not None:
+                mapped.close()
+            return None
+
+        return memoryview(mapped)[_HEADER.size:vocabulary_offset].cast('I'), texts
+
+    def get(self, key):
+        """
+        Returns (words, texts) stored for key, as _map() returns them, or None if key isn't
+        cached.
+        """
+
+        path = self._get_path(key)
+        tokens = self._map(path)
+
+        if tokens is None:
+            self._misses += 1
+            return None
+
+        #mark file as recently used, for evict(), which only changes which files are evicted first
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+        self._hits += 1
+        return tokens
+
+    def put(self, key, full_path):
+        """
+        Lexes .jack file one chunk at a time, and stores its tokens for key, so memory use
+        doesn't grow with the size of the file. Tokens are written to a temporary file first,
+        so a build that's stopped halfway never leaves a broken tokens file.
+        """
+
+        path = self._get_path(key)
+        temp_path = path + '.' + str(os.getpid()) + '.tmp'
+
+        lexer = tokenizer.Lexer()
+        tokens = lexer.tokens
+        vocabulary = {}
+        add_text = vocabulary.setdefault
+        count = 0
+        carry = ''
+
+        with open(full_path) as source, open(temp_path, 'wb') as f:
+            f.write(_HEADER.pack(_MAGIC, 0, 0))
+            final = False
+
+            while not final:
+                chunk = source.read(tokenizer.chunk_size)
+                final = len(chunk) < tokenizer.chunk_size
+                carry = lexer.lex_piece(carry + chunk, final)
+
+                #interleave text index and type code, line and column of each token
+                words = array('I', bytes(12 * len(tokens)))
+                words[0::3] = array('I', [add_text(text, len(vocabulary)) << 3 | code
+                                          for text, code in zip(tokens.texts, tokens.codes)])
+                words[1::3] = tokens.lines
+                words[2::3] = tokens.columns
+                f.write(words.tobytes())
+
+                count += len(tokens)
+                del tokens.texts[:]
+                del tokens.codes[:]
+                del tokens.lines[:]
+                del tokens.columns[:]
+
+            vocabulary_offset = f.tell()
+            f.write(json.dumps(list(vocabulary)).encode('utf-8'))
+            f.seek(0)
+            f.write(_HEADER.pack(_MAGIC, count, vocabulary_offset))
+
+        os.replace(temp_path, path)
+
+    def get_tokenizer(self, full_path):
+        """
+        Returns MappedTokenizer of .jack file's cached tokens, which are lexed and stored first
+        if they aren't cached, or a StreamTokenizer if they can't be stored.
+        """
+
+        key = self.get_key(full_path)
+        tokens = self.get(key)
+
+        if tokens is None:
+            try:
+                self.put(key, full_path)
+            except OSError:
+                return tokenizer.StreamTokenizer(full_path)
+
+            tokens = self._map(self._get_path(key))
+            if tokens is None:
+                return tokenizer.StreamTokenizer(full_path)
+
+        return MappedTokenizer(full_path, *tokens)
+
+    def evict(self):
+        """
+        Removes least recently used tokens files until cache is no bigger than max size.
+        Returns number of files removed.
+        """
+
+        files = []
+        size = 0
+
+        for entry in os.scandir(self._cache_dir):
+            if entry.name.endswith('.tok'):
+                status = entry.stat()
+                files.append((status.st_mtime, status.st_size, entry.path))
+                size += status.st_size
+
+        files.sort()
+        removed = 0
+
+        for mtime, file_size, path in files:
+            if size <= self._max_size:
+                break
+
+            os.remove(path)
+            size -= file_size
+            removed += 1
+
+        return removed
+
+
+class MappedTokenizer(tokenizer.RegexTokenizer):
+    """
+    RegexTokenizer that reads tokens from the mapped words of a tokens file, with the same
+    interface and tokens, so a file that's cached isn't read or lexed at all.
+    """
+
+    def __init__(self, full_path, words, texts):
+        """
+        Accepts path of .jack file, and the mapped words and vocabulary of its tokens.
+        """
+
+        self._file_path = full_path
+        self._words = words
+        self._texts = texts
+        self._count = len(words) // 3
+        self._cursor_index = 0
+        self._current_token = ''
+        self._current_token_is_string = False
+        self._state = 'code'
+        self._token_index = 0
+        self._current_code = tokenizer.INVALID
+
+    def __str__(self):
+        to_print = tokenizer.Tokenizer.__str__(self)
+        to_print += '    Token index: ' + str(self._token_index) + ' of ' + str(self._count) + '\n'
+        return to_print
+
+    def has_more_to_process(self):
+        """
+        Do we have more tokens? Returns boolean.
+        """
+
+        return self._token_index < self._count
+
+    def advance(self):
+        """
+        Makes next token current token. Should only be called if has_more_to_process() is true.
+        Returns whether token isn't empty, which an empty string is.
+        """
+
+        index = self._token_index
+        word = self._words[3 * index]
+        self._current_token = self._texts[word >> 3]
+        self._current_code = word & 7
+        self._current_token_is_string = self._current_code == tokenizer.STRING_CONST
+        self._token_index = index + 1
+        return len(self._current_token) > 0
+
+    def get_position(self):
+        """
+        Returns line and column where the current token starts, counted from 1, or (0, 0)
+        if there is no current token yet.
+        """
+
+        if self._token_index == 0:
+            return 0, 0
+
+        index = 3 * (self._token_index - 1)
+        return self._words[index + 1], self._words[index + 2]
+
+    def peek(self, k=1, xml=False):
+        """
+        Returns token k tokens after current token, or None if there isn't one, without
+        advancing.
+        """
+
+        index = self._token_index + k - 1
+        if index >= self._count:
+            return None
+
+        token = self._texts[self._words[3 * index] >> 3]
+        if xml and token in lexical_elements.xml_entities:
+            return lexical_elements.xml_entities[token]
+
+        return token
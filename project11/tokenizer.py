@@ -8,9 +8,31 @@ This class, when applied to a text file containing Jack code, produces a list of
     - integer constant
     - string constant 
 Each is printed in a separate line, with its classification recorded using XML tags.
+
+Tokenizer walks the input one character at a time. RegexTokenizer lexes the whole input in one 
+pass with a master regex, into a TokenArray, which holds the text, type code, line and column of 
+each token, all found as the token is lexed, and then advance() only moves to the next token in 
+the array. RegexTokenizer is a token buffer, where peek() looks ahead by reading the array at 
+an index, without scanning the input again, and get_token_code() gives the type of a token as 
+an integer, to compare with KEYWORD, SYMBOL, IDENTIFIER, INT_CONST and STRING_CONST.
+
+Both have the same interface, and give the same tokens when words are kept apart by white space 
+or symbols. Otherwise, comments and strings separate tokens in RegexTokenizer, where Tokenizer 
+joins the tokens on both sides:
+    - x/*c*/y is x and y, where Tokenizer gives xy
+    - 23//c, a newline, and then xx is 23 and xx, where Tokenizer gives 23xx
+    - let/** doc */return is let and return, where Tokenizer gives letreturn
+    - return"x" is the keyword return and the string x, where Tokenizer gives the string returnx
+    - a / at the end of the input, right after a block comment, is a symbol, which Tokenizer 
+      drops, as it takes it for the start of a comment
+
+StreamTokenizer is the RegexTokenizer that the compilation engines run on. It reads the input in 
+chunks, and a Lexer lexes each chunk, carrying a token, string or comment that runs past the end 
+of a chunk into the next, so memory use stays the same for inputs of any size.
 """
 
 import os, re
+from array import array
 
 if os.getcwd().endswith('Compiler'):
     from compiler import lexical_elements
@@ -19,6 +41,215 @@ else:
     import lexical_elements
     
 
+#master regex of RegexTokenizer, which matches a comment, which is skipped, or one of three 
+#groups: a string, with its quotes, which can run over lines, a symbol, or a word, which is any 
+#other run of characters, such as a keyword, an identifier or an integer. White space matches 
+#nothing, so searching for the next match skips it
+_SYMBOLS = re.escape(''.join(lexical_elements.symbols))
+_TOKEN_REGEX = re.compile(r'//[^\n]*|/\*.*?(?:\*/|\Z)'
+                          r'|("[^"]*"?)'
+                          r'|([' + _SYMBOLS + r'])'
+                          r'|([^ \t\n"' + _SYMBOLS + r']+)', re.S)
+
+_IDENTIFIER_REGEX = re.compile('^[A-Za-z0-9_-][A-Za-z0-9_-]*$')
+
+#characters StreamTokenizer reads at a time
+chunk_size = 1 << 16
+
+#type codes of tokens, which index type_names, and INVALID for a token that isn't a valid type
+KEYWORD, SYMBOL, IDENTIFIER, INT_CONST, STRING_CONST, INVALID = range(6)
+type_names = ['keyword', 'symbol', 'identifier', 'integerConstant', 'stringConstant', None]
+type_codes = {name: code for code, name in enumerate(type_names)}
+
+#type code of each keyword and symbol
+_TOKEN_CODES = dict.fromkeys(lexical_elements.keywords, KEYWORD)
+_TOKEN_CODES.update(dict.fromkeys(lexical_elements.symbols, SYMBOL))
+
+
+def get_word_code(word):
+    """
+    Returns type code of a token that isn't a string, of the same type as 
+    Tokenizer.get_token_type() gives, or INVALID if it isn't a valid token. 
+    """
+    
+    code = _TOKEN_CODES.get(word)
+    if code is not None:
+        return code
+        
+    elif word.isdigit():
+        return INT_CONST
+        
+    elif _IDENTIFIER_REGEX.match(word):
+        return IDENTIFIER
+        
+    return INVALID
+
+def lex(content):
+    """
+    Lexes Jack code in one pass and returns its tokens as a TokenArray. 
+    """
+    
+    lexer = Lexer()
+    lexer.lex_piece(content, final=True)
+    return lexer.tokens
+    
+
+class Lexer:
+    """
+    Lexes Jack code into a TokenArray, tokens, either in one piece, or in consecutive pieces 
+    of a stream, such as chunks of a file, where tokens, strings and comments can run from one 
+    piece into the next. Lines and columns are counted over the whole stream. 
+    """
+    
+    def __init__(self):
+        """
+        Gets ready to lex from the start of a stream. 
+        """
+        
+        self.tokens = TokenArray()
+        
+        #each distinct word is typed once, and kept as one string for all its tokens
+        self._words = {}
+        
+        #line number, and offsets in the stream where the line starts, up to where newlines 
+        #are counted, and of the start of the next piece
+        self._line = 1
+        self._line_start = 0
+        self._counted = 0
+        self._base = 0
+        
+    def lex_piece(self, content, final=False):
+        """
+        Lexes next piece of the stream, or the last piece if final is true, and adds its tokens 
+        to tokens. Returns what's left at the end of the piece that may go on in the next 
+        piece, such as part of a word or a string, which should be put in front of the next 
+        piece. All that's kept of a comment that isn't closed is how it starts, so a comment 
+        can run over any number of pieces. 
+        """
+        
+        texts = self.tokens.texts
+        codes = self.tokens.codes
+        lines = self.tokens.lines
+        columns = self.tokens.columns
+        words = self._words
+        line = self._line
+        line_start = self._line_start
+        counted = self._counted - self._base
+        base = self._base
+        end = len(content)
+        carry = ''
+        
+        for match in _TOKEN_REGEX.finditer(content):
+            group = match.lastindex
+            start = match.start()
+            
+            #a match that runs to the end of a piece that isn't the last may go on in the next
+            if not final and match.end() == end:
+                text = match.group()
+                
+                #only how a comment starts is carried, and newlines are counted to the end
+                if group is None and text.startswith('//'):
+                    carry = '//'
+                    break
+                    
+                if group is None and not (len(text) >= 4 and text.endswith('*/')):
+                    carry = '/*' + ('*' if len(text) > 2 and text.endswith('*') else '')
+                    break
+                    
+                #a word, a string that isn't closed, or / that may start a comment is lexed again
+                if group == 3 or text == '/' or (group == 1 and not (len(text) > 1 and text.endswith('"'))):
+                    carry = text
+                    end = start
+                    break
+                    
+            #comment
+            if group is None:
+                continue
+                
+            newlines = content.count('\n', counted, start)
+            if newlines:
+                line += newlines
+                line_start = base + content.rfind('\n', counted, start) + 1
+            counted = start
+            
+            if group == 3:
+                word = match.group(3)
+                entry = words.get(word)
+                if entry is None:
+                    entry = words[word] = word, get_word_code(word)
+                text, code = entry
+                
+            elif group == 2:
+                text = match.group(2)
+                code = SYMBOL
+                
+            else:
+                text = match.group(1)
+                
+                if len(text) > 1 and text.endswith('"'):
+                    text = text[1:-1]
+                    code = STRING_CONST
+                    
+                #a string that isn't closed runs to the end of the input, and isn't typed as a string
+                else:
+                    text = text[1:]
+                    code = get_word_code(text)
+                    
+            texts.append(text)
+            codes.append(code)
+            lines.append(line)
+            columns.append(base + start - line_start + 1)
+            
+        newlines = content.count('\n', counted, end)
+        if newlines:
+            line += newlines
+            line_start = base + content.rfind('\n', counted, end) + 1
+            
+        #the next piece starts with what's left, which is either text from the end of this 
+        #piece, or a comment opener without newlines, standing in for the rest of the comment
+        self._line = line
+        self._line_start = line_start
+        self._counted = base + end
+        self._base = base + end if end < len(content) else base + end - len(carry)
+        
+        return carry
+        
+
+class TokenArray:
+    """
+    Tokens of a Jack file, as a structure of arrays: the text of each token, without quotes 
+    for a string, and its type code, and the line and column where it starts, counted from 1. 
+    Token i is texts[i], codes[i], lines[i] and columns[i].
+    """
+    
+    __slots__ = ('texts', 'codes', 'lines', 'columns')
+    
+    def __init__(self):
+        """
+        Creates empty array of tokens. 
+        """
+        
+        self.texts = []
+        self.codes = array('b')
+        self.lines = array('I')
+        self.columns = array('I')
+        
+    def __len__(self):
+        return len(self.texts)
+        
+    def __getitem__(self, index):
+        """
+        Returns (text, code, line, column) of token at index. 
+        """
+        
+        return self.texts[index], self.codes[index], self.lines[index], self.columns[index]
+        
+    def __str__(self):    
+        to_print = '  Tokens: ' + str(len(self.texts)) + '\n'
+        to_print += '   Lines: ' + str(self.lines[-1] if self.lines else 0) + '\n'
+        return to_print
+    
+
 class Tokenizer:
     """
     The tokenizer removes all comments and white space from the input stream 
@@ -36,6 +267,7 @@ class Tokenizer:
         self._cursor_index = 0    
         self._current_token = '' 
         self._current_token_is_string = False
+        self._token_start = None
         self._state = 'code' #can be 'code', 'block comment', 'inline comment' or 'string' 
         self._IDENTIFIER_REGEX = re.compile('^[A-Za-z0-9_-][A-Za-z0-9_-]*$')        
     
@@ -121,6 +353,7 @@ class Tokenizer:
                         
                         #if there is no token stored yet in self._current_token, then the symbol is a token 
                         if len(self._current_token) == 0:
+                            self._token_start = self._cursor_index
                             self._current_token += char 
                             
                         #if there is a token stored in self._current_token, then symbol ends that token
@@ -130,9 +363,12 @@ class Tokenizer:
                         
                 elif char == '"':
                     self._state = 'string'
+                    self._token_start = self._cursor_index
                 
                 #this is another character in a token                
                 else:
+                    if len(self._current_token) == 0:
+                        self._token_start = self._cursor_index
                     self._current_token += char                
             
             self._cursor_index += 1
@@ -167,6 +403,26 @@ class Tokenizer:
 
         print('\nCURRENT TOKEN IS NOT A VALID TYPE:', self._current_token, '\n')            
         
+    def get_token_code(self):
+        """
+        Returns type code of the current token, such as KEYWORD. 
+        """
+        
+        return type_codes[self.get_token_type()]
+        
+    def get_position(self):
+        """
+        Returns line and column where the current token starts, counted from 1, or (0, 0) 
+        if there is no current token yet. Counts lines of the input up to the token.
+        """
+        
+        if self._token_start is None:
+            return 0, 0
+            
+        line = self._content.count('\n', 0, self._token_start) + 1
+        column = self._token_start - self._content.rfind('\n', 0, self._token_start)
+        return line, column
+        
     def get_current_token(self, xml=False):
         """
         Returns current token. 
@@ -191,20 +447,35 @@ class Tokenizer:
 
     def cache_current_token(self):
         """
-        Returns current token, cursor index and states for caching. 
+        Returns current token, cursor index, states and where token starts for caching. 
         """  
 
-        return self._current_token, self._cursor_index, self._current_token_is_string, self._state     
+        return (self._current_token, self._cursor_index, self._current_token_is_string, self._state, 
+                self._token_start)     
 
-    def reset_current_token(self, token, index, is_string, state):
+    def reset_current_token(self, token, index, is_string, state, token_start=None):
         """
-        Sets or resets current token, cursor index and states to cached values. 
+        Sets or resets current token, cursor index, states and where token starts to cached values. 
         """  
         
         self._current_token = token
         self._cursor_index = index 
         self._current_token_is_string = is_string
         self._state = state
+        self._token_start = token_start
+        
+    def peek(self, k=1, xml=False):
+        """
+        Returns token k tokens after current token, or None if there isn't one, without 
+        advancing. Scans the input ahead, and then resets cursor. 
+        """
+        
+        cached = self.cache_current_token()
+        for i in range(k):
+            token = self.get_next_token(xml=xml)
+        self.reset_current_token(*cached)
+        
+        return token
         
     def write_xml(self):
         """
@@ -227,4 +498,225 @@ class Tokenizer:
                            + ' </' + self.get_token_type() + '>\n')                         
                     f.write(tag)
                     
-            f.write('</tokens>\n')    
\ No newline at end of file
+            f.write('</tokens>\n')
+
+
+class RegexTokenizer(Tokenizer):
+    """
+    Tokenizer that lexes the whole input when it's created, with the same interface as 
+    Tokenizer, and types and positions that are found once, as tokens are lexed. A comment or 
+    a string ends the word before it, so x/*c*/y is the identifiers x and y, and return"x" is 
+    the keyword return and the string x, where Tokenizer joins them into xy or returnx, as 
+    listed in the module docstring. 
+    """
+    
+    def __init__(self, full_path):
+        """
+        Opens the input file/stream and tokenizes it.
+        """
+        
+        Tokenizer.__init__(self, full_path)
+        self._tokens = lex(self._content)
+        self._texts = self._tokens.texts
+        self._codes = self._tokens.codes
+        self._token_index = 0
+        self._current_code = INVALID
+        
+    def __str__(self):    
+        to_print = Tokenizer.__str__(self)
+        to_print += '    Token index: ' + str(self._token_index) + ' of ' + str(len(self._tokens)) + '\n'
+        return to_print
+        
+    def has_more_to_process(self):
+        """
+        Do we have more tokens? Returns boolean. 
+        """  
+
+        return self._token_index < len(self._texts)        
+
+    def advance(self):
+        """
+        Makes next token current token. Should only be called if has_more_to_process() is true. 
+        Returns whether token isn't empty, which an empty string is. 
+        """
+        
+        index = self._token_index
+        self._current_token = self._texts[index]
+        self._current_code = self._codes[index]
+        self._current_token_is_string = self._current_code == STRING_CONST
+        self._token_index = index + 1
+        return len(self._current_token) > 0
+        
+    def get_token_type(self):
+        """
+        Returns type of the current token, which was assigned when it was lexed. 
+        """
+        
+        if self._current_code == INVALID:
+            print('\nCURRENT TOKEN IS NOT A VALID TYPE:', self._current_token, '\n')
+            
+        return type_names[self._current_code]
+        
+    def get_token_code(self):
+        """
+        Returns type code of the current token, which was assigned when it was lexed. 
+        """
+        
+        if self._current_code == INVALID:
+            print('\nCURRENT TOKEN IS NOT A VALID TYPE:', self._current_token, '\n')
+            
+        return self._current_code
+        
+    def get_position(self):
+        """
+        Returns line and column where the current token starts, counted from 1, or (0, 0) 
+        if there is no current token yet. 
+        """
+        
+        if self._token_index == 0:
+            return 0, 0
+            
+        return self._tokens.lines[self._token_index - 1], self._tokens.columns[self._token_index - 1]
+
+    def cache_current_token(self):
+        """
+        Returns current token, token index, type code and state for caching. 
+        """  
+
+        return self._current_token, self._token_index, self._current_code, self._state     
+
+    def reset_current_token(self, token, index, code, state):
+        """
+        Sets or resets current token, token index, type code and state to cached values. 
+        """  
+        
+        self._current_token = token
+        self._token_index = index 
+        self._current_code = code
+        self._current_token_is_string = code == STRING_CONST
+        self._state = state
+        
+    def peek(self, k=1, xml=False):
+        """
+        Returns token k tokens after current token, or None if there isn't one, without 
+        advancing. Only reads the array of tokens. 
+        """
+        
+        index = self._token_index + k - 1
+        if index >= len(self._texts):
+            return None
+            
+        token = self._texts[index]
+        if xml and token in lexical_elements.xml_entities:
+            return lexical_elements.xml_entities[token]
+            
+        return token
+        
+        
+class StreamTokenizer(RegexTokenizer):
+    """
+    RegexTokenizer that reads the input in chunks of chunk_size characters, as tokens are needed, 
+    and lexes each chunk with a Lexer, so the whole input is never in memory. Only tokens from 
+    the current token on are kept, which is at most about one chunk of tokens, so memory use 
+    doesn't grow with the size of the input, such as big data tables written by other programs. 
+    """
+    
+    def __init__(self, full_path, chunk_size=chunk_size):
+        """
+        Opens the input file/stream and gets ready to tokenize it, one chunk at a time.
+        """
+        
+        self._file_path = full_path
+        self._file = open(full_path)
+        self._chunk_size = chunk_size
+        self._lexer = Lexer()
+        self._carry = ''
+        self._cursor_index = 0    
+        self._current_token = '' 
+        self._current_token_is_string = False
+        self._state = 'code'
+        self._tokens = self._lexer.tokens
+        self._texts = self._tokens.texts
+        self._codes = self._tokens.codes
+        self._token_index = 0
+        self._current_code = INVALID
+        
+        #number of tokens dropped from the front of tokens, as index of tokens[0] in the input
+        self._dropped = 0
+        
+    def __str__(self):    
+        to_print = RegexTokenizer.__str__(self)
+        to_print += ' Tokens dropped: ' + str(self._dropped) + '\n'
+        return to_print
+        
+    def _read_chunk(self):
+        """
+        Drops tokens before the current token, and lexes next chunk of the input. Returns 
+        False if the whole input has been read. 
+        """
+        
+        if self._file is None:
+            return False
+            
+        chunk = self._file.read(self._chunk_size)
+        final = len(chunk) < self._chunk_size
+        if final:
+            self._file.close()
+            self._file = None
+            
+        keep = self._token_index - 1
+        if keep > 0:
+            tokens = self._tokens
+            del tokens.texts[:keep]
+            del tokens.codes[:keep]
+            del tokens.lines[:keep]
+            del tokens.columns[:keep]
+            self._token_index -= keep
+            self._dropped += keep
+            
+        self._carry = self._lexer.lex_piece(self._carry + chunk, final)
+        self._cursor_index += len(chunk)
+        return True
+        
+    def has_more_to_process(self):
+        """
+        Do we have more tokens? Returns boolean. Reads chunks until there is a next token, or 
+        the input ends. 
+        """  
+
+        while self._token_index >= len(self._texts):
+            if not self._read_chunk():
+                return False
+                
+        return True
+        
+    def cache_current_token(self):
+        """
+        Returns current token, token index in the input, type code and state for caching. 
+        """  
+
+        return self._current_token, self._dropped + self._token_index, self._current_code, self._state     
+
+    def reset_current_token(self, token, index, code, state):
+        """
+        Sets or resets current token, token index, type code and state to cached values. Tokens 
+        before the current token may have been dropped since they were cached. 
+        """  
+        
+        #the current token is the one before index, which has to be kept
+        if self._dropped and index <= self._dropped:
+            raise ValueError('token ' + str(index) + ' was dropped from the stream')
+            
+        RegexTokenizer.reset_current_token(self, token, index - self._dropped, code, state)
+        
+    def peek(self, k=1, xml=False):
+        """
+        Returns token k tokens after current token, or None if there isn't one, without 
+        advancing. Reads chunks until that token is lexed, or the input ends. 
+        """
+        
+        while self._token_index + k - 1 >= len(self._texts):
+            if not self._read_chunk():
+                break
+                
+        return RegexTokenizer.peek(self, k, xml)
@@ -12,47 +12,426 @@ FROM VMTranslator DIRECTORY one level up:
 -prompt> python -m vm_translator Xxx
 -prompt> python -m vm_translator Xxx.vm
 
+AS A LIBRARY, with no files, command line arguments or working directory involved:
+>>> code = VMTranslator.translate({'Main': main_vm_text, 'Sys': sys_vm_text})
+>>> for code in VMTranslator.translate_stream(sources): ...
+>>> words = VMTranslator.build(sources)
+
 The translator then translates the Xxx.vm file, or in case of a directory all .vm files. The result
 is always a single assembly-language file named Xxx.asm. 
+
+OPTIONS:
+-j N, --jobs N    translate the .vm files of a directory in a pool of N processes, and join
+                  the translations in the same order as a serial run (N=0 uses all cores)
+-O, --optimize    run a peephole optimization pass over the assembly code before it's saved,
+                  and report ROM size before and after  
+-c, --compact     jump to one shared call routine and one shared return routine, instead of
+                  inlining the whole calling sequence at each call and return
+-n, --no-comments leave out comments, which also turns on the push and pop snippet cache
+-d, --dead-code   in a directory, leave out functions that can't be reached from Sys.init
+                  through call commands, and write a report of dropped functions and ROM 
+                  words saved to Xxx.dead.txt (the files are then translated serially)
+-t, --top-of-stack hold the value on top of the stack in D between commands, and only write 
+                  it to RAM when it's needed there
+-f, --fold        fold constant arithmetic, comparisons and logic, and remove identities such
+                  as push constant 0, add, in the VM commands before they're translated, and 
+                  report number of commands removed
+-s, --shared-compare jump to one shared routine for each of eq, gt and lt, instead of inlining
+                  the comparison each time it's used
+--no-cache        in a directory, translate every .vm file, instead of reusing translations 
+                  of files that haven't changed from the translation cache
+--cache-dir DIR   keep translation cache in DIR, instead of __vmcache__ in the Xxx directory
+--cache-size MB   evict least recently used translations when the cache is bigger than MB
+-a hack|bin, --assemble hack|bin  assemble in the same process, as the code is written, and 
+                  save machine code to Xxx.hack, or to Xxx.bin as packed 16-bit words, 
+                  instead of saving assembly code to Xxx.asm (comments are left out)
+-m, --source-map  write Xxx.map.json, which maps each ROM address to the .vm file, line number,
+                  function and index of the VM command it was translated from (files are then
+                  translated serially, without the cache, and it can't be used with -O)
 """
 
-import os, sys, ntpath 
+import os, ntpath, argparse
+import concurrent.futures
+from collections import Counter
 
-if os.getcwd().endswith('VMTranslator'):
-    from vm_translator import vm_parser
-    from vm_translator import code_writer
+#imported as part of a package, or run as a script from this directory
+if __package__:
+    from . import vm_parser
+    from . import code_writer
+    from . import peephole
+    from . import output_sink
+    from . import dead_code
+    from . import vm_optimizer
+    from . import translation_cache
+    from . import source_map
+    from . import hack_assembler
+    from . import machine_code
     
 else:
     import vm_parser
     import code_writer
+    import peephole
+    import output_sink
+    import dead_code
+    import vm_optimizer
+    import translation_cache
+    import source_map
+    import hack_assembler
+    import machine_code
     
 
-def translate_file(file, file_full_path, writer):
+def translate_file(file, file_full_path, writer, fold=False, stats=None):
     """
     Accepts name of virtual machine code file.
     Returns translation into assembly code, as a string. 
     """
     
-    fname = file.replace('.vm', '')
-    writer.set_file_name(fname)
-    file_parser = vm_parser.Parser(file_full_path)
+    translate_commands(file, vm_parser.read_commands(file_full_path), writer, fold=fold, stats=stats)
+
+def translate_source(name, lines, writer):
+    """
+    Accepts name of virtual machine code source, such as Xxx or Xxx.vm, and its code as 
+    an iterable of lines. Writes translation into assembly code with writer. 
+    """
+    
+    translate_commands(name, vm_parser.parse_lines(lines), writer)
+
+def translate_commands(name, commands, writer, fold=False, stats=None):
+    """
+    Accepts name of virtual machine code source, and its (command_type, args, line_no) 
+    records from vm_parser. Writes translation into assembly code with writer. 
+    
+    If fold=True, commands first go through the vm_optimizer pass, which updates stats, 
+    if it's a Counter.
+    """
+    
+    writer.set_file_name(name.replace('.vm', ''))
+    
+    if fold:
+        commands = vm_optimizer.fold_commands(commands, stats)
+    
+    for command_type, args, line_no in commands:
+        writer.write(command_type, args, line_no)
+
+def translate_dropped(dropped, fold=False, **options):
+    """
+    Accepts list of dropped functions from dead_code.eliminate(), and CodeWriter options.
+    Returns list of assembly code of each dropped function, to count the ROM words saved.
+    """
+    
+    output = output_sink.MemorySink()
+    writer = code_writer.CodeWriter(output, **options)
+    
+    dropped_code = []
+    for file, function_name, commands in dropped:
+        translate_commands(file, commands, writer, fold=fold)
+        dropped_code.append(output.take())
+        
+    writer.close()
+    return dropped_code
+
+def get_version():
+    """
+    Returns translator version, as a hash of the source code of the modules that translate, 
+    for translation_cache keys.
+    """
+    
+    return translation_cache.get_version([vm_parser, vm_optimizer, code_writer, code_writer.asm])
+
+def _parse(code):
+    """
+    Accepts virtual machine code as a string or an iterable of lines, and returns generator 
+    of its command records.
+    """
+    
+    if isinstance(code, str):
+        code = code.splitlines()
+        
+    return vm_parser.parse_lines(code)
+
+def translate_stream(sources, bootstrap=True, eliminate_dead=False, fold=False, stats=None, cache=None, 
+                     **options):
+    """
+    Generator that accepts a mapping of source names to virtual machine code, or an iterable 
+    of (name, code) pairs, and yields the translation into assembly code one piece at a time: 
+    bootstrap code, then each source's translation, in order. Code can be a string or an 
+    iterable of lines, such as an open file, so sources can be read lazily.
+    
+    Options are passed to CodeWriter, such as compact=True or top_of_stack=True.
+    
+    If bootstrap=False, no bootstrap code is written, as for a single .vm file. Shared 
+    routines, used with compact=True or shared_compare=True, are then yielded last.
+    
+    If eliminate_dead=True, functions that can't be reached from Sys.init are left out. 
+    This needs the whole program, so all sources are read before anything is yielded.
+    
+    If fold=True, constants are folded and identities removed in the VM commands, and 
+    stats, if it's a Counter, is updated with vm_optimizer statistics.
+    
+    If cache is a translation_cache.TranslationCache, each source's translation is taken from 
+    it if its code hasn't changed, and stored in it if it has. Sources that are iterables 
+    of lines are then read whole, to hash them. The cache isn't used with eliminate_dead=True, 
+    since which functions are left out depends on the whole program.
+    
+    If options has a source_map, a source_map.SourceMap, every source is translated, without 
+    the cache, so each piece of code is added to the map as it's written.
+    """
+    
+    if hasattr(sources, 'items'):
+        sources = sources.items()
+        
+    if options.get('source_map') is not None:
+        cache = None
+        
+    if eliminate_dead:
+        sources, dropped = dead_code.eliminate([(name, list(_parse(code))) for name, code in sources])
+        cache = None
+    
+    output = output_sink.MemorySink()
+    writer = code_writer.CodeWriter(output, **options)
+    
+    if bootstrap:
+        writer.write_init()
+        yield output.take()
+    
+    for name, code in sources:
+        if eliminate_dead:
+            translate_commands(name, code, writer, fold=fold, stats=stats)
+            yield output.take()
+            continue
+            
+        if cache is None:
+            translate_commands(name, _parse(code), writer, fold=fold, stats=stats)
+            yield output.take()
+            continue
+            
+        if not isinstance(code, str):
+            code = ''.join(code)
+            
+        key = cache.get_key(name, code, dict(options, fold=fold))
+        fragment = cache.get(key)
+        
+        if fragment is None:
+            file_stats = Counter()
+            translate_commands(name, _parse(code), writer, fold=fold, stats=file_stats)
+            fragment = output.take(), file_stats
+            
+            #a cache that can't be written to only means the source is translated again next time
+            try:
+                cache.put(key, *fragment)
+            except OSError:
+                pass
+            
+        code, file_stats = fragment
+        if stats is not None:
+            stats.update(file_stats)
+        yield code
+        
+    if not bootstrap and writer.write_routines():
+        yield output.take()
+        
+    writer.close()
+
+def translate(sources, bootstrap=True, optimize=False, eliminate_dead=False, fold=False, stats=None, cache=None, 
+              **options):
+    """
+    Accepts a mapping of source names to virtual machine code, or an iterable of (name, code) 
+    pairs, and returns translation into assembly code, as a string. Same as the command line, 
+    where a directory is translated with bootstrap code and a single .vm file without it. 
+    
+    If optimize=True, runs the peephole optimization pass, which leaves out comments.
+    If eliminate_dead=True, leaves out functions that can't be reached from Sys.init.
+    If fold=True, folds constants in VM commands, and updates stats if it's a Counter.
+    If cache is a translation_cache.TranslationCache, only sources that changed are translated.
+    Other options are passed to CodeWriter, such as compact=True or top_of_stack=True.
+    
+    source_map can't be used with optimize=True, as the peephole pass moves instructions.
+    """
+    
+    if optimize and options.get('source_map') is not None:
+        raise ValueError('source map is not valid after peephole optimization')
+    
+    code = ''.join(translate_stream(sources, bootstrap=bootstrap, eliminate_dead=eliminate_dead, 
+                                    fold=fold, stats=stats, cache=cache, **options))
+    
+    if optimize:
+        code, before, after = peephole.optimize(code)
+        
+    return code
+
+def build(sources, bootstrap=True, optimize=False, eliminate_dead=False, fold=False, stats=None, cache=None, 
+          **options):
+    """
+    Same as translate(), but returns machine code, as an array of unsigned 16-bit words. 
+    Each piece of code is assembled by machine_code.MachineCodeSink as it's translated, 
+    or by hack_assembler after the peephole pass if optimize=True. Comments are left out, 
+    unless options has comments=True, as nobody reads them.
+    """
+    
+    options.setdefault('comments', False)
+    
+    if optimize:
+        code = translate(sources, bootstrap=bootstrap, optimize=True, eliminate_dead=eliminate_dead, 
+                         fold=fold, stats=stats, cache=cache, **options)
+        words, symbols = hack_assembler.assemble(code)
+        return words
+    
+    sink = machine_code.MachineCodeSink()
+    for code in translate_stream(sources, bootstrap=bootstrap, eliminate_dead=eliminate_dead, fold=fold, 
+                                 stats=stats, cache=cache, **options):
+        sink.write(code)
+        
+    sink.close()
+    return sink.words
+        
+def translate_file_to_string(file, file_full_path, options, fold=False):
+    """
+    Accepts name of virtual machine code file, and dictionary of CodeWriter options.
+    Returns translation into assembly code, as a string, using a separate CodeWriter, 
+    and a Counter of vm_optimizer statistics, which is empty if fold=False. 
+    Since CodeWriter.set_file_name() resets labels and counters for each file, the 
+    translation is the same as it would be in a shared CodeWriter.
+    """
+    
+    output = output_sink.MemorySink()
+    writer = code_writer.CodeWriter(output, **options)
+    stats = Counter()
+    translate_file(file, file_full_path, writer, fold=fold, stats=stats)
+    code = output.getvalue()
+    writer.close()
+    return code, stats
+    
+def map_files_parallel(files, jobs=None, fold=False, **options):
+    """
+    Generator that accepts list of (file, file_full_path) tuples, translates each file in a pool 
+    of processes, and yields (code, stats) tuples from translate_file_to_string(), in the order 
+    of files, whatever order they finish in. jobs is number of processes, and None uses all cores. 
+    """
+    
+    names = [file for file, file_full_path in files]
+    paths = [file_full_path for file, file_full_path in files]
+    folds = [fold] * len(files)
+    options = [options] * len(files)
+    
+    jobs = jobs or os.cpu_count() or 1
+    chunksize = max(1, len(files) // (jobs * 4))
+    
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+        yield from executor.map(translate_file_to_string, names, paths, options, folds, chunksize=chunksize)
+    
+def translate_files_parallel(files, writer, jobs=None, fold=False, stats=None, **options):
+    """
+    Accepts list of (file, file_full_path) tuples and translates each file in a pool of processes. 
+    Translations are written by writer in the order of files, whatever order they finish in.
+    jobs is number of processes, and None uses all cores. If fold=True, each file goes through 
+    the vm_optimizer pass, and stats, if it's a Counter, is updated with statistics of all files. 
+    Other options are passed to each file's CodeWriter.
+    """
+    
+    for code, file_stats in map_files_parallel(files, jobs=jobs, fold=fold, **options):
+        writer.write_fragment(code)
+        if stats is not None:
+            stats.update(file_stats)
+
+def translate_files_cached(files, writer, cache, jobs=None, fold=False, stats=None, **options):
+    """
+    Accepts list of (file, file_full_path) tuples and translation_cache.TranslationCache, and 
+    writes translation of each file with writer, in order. Files that are in the cache aren't 
+    translated again, and the others are translated, serially, or in a pool of jobs processes 
+    if jobs isn't None, and stored in the cache. Least recently used fragments are evicted 
+    afterwards. fold, stats and other options are the same as for translate_files_parallel().
+    """
+    
+    keys = []
+    for file, file_full_path in files:
+        with open(file_full_path, 'rb') as f:
+            keys.append(cache.get_key(file, f.read(), dict(options, fold=fold)))
+            
+    fragments = [cache.get(key) for key in keys]
+    missing = [i for i, fragment in enumerate(fragments) if fragment is None]
+    to_translate = [files[i] for i in missing]
     
-    while file_parser.has_more_commands():
-        file_parser.advance()
-        command_type = file_parser.command_type()
-        args = file_parser.get_args()
-        writer.write(command_type, args)
+    if jobs is not None and to_translate:
+        translated = map_files_parallel(to_translate, jobs=jobs, fold=fold, **options)
+    else:
+        translated = (translate_file_to_string(file, file_full_path, options, fold=fold) 
+                      for file, file_full_path in to_translate)
+        
+    writable = True
+    for i, (code, file_stats) in zip(missing, translated):
+        fragments[i] = code, file_stats
+        if not writable:
+            continue
+            
+        try:
+            cache.put(keys[i], code, file_stats)
+        except OSError:
+            print('\nTranslation cache can\'t be written, translations are not stored')
+            writable = False
+        
+    for code, file_stats in fragments:
+        writer.write_fragment(code)
+        if stats is not None:
+            stats.update(file_stats)
+            
+    try:
+        cache.evict()
+    except OSError:
+        print('\nTranslation cache can\'t be evicted')
+ 
+def get_args(argv=None):
+    """
+    Parses command line arguments, from argv if it's given, or else from sys.argv.
+    """
+    
+    parser = argparse.ArgumentParser(description='Translates .vm files into Hack assembly code.')
+    parser.add_argument('to_translate', help='Xxx.vm file, or Xxx directory of .vm files')
+    parser.add_argument('-j', '--jobs', type=int, default=None, 
+                        help='translate files in a pool of JOBS processes (0 uses all cores)')
+    parser.add_argument('-O', '--optimize', action='store_true', 
+                        help='run peephole optimization pass and report ROM size')
+    parser.add_argument('-c', '--compact', action='store_true', 
+                        help='use shared call and return routines')
+    parser.add_argument('-n', '--no-comments', dest='comments', action='store_false', 
+                        help='leave out comments and cache push and pop snippets')
+    parser.add_argument('-d', '--dead-code', action='store_true', 
+                        help='drop functions unreachable from Sys.init and write report')
+    parser.add_argument('-t', '--top-of-stack', action='store_true', 
+                        help='hold top of stack in D register between commands')
+    parser.add_argument('-f', '--fold', action='store_true', 
+                        help='fold constants in VM commands and report commands removed')
+    parser.add_argument('-s', '--shared-compare', action='store_true', 
+                        help='use shared eq, gt and lt routines')
+    parser.add_argument('--no-cache', dest='cache', action='store_false', 
+                        help='translate every file, without the translation cache')
+    parser.add_argument('--cache-dir', default=None, 
+                        help='translation cache directory (default: __vmcache__ in Xxx directory)')
+    parser.add_argument('--cache-size', type=int, default=256, 
+                        help='maximum size of translation cache in MB (default: 256)')
+    parser.add_argument('-a', '--assemble', choices=['hack', 'bin'], default=None, 
+                        help='assemble in the same process and write Xxx.hack or Xxx.bin instead of Xxx.asm')
+    parser.add_argument('-m', '--source-map', action='store_true', 
+                        help='write source map of ROM addresses to VM commands to Xxx.map.json')
+    
+    args = parser.parse_args(argv)
+    if args.source_map and args.optimize:
+        parser.error('--source-map can not be used with --optimize, which moves instructions')
+        
+    return args
  
-def main():
+def main(argv=None):
     """
     Checks command argument to see if its a directory of virtual machine code files or just one file.
     Writes translated assembly code to one file, whether working with a directory of vm files or just one file.
     The translated file, with an .asm extension, is saved to the same directory where the vm file/s reside.
+    argv is a list of command line arguments, which defaults to sys.argv.
     """
 
+    args = get_args(argv)
+
     #get directory or file from arg and, if on Windows, convert to back slashes
-    print('\nUser input: \n\t' + sys.argv[1])
-    to_translate = sys.argv[1].strip()  
+    print('\nUser input: \n\t' + args.to_translate)
+    to_translate = args.to_translate.strip()  
     to_translate = os.path.abspath(to_translate) 
     
     #add trailing slash to last directory if it's missing
@@ -64,25 +443,126 @@ def main():
     fname = tail or ntpath.basename(path)
     
     to_write = os.path.join(path, fname.replace('.vm', '') + '.asm')      
-    writer = code_writer.CodeWriter(to_write)
+    
+    options = {'compact': args.compact, 'comments': args.comments, 'top_of_stack': args.top_of_stack, 
+               'shared_compare': args.shared_compare}
+    
+    #nobody reads the comments of code that's assembled in the same process
+    if args.assemble:
+        options['comments'] = False
+    
+    stats = Counter()
+    
+    #every command has to go through writer to be added to source map
+    mapping = None
+    if args.source_map:
+        mapping = source_map.SourceMap()
+        args.cache = False
+        args.jobs = None
+    
+    #when optimizing, translate into memory and save after optimization pass
+    if args.optimize:
+        output = output_sink.MemorySink()
+        writer = code_writer.CodeWriter(output, **options)
+    elif args.assemble:
+        output = machine_code.MachineCodeSink()
+        writer = code_writer.CodeWriter(output, source_map=mapping, **options)
+    else:
+        writer = code_writer.CodeWriter(to_write, source_map=mapping, **options)
     
     if os.path.isdir(to_translate):
         print('\nTranslating .vm files in directory: \n\t' + to_translate)
         print('\nTranslating to: \n\t' + to_write) 
         
         writer.write_init() 
+        
+        #a cache directory that can't be created, such as in a read-only tree, means no cache
+        cache = None
+        if args.cache and not args.dead_code:
+            cache_dir = args.cache_dir or os.path.join(to_translate, '__vmcache__')
+            try:
+                cache = translation_cache.TranslationCache(cache_dir, get_version(), 
+                                                           max_size=args.cache_size << 20)
+            except OSError:
+                print('\nTranslation cache can\'t be created, translating every file')
+        
+        vm_files = []
         for root, dirs, files in os.walk(to_translate):
             for file in files:
                 if file.endswith('.vm'):
-                    file_full_path = os.path.join(root, file)
-                    translate_file(file, file_full_path, writer)
+                    vm_files.append((file, os.path.join(root, file)))
+                    
+        if args.dead_code:
+            sources = [(file, list(vm_parser.read_commands(file_full_path))) for file, file_full_path in vm_files]
+            sources, dropped = dead_code.eliminate(sources)
+            
+            for file, commands in sources:
+                translate_commands(file, commands, writer, fold=args.fold, stats=stats)
+                
+            dropped_code = translate_dropped(dropped, fold=args.fold, **options)
+            report, saved = dead_code.format_report(sources, dropped, dropped_code)
+            to_report = to_write.replace('.asm', '.dead.txt')
+            with open(to_report, 'w') as f:
+                f.write(report)
+            print('\nDead functions: \n\t' + str(len(dropped)) + ' dropped, ' + str(saved) 
+                  + ' ROM words saved, report written to ' + to_report)
+        
+        elif cache is not None:
+            translate_files_cached(vm_files, writer, cache, jobs=args.jobs, fold=args.fold, stats=stats, 
+                                   **options)
+            print('\nTranslation cache: \n' + str(cache).rstrip('\n'))
+        
+        elif args.jobs is not None:
+            translate_files_parallel(vm_files, writer, jobs=args.jobs or None, fold=args.fold, stats=stats, 
+                                     **options)
+            
+        else:
+            for file, file_full_path in vm_files:
+                translate_file(file, file_full_path, writer, fold=args.fold, stats=stats)
         
     else:
         print('\nTranslating file: \n\t' + to_translate)
         print('\nTranslating to: \n\t' + to_write) 
-        translate_file(fname, to_translate, writer)
+        translate_file(fname, to_translate, writer, fold=args.fold, stats=stats)
+        
+        #no bootstrap code, so shared routines, if any, go at the end
+        writer.write_routines()
     
+    if args.fold:
+        removed = stats['before'] - stats['after']
+        print('\nVM commands: \n\t' + str(stats['before']) + ' before folding, ' + str(stats['after']) 
+              + ' after (' + str(removed) + ' removed, by ' + str(stats['folded']) + ' folds and ' 
+              + str(stats['simplified']) + ' identities)')
+    
+    #writes what's left to Xxx.asm, or allocates variables of machine code
     writer.close()
+    
+    if args.optimize:
+        code, before, after = peephole.optimize(output.getvalue())
+        if args.assemble:
+            words, symbols = hack_assembler.assemble(code)
+        else:
+            with open(to_write, 'w') as f:
+                f.write(code)
+        print('\nROM size: \n\t' + str(before) + ' words before optimization, ' 
+              + str(after) + ' words after (' + str(before - after) + ' saved)')
+        
+    elif args.assemble:
+        words = output.words
+        
+    if args.assemble:
+        to_assemble = to_write.replace('.asm', '.' + args.assemble)
+        if args.assemble == 'hack':
+            hack_assembler.write_hack(words, to_assemble)
+        else:
+            hack_assembler.write_binary(words, to_assemble)
+        print('\nMachine code: \n\t' + str(len(words)) + ' words, written to ' + to_assemble)
+        
+    if mapping is not None:
+        to_map = to_write.replace('.asm', '.map.json')
+        mapping.write(to_map)
+        print('\nSource map: \n\t' + str(mapping.size) + ' ROM addresses, written to ' + to_map)
+        
     print('\nTranslation completed')    
     
 
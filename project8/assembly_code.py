@@ -1,16 +1,21 @@
-# -*- coding: utf-8 -*- 
+# -*- coding: utf-8 -*-
 
 """
-Dictionaries and functions that map virtual-machine commands to assembly-code snippets. 
+Dictionaries and functions that map virtual-machine commands to assembly-code snippets.
+
+Snippets are written as templates, which are compiled once, at import, with white space removed
+and each {slot} turned into a positional field. Returning a snippet then only fills in the slots.
 """
 
+import re
+
 
 symbol_table = {
-    'local': 'LCL', 
+    'local': 'LCL',
     'constant': 'constant',
-    'argument': 'ARG', 
-    'this': 'THIS', 
-    'that': 'THAT', 
+    'argument': 'ARG',
+    'this': 'THIS',
+    'that': 'THAT',
     'temp': 'R5',
     'pointer': 'R3'
 }
@@ -24,39 +29,52 @@ math_table = {
     'lt': 'LT',
     'and': '&',
     'or': '|',
-    'not': '!'    
+    'not': '!'
 }
 
 non_pointer_segments = ['R0','R1','R2','R3','R4','R5','R6','R7','R8','R9','R10','R11','R12','R13','R14','R15']
 
-def pop_cmd(segment, index, static=False, note=''):
+#labels for shared call and return routines, which can't clash with labels of VM functions
+call_routine = 'VM$CALL'
+return_routine = 'VM$RETURN'
+compare_routines = {
+    'EQ': 'VM$EQ',
+    'GT': 'VM$GT',
+    'LT': 'VM$LT'
+}
+
+_SLOT_REGEX = re.compile(r'\{(\w+)\}')
+
+def compile_template(code, slots=None):
     """
-    Accepts memory segment and memory segment index,
-    and returns assembly code for pop command.
+    Accepts assembly code template, removes white space from it, and returns it as a tuple of
+    (text, slots, order). The text has a %s field for each {slot}, and slots are the slot names 
+    in the order fill() takes their values, which by default is order of first use. Order maps 
+    each field to its slot, or is None if fields and slots are in the same order. 
     """
+
+    code = code.replace(' ', '').replace('%', '%%')
+    names = _SLOT_REGEX.findall(code)
+    slots = tuple(slots or dict.fromkeys(names))
+    order = tuple(slots.index(name) for name in names)
     
-    code = ''
+    if order == tuple(range(len(slots))):
+        order = None
     
-    if static:
-        code += '''@{segment}.{index}
-        D=A    
-        '''.format(segment=segment, index=index)
-    
-    else: 
-        code += '''@{index}
-        D=A
-        @{segment}
-        '''.format(index=index, segment=segment)
-        
-        if segment in non_pointer_segments:
-            code += '''D=D+A
-            '''  
+    return _SLOT_REGEX.sub('%s', code), slots, order
 
-        else:
-            code += '''D=D+M
-            '''         
-        
-    code += '''@R13
+def fill(template, *values):
+    """
+    Accepts compiled template and slot values, in order of the template's slots, and returns assembly code.
+    """
+
+    text, slots, order = template
+    if order is None:
+        return text % values
+
+    return text % tuple([values[index] for index in order])
+
+_pop_tail = '''@R13
     M=D
     @SP
     M=M-1
@@ -64,245 +82,593 @@ def pop_cmd(segment, index, static=False, note=''):
     D=M
     @R13
     A=M
-    M=D'''    
-    
-    code = code.replace(' ','')    
-    code += '{note}'.format(note=note) 
-    if not note:
-        code += '\n'
-    
-    return code
-    
-def push_cmd(segment, index, static=False, note=''):
-    """
-    Accepts memory segment and memory segment index,
-    and returns assembly code for push command.    
-    """
-    
-    code = ''''''
-    
-    if static:
-        code += '''@{segment}.{index}
-        D=M
-        '''.format(segment=segment, index=index) 
-    
-    else:     
-        code += '''@{index}
+    M=D'''
+
+pop_templates = {
+    'static': compile_template('''@{segment}.{index}
         D=A
-        '''.format(index=index)
-        
-        if segment != 'constant':        
-            code += '''@{segment}
-            '''.format(segment=segment)  
-            
-            if segment in non_pointer_segments:
-                code += '''A=D+A
-                D=M
-                '''        
-    
-            else:
-                code += '''A=D+M
-                D=M
-                ''' 
-    
-    code += '''@SP
+        ''' + _pop_tail),
+    'non_pointer': compile_template('''@{index}
+        D=A
+        @{segment}
+        D=D+A
+        ''' + _pop_tail),
+    'pointer': compile_template('''@{index}
+        D=A
+        @{segment}
+        D=D+M
+        ''' + _pop_tail)
+}
+
+_push_tail = '''@SP
     A=M
     M=D
     @SP
     M=M+1'''
-    
-    code = code.replace(' ','')    
-    code += '{note}'.format(note=note) 
-    if not note:
-        code += '\n' 
 
-    return code
+push_templates = {
+    'static': compile_template('''@{segment}.{index}
+        D=M
+        ''' + _push_tail),
+    'constant': compile_template('''@{index}
+        D=A
+        ''' + _push_tail),
+    'negative_constant': compile_template('''@{index}
+        D=-A
+        ''' + _push_tail),
+    'non_pointer': compile_template('''@{index}
+        D=A
+        @{segment}
+        A=D+A
+        D=M
+        ''' + _push_tail),
+    'pointer': compile_template('''@{index}
+        D=A
+        @{segment}
+        A=D+M
+        D=M
+        ''' + _push_tail),
+    'd': compile_template(_push_tail)
+}
+
+math_templates = {
+    'unary': compile_template('''@SP
+        A=M-1
+        M={command}
+        '''),
+    'binary': compile_template('''@SP
+        M=M-1
+        A=M
+        D=M
+        A=A-1
+        M={command}
+        '''),
+    'logic': compile_template('''@SP
+        M=M-1
+        A=M
+        D=M
+        A=A-1
+        M=D{command}M
+        '''),
+    'compare': compile_template('''@SP
+        M=M-1
+        A=M
+        D=M
+        A=A-1
+        D=M-D
+        M=-1
+        @{jump}
+        D;J{command}
+        @SP
+        A=M-1
+        M=0
+        ({jump})
+        ''', ('command', 'jump'))
+}
+
+flow_templates = {
+    'label': compile_template('({label})\n'),
+    'goto': compile_template('@{label}\n'),
+    'goto_pointer': compile_template('@{label}\nA=M\n'),
+    'if-goto': compile_template('''@SP
+        M=M-1
+        A=M
+        D=M
+        @{label}
+        ''')
+}
+
+call_site_template = compile_template('''@{function_name}
+    D=A
+    @R13
+    M=D
+    @{num_args}
+    D=A
+    @R14
+    M=D
+    @{return_label}
+    D=A
+    @{call_routine}
+    0;JMP''')
+
+compare_site_templates = {
+    'stack': compile_template('''@{return_label}
+        D=A
+        @{routine}
+        0;JMP
+        ({return_label})
+        '''),
+    'top': compile_template('''@R13
+        M=D
+        @{return_label}
+        D=A
+        @{routine}
+        0;JMP
+        ({return_label})
+        ''')
+}
+
+compare_routine_templates = {
+    'stack': compile_template('''({routine})
+        @R15
+        M=D
+        @SP
+        AM=M-1
+        D=M
+        A=A-1
+        D=M-D
+        M=-1
+        @{routine}.TRUE
+        D;J{command}
+        @SP
+        A=M-1
+        M=0
+        ({routine}.TRUE)
+        @R15
+        A=M
+        0;JMP
+        ''', ('routine', 'command')),
+    'top': compile_template('''({routine})
+        @R15
+        M=D
+        @SP
+        AM=M-1
+        D=M
+        @R13
+        D=D-M
+        @{routine}.TRUE
+        D;J{command}
+        D=0
+        @R15
+        A=M
+        0;JMP
+        ({routine}.TRUE)
+        D=-1
+        @R15
+        A=M
+        0;JMP
+        ''', ('routine', 'command'))
+}
+
+assign_templates = {
+    'from': compile_template('''@{save_from}
+        D=M
+        '''),
+    'steps': compile_template('''@{frame_steps}
+        D=D{plus_or_minus}A
+        '''),
+    'to': compile_template('''@{save_to}
+        M=D'''),
+    'offset_steps': compile_template('''@{frame_steps}
+        D=D+A
+        '''),
+    'offset_to': compile_template('''@{save_from}
+        D=M-D
+        @{save_to}
+        M=D'''),
+    'pointer_from': compile_template('@{save_from}\n'),
+    'pointer_steps': compile_template('''D=M
+        @{frame_steps}
+        A=D{plus_or_minus}A
+        D=M
+        '''),
+    'pointer': compile_template('''
+        A=M
+        D=M
+        '''),
+    'value': compile_template('''@{save_from}
+        D=A
+        @{save_to}
+        M=D
+        ''')
+}
+
+def _end_note(code, note):
+    """
+    Adds note to end of code, or a newline if there is no note.
+    """
+
+    if note:
+        return code + note
+
+    return code + '\n'
+
+def _get_steps(frame_steps):
+    """
+    Accepts negative or positive number of frame steps, and returns them as a
+    string without sign, with '-' or '+'.
+    """
+
+    if frame_steps < 0:
+        return str(abs(frame_steps)), '-'
+
+    return str(frame_steps), '+'
+
+def pop_cmd(segment, index, static=False, note=''):
+    """
+    Accepts memory segment and memory segment index,
+    and returns assembly code for pop command.
+    """
+
+    if static:
+        code = fill(pop_templates['static'], segment, index)
+
+    elif segment in non_pointer_segments:
+        code = fill(pop_templates['non_pointer'], index, segment)
+
+    else:
+        code = fill(pop_templates['pointer'], index, segment)
+
+    return _end_note(code, note)
+
+def push_cmd(segment, index, static=False, note=''):
+    """
+    Accepts memory segment and memory segment index,
+    and returns assembly code for push command.
+    """
+
+    if static:
+        code = fill(push_templates['static'], segment, index)
+
+    elif segment == 'constant':
+        if index.startswith('-'):
+            code = fill(push_templates['negative_constant'], index[1:])
+        else:
+            code = fill(push_templates['constant'], index)
+
+    elif segment in non_pointer_segments:
+        code = fill(push_templates['non_pointer'], index, segment)
+
+    else:
+        code = fill(push_templates['pointer'], index, segment)
+
+    return _end_note(code, note)
+
+def push_d_cmd(note=''):
+    """
+    Returns assembly code that pushes value in D onto stack.
+    """
+
+    code = fill(push_templates['d'])
+    return _end_note(code, note)
+
+def call_site_cmd(function_name, num_args, return_label, note=''):
+    """
+    Accepts function name, number of args and return-address label, and returns assembly code
+    that passes them to shared call routine in R13, R14 and D, and jumps to routine.
+    """
+
+    code = fill(call_site_template, function_name, num_args, return_label, call_routine)
+    return _end_note(code, note)
+
+def compare_site_cmd(command, return_label, top=False):
+    """
+    Accepts comparison command string, EQ, GT or LT, and return-address label, and returns 
+    assembly code that jumps to shared comparison routine, with return address in D. 
+    If top=True, top of the stack is held in D, so it's passed in R13 instead, and the 
+    routine leaves result in D.
+    """
+
+    template = compare_site_templates['top' if top else 'stack']
+    return fill(template, return_label, compare_routines[command])
+
+def compare_routine_cmd(command, top=False):
+    """
+    Accepts comparison command string, EQ, GT or LT, and returns assembly code for shared 
+    routine that compares the two values on top of the stack, and jumps back to return 
+    address in D. If top=True, y is in R13 instead of on the stack, and result is left in D. 
+    """
+
+    template = compare_routine_templates['top' if top else 'stack']
+    return fill(template, compare_routines[command], command)
 
 def math_cmd(command):
     """
-    Accepts math command string and returns assembly code for math operation, 
+    Accepts math command string and returns assembly code for math operation,
     and returns assembly code:
     - command = D+M, M-D or -M
     - command string = add, sub or neg
     """
-    
+
     if command == '-M':
-        code = '''@SP
-        A=M-1
-        M=-M
-        '''    
-    else:
-        code = '''@SP
-        M=M-1
-        A=M
-        D=M
-        A=A-1
-        M={command}
-        '''.format(command=command)
-    
-    return code.replace(' ','')    
-    
+        return fill(math_templates['unary'], command)
+
+    return fill(math_templates['binary'], command)
+
 def compare_cmd(command, jump):
     """
-    Accepts two string arguments and returns assembly code for comparison operation, 
+    Accepts two string arguments and returns assembly code for comparison operation,
     and returns assembly code:
     - command = EQ, GT or LT
     - command string = eq, gt or lt
-    - jump label includes incremented number each time a jump is used by CodeWriter instance    
+    - jump label includes incremented number each time a jump is used by CodeWriter instance
     """
-    
-    code = '''@SP
-    M=M-1
-    A=M
-    D=M
-    A=A-1
-    D=M-D
-    M=-1
-    @{jump}
-    D;J{command}
-    @SP
-    A=M-1
-    M=0
-    ({jump})
-    '''.format(command=command,   
-               jump=jump)
-               
-    return code.replace(' ','')
-    
+
+    return fill(math_templates['compare'], command, jump)
+
 def logic_cmd(command):
     """
-    Accepts logic command string and returns assembly code for logical operation, 
+    Accepts logic command string and returns assembly code for logical operation,
     and returns assembly code:
     - command = &, |, !
-    - command string = and, or, not 
+    - command string = and, or, not
     """
-    
+
     if command == '!':
-        code = '''@SP
-        A=M-1
-        M=!M
-        '''    
-    else:
-        code = '''@SP
-        M=M-1
-        A=M
-        D=M
-        A=A-1
-        M=D{command}M
-        '''.format(command=command)
-    
-    return code.replace(' ','')  
-    
+        return fill(math_templates['unary'], '!M')
+
+    return fill(math_templates['logic'], command)
+
 def flow_cmd(command, label, note=''):
     """
     Accepts program flow command string and returns assembly code.
-    Program flow commands can be: label, goto or if-goto     
+    Program flow commands can be: label, goto or if-goto
     """
-    
+
     if command == 'label':
-        code = '({label})\n'.format(label=label)
+        return fill(flow_templates['label'], label)
 
     elif command == 'goto':
-        code = '@{label}\n'.format(label=label)  
-        
+
         #if label points to a temp variable, make it a pointer
         if label in ['R13','R14','R15']:
-            code += 'A=M\n'
-        
-        code += '0;JMP{note}\n'.format(note=note)  
+            code = fill(flow_templates['goto_pointer'], label)
+
+        else:
+            code = fill(flow_templates['goto'], label)
+
+        return code + '0;JMP' + note + '\n'
+
+    elif command == 'if-goto':
+        code = fill(flow_templates['if-goto'], label)
+        return code + 'D;JNE' + note + '\n'
 
-    elif command == 'if-goto': 
-        code = '''@SP
-        M=M-1
-        A=M
-        D=M
-        '''        
-        
-        code = code.replace(' ','')        
-        code += '@{label}\n'.format(label=label) 
-        code += 'D;JNE{note}\n'.format(note=note)          
-    
-    return code 
-    
 def assign_cmd(save_to, save_from, frame_steps=None, note=''):
     """
     Assigns value from one RAM location to another.
-    Frame_steps are number of negative or positive steps away from save_from      
+    Frame_steps are number of negative or positive steps away from save_from
     """
-    
-    code = '''@{save_from}
-    D=M
-    '''.format(save_from=save_from)
-    
+
+    code = fill(assign_templates['from'], save_from)
+
     if frame_steps:
-        if frame_steps < 0:
-            plus_or_minus = '-'
-            frame_steps = abs(frame_steps)
-        else:
-            plus_or_minus = '+'  
-            
-        frame_steps = str(frame_steps)   
+        frame_steps, plus_or_minus = _get_steps(frame_steps)
+        code += fill(assign_templates['steps'], frame_steps, plus_or_minus)
+
+    code += fill(assign_templates['to'], save_to)
+    return code + note
+
+def assign_offset_cmd(save_to, save_from, offset_from, frame_steps=0, note=''):
+    """
+    Assigns value from one RAM location, minus value in another RAM location, to a third RAM location.
+    Frame_steps are number of further negative steps away from save_from
+    """
+
+    code = fill(assign_templates['from'], offset_from)
+
+    if frame_steps:
+        code += fill(assign_templates['offset_steps'], str(frame_steps))
+
+    code += fill(assign_templates['offset_to'], save_from, save_to)
+    return code + note
 
-        code += '''@{frame_steps}
-        D=D{plus_or_minus}A
-        '''.format(frame_steps=frame_steps, plus_or_minus=plus_or_minus)             
-    
-    code += '''@{save_to}
-    M=D'''.format(save_to=save_to)    
-    
-    code = code.replace(' ','')     
-    code += '{note}'.format(note=note)       
-    
-    return code    
-    
 def assign_pointer_cmd(save_to, save_from, frame_steps=None, note=''):
     """
     Assigns value from pointer to RAM location to another RAM location.
-    Frame_steps are number of negative or positive steps away from save_from     
+    Frame_steps are number of negative or positive steps away from save_from
     """
-    
-    code = '@{save_from}\n'.format(save_from=save_from)
-    
+
+    code = fill(assign_templates['pointer_from'], save_from)
+
     if frame_steps:
-        if frame_steps < 0:
-            plus_or_minus = '-'
-            frame_steps = abs(frame_steps)
-        else:
-            plus_or_minus = '+'  
-            
-        frame_steps = str(frame_steps)
-        
-        code += '''D=M
-        @{frame_steps}
-        A=D{plus_or_minus}A
-        D=M
-        '''.format(frame_steps=frame_steps, plus_or_minus=plus_or_minus) 
-        
+        frame_steps, plus_or_minus = _get_steps(frame_steps)
+        code += fill(assign_templates['pointer_steps'], frame_steps, plus_or_minus)
+
     else:
-        code += '''
-        A=M
+        code += fill(assign_templates['pointer'])
+
+    code += fill(assign_templates['to'], save_to)
+    return code + note
+
+def assign_value_cmd(save_to, save_from, note=''):
+    """
+    Assigns value to RAM location.
+    """
+
+    code = fill(assign_templates['value'], save_from, save_to)
+    return code + note
+
+#templates for top-of-stack caching, where the value on top of the stack can be held in D 
+#instead of in RAM. SP then points to where the value in D goes when it's spilled to RAM. 
+top_templates = {
+    'spill': compile_template('''@SP
+        AM=M+1
+        A=A-1
+        M=D
+        '''),
+    'fill': compile_template('''@SP
+        AM=M-1
         D=M
-        '''            
-    
-    code += '''@{save_to}
-    M=D'''.format(save_to=save_to) 
-    
-    code = code.replace(' ','')     
-    code += '{note}'.format(note=note)       
-    
-    return code     
-    
-def assign_value_cmd(save_to, save_from, note=''):    
+        '''),
+    'push_static': compile_template('''@{segment}.{index}
+        D=M'''),
+    'push_register': compile_template('''@{register}
+        D=M'''),
+    'push_constant': compile_template('''@{index}
+        D=A'''),
+    'push_negative_constant': compile_template('''@{index}
+        D=-A'''),
+    'push_pointer': compile_template('''@{index}
+        D=A
+        @{segment}
+        A=D+M
+        D=M'''),
+    'push_steps': compile_template('''@{segment}
+        A=M
+        {steps}D=M'''),
+    'pop_static': compile_template('''@{segment}.{index}
+        M=D'''),
+    'pop_register': compile_template('''@{register}
+        M=D'''),
+    #keeps value in R13, and adds it to address so that A=D-M gets address back and M=D-A value
+    'pop_pointer': compile_template('''@R13
+        M=D
+        @{index}
+        D=A
+        @{segment}
+        D=D+M
+        @R13
+        D=D+M
+        A=D-M
+        M=D-A'''),
+    'pop_steps': compile_template('''@{segment}
+        A=M
+        {steps}M=D'''),
+    'unary': compile_template('D={command}\n'),
+    'binary': compile_template('''@SP
+        AM=M-1
+        D={command}
+        '''),
+    'compare': compile_template('''@SP
+        AM=M-1
+        D=M-D
+        @{jump}
+        D;J{command}
+        D=0
+        @{jump}.END
+        0;JMP
+        ({jump})
+        D=-1
+        ({jump}.END)
+        ''', ('command', 'jump')),
+    'if-goto': compile_template('''@{label}
+        D;JNE''')
+}
+
+#highest index that's cheaper to reach with repeated A=A+1 than with the general 
+#push and pop templates, when the top of the stack is in D
+max_push_steps = 1
+max_pop_steps = 6
+
+def _get_register(segment, index):
     """
-    Assigns value to RAM location.   
-    """    
-    code = '''@{save_from}
-    D=A
-    @{save_to}
-    M=D
-    '''.format(save_from=save_from, save_to=save_to)            
-   
-    code = code.replace(' ','')     
-    code += '{note}'.format(note=note)       
-    
-    return code     
\ No newline at end of file
+    Accepts temp or pointer segment base register, such as R5, and index, 
+    and returns register they address, such as R7.
+    """
+
+    return 'R' + str(int(segment[1:]) + int(index))
+
+def spill_cmd():
+    """
+    Returns assembly code that writes value on top of the stack from D to RAM.
+    """
+
+    return fill(top_templates['spill'])
+
+def fill_cmd():
+    """
+    Returns assembly code that pops value on top of the stack from RAM into D.
+    """
+
+    return fill(top_templates['fill'])
+
+def top_push_cmd(segment, index, static=False, note=''):
+    """
+    Accepts memory segment and memory segment index, and returns assembly code 
+    for push command that loads the value into D, as the new top of the stack. 
+    Value that was on top before has to be spilled first.
+    """
+
+    if static:
+        code = fill(top_templates['push_static'], segment, index)
+
+    elif segment == 'constant':
+        if index in ['0', '1', '-1']:
+            code = 'D=' + index
+        elif index.startswith('-'):
+            code = fill(top_templates['push_negative_constant'], index[1:])
+        else:
+            code = fill(top_templates['push_constant'], index)
+
+    elif segment in non_pointer_segments:
+        code = fill(top_templates['push_register'], _get_register(segment, index))
+
+    elif int(index) <= max_push_steps:
+        code = fill(top_templates['push_steps'], segment, 'A=A+1\n' * int(index))
+
+    else:
+        code = fill(top_templates['push_pointer'], index, segment)
+
+    return _end_note(code, note)
+
+def top_pop_cmd(segment, index, static=False, note=''):
+    """
+    Accepts memory segment and memory segment index, and returns assembly code 
+    for pop command that stores the value on top of the stack from D. 
+    Value has to be filled into D first.
+    """
+
+    if static:
+        code = fill(top_templates['pop_static'], segment, index)
+
+    elif segment in non_pointer_segments:
+        code = fill(top_templates['pop_register'], _get_register(segment, index))
+
+    elif int(index) <= max_pop_steps:
+        code = fill(top_templates['pop_steps'], segment, 'A=A+1\n' * int(index))
+
+    else:
+        code = fill(top_templates['pop_pointer'], index, segment)
+
+    return _end_note(code, note)
+
+def top_math_cmd(command):
+    """
+    Accepts math or logic command string from math_table, and returns assembly code that 
+    applies it to value on top of the stack in D, and leaves result in D:
+    - command = D+M, M-D, -M, &, |, !
+    """
+
+    if command in ['-M', '!']:
+        return fill(top_templates['unary'], command[0] + 'D')
+
+    if command in ['&', '|']:
+        command = 'D' + command + 'M'
+
+    return fill(top_templates['binary'], command)
+
+def top_compare_cmd(command, jump):
+    """
+    Accepts comparison command string and jump label, like compare_cmd(), and returns 
+    assembly code that compares with value on top of the stack in D, and leaves result in D.
+    """
+
+    return fill(top_templates['compare'], command, jump)
+
+def top_if_cmd(label, note=''):
+    """
+    Returns assembly code for if-goto command, which jumps if value on top of the stack in D 
+    isn't zero. Value has to be filled into D first.
+    """
+
+    return fill(top_templates['if-goto'], label) + note + '\n'
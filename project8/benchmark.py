@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+
+"""
+Benchmarks for the VM Translator.
+
+FROM vm_translator DIRECTORY:
+-prompt> python benchmark.py calls Xxx
+-prompt> python benchmark.py commands Xxx
+-prompt> python benchmark.py compare Xxx
+
+Where Xxx is a directory of .vm files, such as ../project9 for the Pong sources.
+
+calls: compares inline call and return sequences with shared call and return routines (--compact).
+Reports ROM size, with and without the peephole pass, and cycles for each call and return.
+Call and return sequences have no branches, so their cycles are the number of instructions run.
+
+commands: measures how many VM commands per second CodeWriter translates, with comments, and
+without comments, which turns on the push and pop snippet cache. The .vm files are read and 
+parsed first, so only code generation is timed.
+
+compare: compares inline eq, gt and lt with shared comparison routines (--shared-compare), with
+and without top-of-stack caching. Reports ROM size, with and without the peephole pass, and 
+cycles for each comparison, when it's true and when it's false. Cycles are counted by following 
+the jumps of the comparison, and the routine it jumps to, through the assembly code.
+"""
+
+import os, argparse, time
+
+#imported as part of a package, or run as a script from this directory
+if __package__:
+    from . import VMTranslator
+    from . import code_writer
+    from . import peephole
+    from . import assembly_code as asm
+    from . import output_sink
+
+else:
+    import VMTranslator
+    import code_writer
+    import peephole
+    import assembly_code as asm
+    import output_sink
+
+
+def translate_directory(directory, **options):
+    """
+    Accepts directory of .vm files and CodeWriter options, and returns translation, 
+    with bootstrap code, as a string.
+    """
+
+    output = output_sink.MemorySink()
+    writer = code_writer.CodeWriter(output, **options)
+    writer.write_init()
+
+    for root, dirs, files in os.walk(directory):
+        for file in files:
+            if file.endswith('.vm'):
+                VMTranslator.translate_file(file, os.path.join(root, file), writer)
+
+    return output.getvalue()
+
+def count_rom(code):
+    """
+    Returns number of ROM words in assembly code.
+    """
+
+    return peephole.count_instructions(peephole.get_instructions(code))
+
+def count_commands(directory, command):
+    """
+    Returns number of times a VM command is used in a directory of .vm files.
+    """
+
+    count = 0
+    for root, dirs, files in os.walk(directory):
+        for file in files:
+            if file.endswith('.vm'):
+                with open(os.path.join(root, file)) as f:
+                    count += sum(1 for line in f if line.split()[:1] == [command])
+
+    return count
+
+def get_call_cycles(compact=False):
+    """
+    Returns number of cycles for one call and for one return. In compact mode, this
+    includes the jump to the shared routine and the routine itself.
+    """
+
+    writer = code_writer.CodeWriter(output_sink.MemorySink(), compact=compact)
+    call_cycles = count_rom(writer.write_call('call', 'Foo.bar', '2'))
+    return_cycles = count_rom(writer.write_return('return'))
+
+    if compact:
+        routines = peephole.get_instructions(writer.write_routines())
+        return_start = routines.index('(' + asm.return_routine + ')')
+        call_cycles += peephole.count_instructions(routines[:return_start])
+        return_cycles += peephole.count_instructions(routines[return_start:])
+
+    writer.close()
+    return call_cycles, return_cycles
+
+def count_path(instructions, taken):
+    """
+    Follows list of instructions and labels from the start, and returns number of instructions 
+    run. Conditional jumps are taken if taken=True, and jumps to labels in the list are followed. 
+    Ends at the end of the list, or at a jump that leaves it, such as a return through a register.
+    """
+
+    labels = {instruction[1:-1]: i for i, instruction in enumerate(instructions) 
+              if instruction.startswith('(')}
+    cycles = 0
+    i = 0
+
+    while i < len(instructions):
+        instruction = instructions[i]
+        i += 1
+        if instruction.startswith('('):
+            continue
+
+        cycles += 1
+        if ';J' in instruction and (taken or instruction == '0;JMP'):
+            target = instructions[i-2][1:]
+            if target not in labels:
+                break
+            i = labels[target]
+
+    return cycles
+
+def get_compare_cycles(**options):
+    """
+    Returns number of cycles for one gt when it's true, and when it's false, including 
+    the shared routine, if there is one.
+    """
+
+    writer = code_writer.CodeWriter(output_sink.MemorySink(), **options)
+    code = writer.write_arithmetic('gt') + writer.write_routines()
+    writer.close()
+
+    instructions = peephole.get_instructions(code)
+    return count_path(instructions, True), count_path(instructions, False)
+
+def benchmark_compare(directory):
+    """
+    Prints ROM size and comparison cycles, for inline and shared comparisons.
+    """
+
+    num_compares = sum(count_commands(directory, command) for command in ['eq', 'gt', 'lt'])
+
+    print('\nDirectory: \n\t' + os.path.abspath(directory))
+    print('\nComparisons: ' + str(num_compares))
+    print('\n{:<12}{:>12}{:>14}{:>14}{:>15}'.format('mode', 'ROM words', 'ROM words -O',
+                                                    'true cycles', 'false cycles'))
+
+    for mode, options in [('inline', {}), ('shared', {'shared_compare': True}),
+                          ('inline -t', {'top_of_stack': True}),
+                          ('shared -t', {'shared_compare': True, 'top_of_stack': True})]:
+        code = translate_directory(directory, **options)
+        rom = count_rom(code)
+        code, before, rom_optimized = peephole.optimize(code)
+        true_cycles, false_cycles = get_compare_cycles(**options)
+
+        print('{:<12}{:>12}{:>14}{:>14}{:>15}'.format(mode, rom, rom_optimized,
+                                                      true_cycles, false_cycles))
+
+def benchmark_calls(directory):
+    """
+    Prints ROM size and call and return cycles, for inline and compact modes.
+    """
+
+    num_calls = count_commands(directory, 'call')
+    num_returns = count_commands(directory, 'return')
+
+    print('\nDirectory: \n\t' + os.path.abspath(directory))
+    print('\nCall sites: ' + str(num_calls) + ', return sites: ' + str(num_returns))
+    print('\n{:<10}{:>12}{:>14}{:>14}{:>16}'.format('mode', 'ROM words', 'ROM words -O',
+                                                    'call cycles', 'return cycles'))
+
+    for mode, compact in [('inline', False), ('compact', True)]:
+        code = translate_directory(directory, compact=compact)
+        rom = count_rom(code)
+        code, before, rom_optimized = peephole.optimize(code)
+        call_cycles, return_cycles = get_call_cycles(compact=compact)
+
+        print('{:<10}{:>12}{:>14}{:>14}{:>16}'.format(mode, rom, rom_optimized,
+                                                      call_cycles, return_cycles))
+
+def read_directory(directory):
+    """
+    Accepts directory of .vm files and returns list of (file, commands) tuples, where commands 
+    is a list of (command_type, args) tuples. 
+    """
+    
+    parsed = []
+    for root, dirs, files in os.walk(directory):
+        for file in files:
+            if file.endswith('.vm'):
+                records = VMTranslator.vm_parser.read_commands(os.path.join(root, file))
+                commands = [(command_type, args) for command_type, args, line_no in records]
+                parsed.append((file.replace('.vm', ''), commands))
+                
+    return parsed
+
+def time_commands(parsed, repeat=20, **options):
+    """
+    Accepts list of (file, commands) tuples from read_directory(), and CodeWriter options.
+    Returns best time of repeat runs, and last CodeWriter, which is closed.
+    """
+    
+    best = None
+    
+    for run in range(repeat):
+        writer = code_writer.CodeWriter(output_sink.MemorySink(), **options)
+        start = time.perf_counter()
+        
+        for file, commands in parsed:
+            writer.set_file_name(file)
+            for command_type, args in commands:
+                writer.write(command_type, args)
+                
+        elapsed = time.perf_counter() - start
+        writer.close()
+        if best is None or elapsed < best:
+            best = elapsed
+            
+    return best, writer
+    
+def benchmark_commands(directory, repeat=20):
+    """
+    Prints number of VM commands per second that CodeWriter translates. Best of repeat runs.
+    """
+    
+    parsed = read_directory(directory)
+    num_commands = sum(len(commands) for file, commands in parsed)
+            
+    print('\nDirectory: \n\t' + os.path.abspath(directory))
+    print('\nCommands: ' + str(num_commands) + ', best of ' + str(repeat) + ' runs') 
+    
+    for mode, comments in [('comments', True), ('no comments', False)]:
+        best, writer = time_commands(parsed, repeat=repeat, comments=comments)
+        print('\n' + mode + ': ' + '{:.4f}'.format(best) + ' s, ' 
+              + '{:,.0f}'.format(num_commands / best) + ' commands per second')
+        print(writer)
+            
+def main():
+    """
+    Runs benchmark named in command line arguments.
+    """
+
+    parser = argparse.ArgumentParser(description='Benchmarks for the VM Translator.')
+    parser.add_argument('benchmark', choices=['calls', 'commands', 'compare'], help='benchmark to run')
+    parser.add_argument('directory', help='directory of .vm files')
+    args = parser.parse_args()
+
+    if args.benchmark == 'calls':
+        benchmark_calls(args.directory)
+        
+    elif args.benchmark == 'commands':
+        benchmark_commands(args.directory)
+        
+    elif args.benchmark == 'compare':
+        benchmark_compare(args.directory)
+
+if __name__ == '__main__':
+    main()
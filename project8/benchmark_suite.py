@@ -0,0 +1,334 @@
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark suite for the VM Translators of project7 and project8, with results saved as JSON,
+so they can be compared between commits.
+
+FROM vm_translator DIRECTORY:
+-prompt> python benchmark_suite.py
+-prompt> python benchmark_suite.py --sizes 10000 100000 --json results.json
+-prompt> python benchmark_suite.py --os Xxx
+
+Corpora:
+- project9: the Pong .vm files in ../project9
+- os: the OS in ../project12, compiled to .vm by ../project11/JackCompiler.py. Files that
+  don't compile are skipped, and listed in the results. --os Xxx uses a directory of
+  already compiled OS .vm files instead.
+- synthetic-N: generated VM programs of N commands, in files of up to 10,000 commands,
+  with functions, calls, branches, and push, pop and arithmetic over all segments.
+  The same seed always generates the same programs.
+
+Each translator is run as a script, in a new process, on a copy of each corpus, so its start-up
+is included in wall time. project7 is run on each .vm file, one process each, and its times are
+added, as it only finds the files of a directory on Windows. For each run, the suite reports
+wall time, peak memory (maximum resident set size of the process), VM commands per second and
+number of instructions in the translation. project7 only translates push, pop and arithmetic
+commands, and skips all others, but commands per second is always for all commands in the
+corpus.
+"""
+
+import os, sys, json, time, random, shutil, argparse, platform, subprocess, tempfile
+
+#imported as part of a package, or run as a script from this directory
+if __package__:
+    from . import peephole
+    from . import vm_parser
+
+else:
+    import peephole
+    import vm_parser
+
+
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+#name, translator directory, command line options of each translator configuration, and
+#whether it's run on each .vm file, as project7 builds directory paths with Windows separators
+translators = [
+    ('project7', os.path.join(root_dir, 'project7'), [], True),
+    ('project8', os.path.join(root_dir, 'project8'), ['--no-cache'], False),
+    ('project8 -O -t -f', os.path.join(root_dir, 'project8'), ['--no-cache', '-O', '-t', '-f'], False)
+]
+
+default_sizes = [10000, 100000, 1000000]
+
+#most commands in each synthetic .vm file
+commands_per_file = 10000
+
+#commands in the body of each synthetic function, not counting function, last label and return
+commands_per_function = 50
+
+
+def count_commands(directory):
+    """
+    Returns number of VM commands in all .vm files of a directory.
+    """
+
+    count = 0
+    for file in os.listdir(directory):
+        if file.endswith('.vm'):
+            count += sum(1 for record in vm_parser.read_commands(os.path.join(directory, file)))
+
+    return count
+
+def copy_vm_files(source_dir, directory):
+    """
+    Copies .vm files from source directory, and not its subdirectories, to directory.
+    """
+
+    for file in os.listdir(source_dir):
+        if file.endswith('.vm'):
+            shutil.copy(os.path.join(source_dir, file), directory)
+
+def compile_os(directory):
+    """
+    Compiles OS .jack files of project12 into directory, one file at a time, with project11
+    JackCompiler. Returns list of files that didn't compile, which are left out.
+    """
+
+    compiler_dir = os.path.join(root_dir, 'project11')
+    skipped = []
+
+    for file in sorted(os.listdir(os.path.join(root_dir, 'project12'))):
+        if not file.endswith('.jack'):
+            continue
+
+        jack_file = os.path.join(directory, file)
+        shutil.copy(os.path.join(root_dir, 'project12', file), jack_file)
+        result = subprocess.run([sys.executable, 'JackCompiler.py', jack_file], cwd=compiler_dir,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        os.remove(jack_file)
+
+        if result.returncode:
+            skipped.append(file)
+            vm_file = jack_file.replace('.jack', '.vm')
+            if os.path.exists(vm_file):
+                os.remove(vm_file)
+
+    return skipped
+
+def _write_function(f, rng, class_name, index, functions):
+    """
+    Writes one synthetic function, of commands_per_function commands and 4 more.
+    """
+
+    num_locals = rng.randint(0, 4)
+    f.write('function ' + class_name + '.f' + str(index) + ' ' + str(num_locals) + '\n')
+    labels = 0
+
+    for count in range(commands_per_function):
+        choice = rng.random()
+
+        if choice < 0.35:
+            segment = rng.choice(['constant', 'constant', 'local', 'argument', 'static',
+                                  'this', 'that', 'temp', 'pointer'])
+            index_limit = {'temp': 7, 'pointer': 1, 'constant': 32767}.get(segment, 9)
+            f.write('push ' + segment + ' ' + str(rng.randint(0, index_limit)) + '\n')
+
+        elif choice < 0.55:
+            segment = rng.choice(['local', 'argument', 'static', 'this', 'that', 'temp'])
+            index_limit = 7 if segment == 'temp' else 9
+            f.write('pop ' + segment + ' ' + str(rng.randint(0, index_limit)) + '\n')
+
+        elif choice < 0.85:
+            f.write(rng.choice(['add', 'sub', 'neg', 'eq', 'gt', 'lt', 'and', 'or', 'not']) + '\n')
+
+        elif choice < 0.9:
+            labels += 1
+            f.write('label L' + str(labels) + '\n')
+
+        elif choice < 0.95:
+            f.write(rng.choice(['goto', 'if-goto']) + ' L' + str(rng.randint(1, labels + 1)) + '\n')
+
+        else:
+            f.write('call ' + rng.choice(functions) + ' ' + str(rng.randint(0, 3)) + '\n')
+
+    #goto and if-goto can jump to the label after the last one, so it has to exist
+    f.write('label L' + str(labels + 1) + '\n')
+    f.write('push constant 0\nreturn\n')
+
+def write_synthetic(directory, num_commands, seed=0):
+    """
+    Writes synthetic VM program of about num_commands commands into directory, as
+    .vm files of up to commands_per_file commands each, and a Sys.vm with Sys.init.
+    """
+
+    rng = random.Random(seed)
+    num_files = max(1, num_commands // commands_per_file)
+    per_file = num_commands // num_files
+    functions_per_file = max(1, per_file // (commands_per_function + 4))
+    functions = ['Synth' + str(file) + '.f' + str(index)
+                 for file in range(num_files) for index in range(functions_per_file)]
+
+    with open(os.path.join(directory, 'Sys.vm'), 'w') as f:
+        f.write('// synthetic benchmark program\n')
+        f.write('function Sys.init 0\ncall ' + functions[0] + ' 0\nlabel END\ngoto END\n')
+
+    for file in range(num_files):
+        class_name = 'Synth' + str(file)
+        with open(os.path.join(directory, class_name + '.vm'), 'w') as f:
+            f.write('// synthetic benchmark program, seed ' + str(seed) + '\n')
+            for index in range(functions_per_file):
+                _write_function(f, rng, class_name, index, functions)
+
+def get_corpora(work_dir, sizes, os_dir=None, seed=0):
+    """
+    Writes each corpus into its own directory in work_dir, and returns list of
+    (name, directory, skipped) tuples, where skipped is list of files left out.
+    """
+
+    corpora = []
+
+    directory = os.path.join(work_dir, 'project9')
+    os.mkdir(directory)
+    copy_vm_files(os.path.join(root_dir, 'project9'), directory)
+    corpora.append(('project9', directory, []))
+
+    directory = os.path.join(work_dir, 'os')
+    os.mkdir(directory)
+    if os_dir:
+        copy_vm_files(os_dir, directory)
+        skipped = []
+    else:
+        skipped = compile_os(directory)
+    corpora.append(('os', directory, skipped))
+
+    for size in sizes:
+        name = 'synthetic-' + str(size)
+        directory = os.path.join(work_dir, name)
+        os.mkdir(directory)
+        write_synthetic(directory, size, seed=seed)
+        corpora.append((name, directory, []))
+
+    return corpora
+
+def _run_process(translator_dir, options, to_translate):
+    """
+    Runs VMTranslator.py of translator_dir on a .vm file or directory, in a new process.
+    Returns (wall time in seconds, peak memory in KB).
+    """
+
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, 'VMTranslator.py', to_translate] + options,
+                               cwd=translator_dir, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    pid, status, usage = os.wait4(process.pid, 0)
+    wall_time = time.perf_counter() - start
+    error = process.stderr.read().decode(errors='replace')
+    process.stderr.close()
+
+    if status:
+        raise RuntimeError('translator failed: ' + error.strip().split('\n')[-1])
+
+    #ru_maxrss is in bytes on macOS, and in KB everywhere else
+    peak_memory = usage.ru_maxrss // 1024 if sys.platform == 'darwin' else usage.ru_maxrss
+    return wall_time, peak_memory
+
+def run_translator(translator_dir, options, directory, per_file=False):
+    """
+    Runs VMTranslator.py of translator_dir on a copy of a corpus directory, or if per_file is
+    true, on each of its .vm files, one process each. Returns (wall time in seconds, peak memory
+    in KB, number of instructions in translation), with times and instructions of all files added.
+    """
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        corpus = os.path.join(temp_dir, 'Corpus')
+        shutil.copytree(directory, corpus)
+
+        if per_file:
+            to_translate = [os.path.join(corpus, file) for file in sorted(os.listdir(corpus))
+                            if file.endswith('.vm')]
+            translated = [path.replace('.vm', '.asm') for path in to_translate]
+        else:
+            to_translate = [corpus]
+            translated = [os.path.join(corpus, 'Corpus.asm')]
+
+        runs = [_run_process(translator_dir, options, path) for path in to_translate]
+
+        instructions = 0
+        for path in translated:
+            with open(path) as f:
+                instructions += peephole.count_instructions(peephole.get_instructions(f.read()))
+
+    return sum(run[0] for run in runs), max(run[1] for run in runs), instructions
+
+def run_suite(corpora, repeat=1):
+    """
+    Runs each translator configuration on each corpus, repeat times, and returns list of
+    result dictionaries, with best wall time and highest peak memory of the runs.
+    """
+
+    results = []
+
+    for corpus, directory, skipped in corpora:
+        num_commands = count_commands(directory)
+
+        for name, translator_dir, options, per_file in translators:
+            runs = [run_translator(translator_dir, options, directory, per_file)
+                    for run in range(repeat)]
+            wall_time = min(run[0] for run in runs)
+
+            result = {
+                'translator': name,
+                'corpus': corpus,
+                'commands': num_commands,
+                'wall_time': round(wall_time, 4),
+                'peak_memory_kb': max(run[1] for run in runs),
+                'commands_per_second': round(num_commands / wall_time),
+                'instructions': runs[-1][2],
+                'skipped': skipped
+            }
+            results.append(result)
+            print_result(result)
+
+    return results
+
+def print_result(result):
+    """
+    Prints one result as a row of the results table.
+    """
+
+    print('{:<20}{:<18}{:>10}{:>10}{:>12}{:>14}{:>14}'.format(
+          result['corpus'], result['translator'], result['commands'],
+          '{:.3f}'.format(result['wall_time']), result['peak_memory_kb'],
+          result['commands_per_second'], result['instructions']))
+
+def main():
+    """
+    Runs benchmark suite and saves results as JSON.
+    """
+
+    parser = argparse.ArgumentParser(description='Benchmark suite for the VM Translators.')
+    parser.add_argument('--sizes', type=int, nargs='*', default=default_sizes,
+                        help='numbers of commands of synthetic corpora')
+    parser.add_argument('--os', dest='os_dir', default=None,
+                        help='directory of compiled OS .vm files, instead of compiling project12')
+    parser.add_argument('--repeat', type=int, default=1, help='runs of each benchmark, best time is kept')
+    parser.add_argument('--seed', type=int, default=0, help='seed of synthetic corpora')
+    parser.add_argument('--json', default='benchmark_results.json', help='file to save results to')
+    args = parser.parse_args()
+
+    print('\n{:<20}{:<18}{:>10}{:>10}{:>12}{:>14}{:>14}'.format(
+          'corpus', 'translator', 'commands', 'time (s)', 'peak KB', 'commands/s', 'instructions'))
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        corpora = get_corpora(work_dir, args.sizes, os_dir=args.os_dir, seed=args.seed)
+        results = run_suite(corpora, repeat=args.repeat)
+
+    for corpus, directory, skipped in corpora:
+        if skipped:
+            print('\n' + corpus + ': left out ' + ', '.join(skipped) + ', which did not compile')
+
+    report = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'seed': args.seed,
+        'repeat': args.repeat,
+        'results': results
+    }
+
+    with open(args.json, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    print('\nResults saved to: \n\t' + os.path.abspath(args.json))
+
+if __name__ == '__main__':
+    main()
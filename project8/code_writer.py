@@ -4,13 +4,16 @@
 This class translates each VM command into assembly code. 
 """
 
-import os
+from collections import OrderedDict
 
-if os.getcwd().endswith('VMTranslator'):
-    from vm_translator import assembly_code as asm
+#imported as part of a package, or run as a script from this directory
+if __package__:
+    from . import assembly_code as asm
+    from . import output_sink
     
 else:
     import assembly_code as asm
+    import output_sink
 
 
 class CodeWriter:
@@ -18,13 +21,58 @@ class CodeWriter:
     Translates VM commands into assembly code.
     """
     
-    def __init__(self, full_path):
+    def __init__(self, full_path, compact=False, comments=True, cache_size=256, top_of_stack=False, 
+                 shared_compare=False, source_map=None):
         """
         Initializes virtual RAM for pointers and base address indices, 
-        and, if write_to_file=True, opens output file/stream and prepares to write into it.
+        and opens output file/stream and prepares to write into it.
+        
+        A full_path is written to through a buffered output_sink.FileSink. full_path can 
+        also be an output sink, such as output_sink.MemorySink to translate into memory, or 
+        anything else with write() and close() methods.
+        
+        If compact=True, each call and return jumps to one shared routine, written 
+        by write_routines(), instead of inlining the whole calling sequence.
+        
+        If comments=False, no comments are written, and push and pop snippets are kept in 
+        an LRU cache of cache_size snippets. The cache is off when comments are on, since 
+        comments name the current function. cache_size=0 turns the cache off.
+        
+        If top_of_stack=True, the value on top of the stack is held in D between commands, 
+        whenever it can be, and is only written to RAM when another push, or a label, call 
+        or return, needs it there. Labels, calls and returns always leave it in RAM, so code 
+        that's entered by a jump finds the stack where it expects it.
+        
+        If shared_compare=True, each eq, gt and lt jumps to one shared routine for its 
+        comparison, written by write_routines(), with return address in D, instead of 
+        inlining the comparison.
+        
+        If source_map is a source_map.SourceMap, each piece of code written is added to it, 
+        with the file, line number, function and index of the VM command it translates.
         """
         
-        self._file_open = open(full_path, 'w')        
+        if isinstance(full_path, str):
+            self._sink = output_sink.FileSink(full_path)
+        else:
+            self._sink = full_path        
+        self._compact = compact
+        self._comments = comments
+        self._cache = None
+        self._cache_size = cache_size
+        self._cache_hits = 0
+        self._cache_misses = 0
+        self._return_snippet = None
+        self._top_of_stack = top_of_stack
+        self._top_in_d = False
+        self._shared_compare = shared_compare
+        self._source_map = source_map
+        
+        #(line_no, index) of VM command being written, or None outside write()
+        self._command = None
+        self._command_count = 0
+        
+        if not comments and cache_size:
+            self._cache = OrderedDict()
         self._current_file_name = ''
         self._current_function_name = 'Sys'
         self._jump_count = 0 
@@ -47,8 +95,65 @@ class CodeWriter:
         to_print += ' Current function: ' + self._current_function_name + '\n'
         to_print += '       Jump count: ' + str(self._jump_count) + '\n'
         to_print += '     Return count: ' + str(self._return_count) + '\n'
+        if self._cache is not None:
+            to_print += '       Cache hits: ' + str(self._cache_hits) + '\n'
+            to_print += '     Cache misses: ' + str(self._cache_misses) + '\n'
+        if self._top_of_stack:
+            to_print += '     Top of stack: ' + ('D' if self._top_in_d else 'RAM') + '\n'
         return to_print 
     
+    def _note(self, note):
+        """
+        Returns note if comments are on. Otherwise, returns only the newline that ends 
+        an inline note, since snippets can rely on it to end their last line.
+        """
+        
+        if self._comments:
+            return note
+        
+        if note[0] == ' ' and note[-1] == '\n':
+            return '\n'
+            
+        return ''
+    
+    def _write(self, code):
+        """
+        Writes code to output sink, and adds it to source map, if there is one.
+        """
+        
+        self._sink.write(code)
+        
+        if self._source_map is not None:
+            if self._command is None:
+                self._source_map.add(code)
+            else:
+                self._source_map.add(code, self._current_file_name, self._command[0], 
+                                     self._current_function_name, self._command[1])
+    
+    def _spill(self):
+        """
+        Returns assembly code that writes value on top of the stack from D to RAM, 
+        or nothing if it's already in RAM.
+        """
+        
+        if self._top_in_d:
+            self._top_in_d = False
+            return asm.spill_cmd()
+            
+        return ''
+        
+    def _fill(self):
+        """
+        Returns assembly code that pops value on top of the stack from RAM into D, 
+        or nothing if it's already in D.
+        """
+        
+        if self._top_in_d:
+            return ''
+            
+        self._top_in_d = True
+        return asm.fill_cmd()
+    
     def set_file_name(self, file_name):
         """
         Informs code writer that translation of a new VM file has started.
@@ -58,6 +163,7 @@ class CodeWriter:
         self._current_function_name = file_name #default until function declared         
         self._jump_count = 0
         self._return_count = 0
+        self._command_count = 0
         
     def set_function_name(self, function_name):
         """
@@ -74,31 +180,101 @@ class CodeWriter:
         Code is placed at ROM[0]       
         """       
         
-        note = '// Initialize stack pointer to 256\n'
+        note = self._note('// Initialize stack pointer to 256\n')
         code = asm.assign_value_cmd('SP', '256') + '\n'       
-        self._file_open.write(note + code) 
+        self._write(note + code) 
         self.write_call('call', 'Sys.init', '0')
         
+        if self._compact or self._shared_compare:
+            self.write_routines()
+            
+    def write_routines(self):
+        """
+        Writes shared call and return routines used in compact mode, and shared comparison 
+        routines used with shared_compare. Needs to be written once, and where it's not run 
+        into from code above, such as after bootstrap code or at the end. 
+        """
+        
+        code = ''
+        
+        if self._compact:
+            code += self._call_return_routines()
+            
+        if self._shared_compare:
+            for command in ['eq', 'gt', 'lt']:
+                code += self._note('// shared ' + command + ' routine\n')
+                code += asm.compare_routine_cmd(asm.math_table[command], top=self._top_of_stack) + '\n'
+                
+        self._write(code) 
+        return code
+        
+    def _call_return_routines(self):
+        """
+        Returns assembly code for shared call and return routines used in compact mode. 
+        
+        Call sites pass function address in R13, number of args in R14 and return address in D.
+        Return sites only jump to return routine, which is the same for all functions.       
+        """
+        
+        note = self._note('// shared call routine\n')
+        code = asm.flow_cmd('label', asm.call_routine)
+        
+        #push return-address, which call site put in D
+        code += asm.push_d_cmd(note=self._note(' // push return-address\n\n'))
+        
+        #save LCL, ARG, THIS and THAT of calling function
+        code += asm.push_cmd('R1', '0', note=self._note(' // push LCL\n\n')) 
+        code += asm.push_cmd('R2', '0', note=self._note(' // push ARG\n\n')) 
+        code += asm.push_cmd('R3', '0', note=self._note(' // push THIS\n\n')) 
+        code += asm.push_cmd('R4', '0', note=self._note(' // push THAT\n\n')) 
+        
+        #reposition ARG (n=number of args, from R14)
+        code += asm.assign_offset_cmd('ARG', 'SP', 'R14', frame_steps=5, note=self._note(' // ARG = SP-n-5\n\n'))
+        
+        #reposition LCL
+        code += asm.assign_cmd('LCL', 'SP', frame_steps=0, note=self._note(' // LCL = SP\n\n'))
+        
+        #transfer control to function address, from R13
+        code += asm.flow_cmd('goto', 'R13', note=self._note(' // goto f\n')) + '\n'
+        
+        code += self._note('// shared return routine\n')
+        code += asm.flow_cmd('label', asm.return_routine) 
+        code += self._return_code() + '\n'
+        
+        return note + code
+        
     def write_arithmetic(self, command):
         """
         Writes assembly code that is a translation of given arithmetic command.
         """
         
-        note = '// ' + self._current_function_name + ': ' + command + '\n'
+        note = self._note('// ' + self._current_function_name + ': ' + command + '\n')
        
-        if command in ['add', 'sub', 'neg']:
-            code = asm.math_cmd(asm.math_table[command])
-            
-        elif command in ['eq', 'gt', 'lt']:
+        if command in ['eq', 'gt', 'lt']:
+            code = self._fill() if self._top_of_stack else ''
             self._jump_count += 1
             jump = self._current_function_name + '$JUMP.' + str(self._jump_count)
-            code = asm.compare_cmd(asm.math_table[command], jump)  
+            
+            if self._shared_compare:
+                code += asm.compare_site_cmd(asm.math_table[command], jump, top=self._top_of_stack)
+                
+            elif self._top_of_stack:
+                code += asm.top_compare_cmd(asm.math_table[command], jump)
+                
+            else:
+                code += asm.compare_cmd(asm.math_table[command], jump)  
+       
+        elif self._top_of_stack:
+            code = self._fill() + asm.top_math_cmd(asm.math_table[command])
+       
+        elif command in ['add', 'sub', 'neg']:
+            code = asm.math_cmd(asm.math_table[command])
 
         #if command is an and, or, not      
         else:
             code = asm.logic_cmd(asm.math_table[command])     
 
-        self._file_open.write(note + code + '\n')    
+        self._write(note + code + '\n')    
         return note + code + '\n'             
         
     def write_push_pop(self, command, segment, index, write=True):
@@ -109,8 +285,27 @@ class CodeWriter:
         - C_POP        
         """
         
-        note = '// ' + self._current_function_name + ': ' 
-        note += command + ' ' + segment + ' ' + index + '\n'
+        top = ''
+        if self._top_of_stack:
+            top = self._spill() if command == 'push' else self._fill()
+            self._top_in_d = command == 'push'
+            
+        if self._cache is not None:
+            code = top + self._get_cached_push_pop(command, segment, index)
+        
+        else:
+            note = self._note('// ' + self._current_function_name + ': '
+                              + command + ' ' + segment + ' ' + index + '\n')
+            code = note + top + self._get_push_pop(command, segment, index) + '\n'
+            
+        if write:
+            self._write(code) 
+        return code  
+        
+    def _get_push_pop(self, command, segment, index):
+        """
+        Returns assembly code for push or pop command, without comments.
+        """
         
         static = False
         
@@ -121,16 +316,41 @@ class CodeWriter:
         else:        
             symbol = asm.symbol_table[segment]   
         
+        if self._top_of_stack:
+            if command == 'pop':
+                return asm.top_pop_cmd(symbol, index, static=static)
+            return asm.top_push_cmd(symbol, index, static=static)
+        
         if command == 'pop':           
-            code = asm.pop_cmd(symbol, index, static=static)    
+            return asm.pop_cmd(symbol, index, static=static)    
         
         #if command == 'push'        
-        else:
-            code = asm.push_cmd(symbol, index, static=static)    
+        return asm.push_cmd(symbol, index, static=static)    
+        
+    def _get_cached_push_pop(self, command, segment, index):
+        """
+        Returns assembly code for push or pop command from LRU cache, and translates 
+        and caches it first if it's not cached. Static variables are named after the 
+        file they're in, so key includes file name for static segment.
+        """
+        
+        static_file = self._current_file_name if segment == 'static' else None
+        key = (command, segment, index, static_file)
+        code = self._cache.get(key)
+        
+        if code is not None:
+            self._cache_hits += 1
+            self._cache.move_to_end(key)
+            return code
+        
+        self._cache_misses += 1
+        code = self._get_push_pop(command, segment, index) + '\n'
+        self._cache[key] = code
+        
+        if len(self._cache) > self._cache_size:
+            self._cache.popitem(last=False)
             
-        if write:
-            self._file_open.write(note + code + '\n') 
-        return note + code + '\n'  
+        return code  
         
     def write_flow(self, command, label, note=True, write=True):
         """
@@ -145,12 +365,17 @@ class CodeWriter:
             label = self._current_function_name
  
         if note:
-            note = ' // ' + command        
+            note = self._note(' // ' + command)        
         
-        code = asm.flow_cmd(command, label, note=note) + '\n'
+        if self._top_of_stack and command == 'if-goto':
+            code = self._fill() + asm.top_if_cmd(label, note=note)
+            self._top_in_d = False
+            
+        else:
+            code = self._spill() + asm.flow_cmd(command, label, note=note) + '\n'
 
         if write:
-            self._file_open.write(code) 
+            self._write(code) 
         return code 
         
     def write_function(self, command, function_name, num_locals):
@@ -159,7 +384,7 @@ class CodeWriter:
         """ 
 
         self.set_function_name(function_name)
-        note = '// function ' + self._current_function_name + ' ' + num_locals + '\n'        
+        note = self._note('// function ' + self._current_function_name + ' ' + num_locals + '\n')        
         
         code = self.write_flow('label', '', note=False, write=False)   
 
@@ -167,7 +392,7 @@ class CodeWriter:
             code += self.write_push_pop('push', 'constant', '0', write=False)
             #code += self.write_push_pop('pop', 'local', str(x), write=False)  
 
-        self._file_open.write(note + code) 
+        self._write(note + code) 
         return note + code              
 
     def write_call(self, command, function_name, num_args):
@@ -175,39 +400,50 @@ class CodeWriter:
         Writes assembly code that translates call command. num_args is a string.      
         """
         
-        note = '// call ' + function_name + ' ' + num_args + '\n'        
+        note = self._note('// call ' + function_name + ' ' + num_args + '\n')        
+        
+        #arguments have to be in RAM for called function
+        note += self._spill()
         
         #push return-address (using label below)
         self._return_count += 1
         return_address_label = self._current_function_name + '$return.' + str(self._return_count)
-        code = asm.push_cmd('constant', return_address_label, note=' // push return-address\n\n') 
+        
+        #pass function, number of args and return-address to shared call routine
+        if self._compact:
+            code = asm.call_site_cmd(function_name, num_args, return_address_label, note=self._note(' // goto call routine\n'))
+            code += asm.flow_cmd('label', return_address_label, note=self._note(' // (return-address)\n')) + '\n'
+            self._write(note + code) 
+            return note + code
+        
+        code = asm.push_cmd('constant', return_address_label, note=self._note(' // push return-address\n\n')) 
         
         #save LCL of calling function
-        code += asm.push_cmd('R1', '0', note=' // push LCL\n\n') 
+        code += asm.push_cmd('R1', '0', note=self._note(' // push LCL\n\n')) 
         
         #save ARG of calling function
-        code += asm.push_cmd('R2', '0', note=' // push ARG\n\n') 
+        code += asm.push_cmd('R2', '0', note=self._note(' // push ARG\n\n')) 
         
         #save THIS of calling function
-        code += asm.push_cmd('R3', '0', note=' // push THIS\n\n') 
+        code += asm.push_cmd('R3', '0', note=self._note(' // push THIS\n\n')) 
         
         #save THAT of calling function
-        code += asm.push_cmd('R4', '0', note=' // push THAT\n\n') 
+        code += asm.push_cmd('R4', '0', note=self._note(' // push THAT\n\n')) 
         
         #reposition ARG (n=number of args)
         steps_back = 0 - 5 - int(num_args)   
-        code += asm.assign_cmd('ARG', 'SP', frame_steps=steps_back, note=' // ARG = SP-n-5\n\n')
+        code += asm.assign_cmd('ARG', 'SP', frame_steps=steps_back, note=self._note(' // ARG = SP-n-5\n\n'))
         
         #reposition LCL
-        code += asm.assign_cmd('LCL', 'SP', frame_steps=0, note=' // LCL = SP\n\n')
+        code += asm.assign_cmd('LCL', 'SP', frame_steps=0, note=self._note(' // LCL = SP\n\n'))
         
         #transfer control
-        code += asm.flow_cmd('goto', function_name, note=' // goto f\n')        
+        code += asm.flow_cmd('goto', function_name, note=self._note(' // goto f\n'))        
         
         #label for return address        
-        code += asm.flow_cmd('label', return_address_label, note=' // (return-address)\n') + '\n'        
+        code += asm.flow_cmd('label', return_address_label, note=self._note(' // (return-address)\n')) + '\n'        
         
-        self._file_open.write(note + code) 
+        self._write(note + code) 
         return note + code
 
     def write_return(self, command):
@@ -215,52 +451,92 @@ class CodeWriter:
         Writes assembly code that translates return command.       
         """       
         
-        note = '// ' + command + ' from ' + self._current_function_name + '\n' 
+        note = self._note('// ' + command + ' from ' + self._current_function_name + '\n') 
+        note += self._spill()
+        
+        if self._compact:
+            code = asm.flow_cmd('goto', asm.return_routine, note=self._note(' // goto return routine\n')) + '\n'
+            
+        else:
+            code = self._return_code()
+        
+        self._write(note + code) 
+        return note + code     
+        
+    def _return_code(self):
+        """
+        Returns assembly code for return sequence, which is the same for all functions, 
+        so it's only translated once.       
+        """  
+        
+        if self._return_snippet is None:
+            self._return_snippet = self._translate_return()
+            
+        return self._return_snippet
+        
+    def _translate_return(self):
+        """
+        Translates return sequence into assembly code.       
+        """  
         
         #save endFrame address as temp variable
-        code = asm.assign_cmd('R14', 'LCL', note=' // endFrame = LCL\n\n') 
+        code = asm.assign_cmd('R14', 'LCL', note=self._note(' // endFrame = LCL\n\n')) 
         
         #save return address as another temp variable
-        code += asm.assign_pointer_cmd('R15', 'R14', frame_steps=-5, note=' // retAddr = *(endFrame-5)\n\n')
+        code += asm.assign_pointer_cmd('R15', 'R14', frame_steps=-5, note=self._note(' // retAddr = *(endFrame-5)\n\n'))
         
         #Reposition return value for caller
-        code += asm.pop_cmd('ARG', '0', note=' // *ARG = pop()\n\n')
+        code += asm.pop_cmd('ARG', '0', note=self._note(' // *ARG = pop()\n\n'))
         
         #Reposition SP of caller
-        code += asm.assign_cmd('SP', 'ARG', frame_steps=1, note=' // SP = ARG+1\n\n')
+        code += asm.assign_cmd('SP', 'ARG', frame_steps=1, note=self._note(' // SP = ARG+1\n\n'))
         
         #Restore THAT of caller
-        code += asm.assign_pointer_cmd('THAT', 'R14', frame_steps=-1, note=' // THAT = *(endFrame-1)\n\n')
+        code += asm.assign_pointer_cmd('THAT', 'R14', frame_steps=-1, note=self._note(' // THAT = *(endFrame-1)\n\n'))
         
         #Restore THIS of caller
-        code += asm.assign_pointer_cmd('THIS', 'R14', frame_steps=-2, note=' // THIS = *(endFrame-2)\n\n')
+        code += asm.assign_pointer_cmd('THIS', 'R14', frame_steps=-2, note=self._note(' // THIS = *(endFrame-2)\n\n'))
         
         #Restore ARG of caller
-        code += asm.assign_pointer_cmd('ARG', 'R14', frame_steps=-3, note=' // ARG = *(endFrame-3)\n\n')
+        code += asm.assign_pointer_cmd('ARG', 'R14', frame_steps=-3, note=self._note(' // ARG = *(endFrame-3)\n\n'))
         
         #Restore LCL of caller
-        code += asm.assign_pointer_cmd('LCL', 'R14', frame_steps=-4, note=' // LCL = *(endFrame-4)\n\n')        
+        code += asm.assign_pointer_cmd('LCL', 'R14', frame_steps=-4, note=self._note(' // LCL = *(endFrame-4)\n\n'))        
         
         #Jump to return address in caller
-        code += asm.flow_cmd('goto', 'R15', note=' // goto retAddr\n')
+        code += asm.flow_cmd('goto', 'R15', note=self._note(' // goto retAddr\n'))
         
-        self._file_open.write(note + code) 
-        return note + code           
+        return code           
 
-    def write(self, command_type, args):
+    def write_fragment(self, code):
+        """
+        Writes assembly code that was already translated, such as a whole file 
+        translated by another CodeWriter.        
+        """
+        
+        self._write(code)
+        
+    def write(self, command_type, args, line_no=None):
         """
         Uses command_type passed from parser to call correct write method 
-        through self._dispatch mapping dictionary.                
+        through self._dispatch mapping dictionary. line_no is only used for the source map.
         """        
 
-        return self._dispatch[command_type](*args)        
+        if self._source_map is None:
+            return self._dispatch[command_type](*args)
+        
+        self._command = line_no, self._command_count
+        code = self._dispatch[command_type](*args)
+        self._command = None
+        self._command_count += 1
+        return code
         
     def close(self):
         """
-        Closes output file.
+        Closes output sink, which writes what's left in its buffer.
         """
         
-        self._file_open.close()
+        self._sink.close()
     
     
     
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+
+"""
+Functions that run a link-time pass over a whole program, and drop VM functions that are
+never called.
+
+The pass builds a call graph from the call commands in each function, and walks it from
+Sys.init, which is what the bootstrap code calls. The VM language has no function pointers,
+so a function that can't be reached in the call graph is never run. Functions are dropped
+whole, and CodeWriter resets its labels and counters for each function, so the code of the
+functions that are kept is the same as without the pass.
+"""
+
+#imported as part of a package, or run as a script from this directory
+if __package__:
+    from . import peephole
+
+else:
+    import peephole
+
+
+entry_function = 'Sys.init'
+
+
+def split_functions(commands):
+    """
+    Accepts list of (command_type, args, line_no) records of one .vm file, and returns list
+    of (function_name, commands) tuples, one for each function, in order. Commands before
+    the first function are returned with function_name None.
+    """
+
+    functions = []
+    function_name = None
+    body = []
+
+    for command in commands:
+        if command[0] == 'C_FUNCTION':
+            if body or function_name is not None:
+                functions.append((function_name, body))
+            function_name = command[1][1]
+            body = []
+
+        body.append(command)
+
+    if body or function_name is not None:
+        functions.append((function_name, body))
+
+    return functions
+
+def get_calls(commands):
+    """
+    Returns set of names of functions called by a list of command records.
+    """
+
+    return {args[1] for command_type, args, line_no in commands if command_type == 'C_CALL'}
+
+def find_reachable(call_graph, entry=entry_function):
+    """
+    Accepts call graph, as a dictionary that maps each function name to the set of names it
+    calls, and returns set of names of functions that can be reached from entry.
+    """
+
+    reachable = {entry}
+    to_visit = [entry]
+
+    while to_visit:
+        for called in call_graph.get(to_visit.pop(), ()):
+            if called not in reachable:
+                reachable.add(called)
+                to_visit.append(called)
+
+    return reachable
+
+def eliminate(sources, entry=entry_function):
+    """
+    Accepts list of (file, commands) tuples for a whole program, where commands is a list of
+    (command_type, args, line_no) records. Returns (kept, dropped), where kept is the same
+    list with unreachable functions removed, and dropped is a list of (file, function_name,
+    commands) tuples. Commands outside any function are always kept.
+
+    If entry isn't defined, the program has no known starting point, so nothing is dropped.
+    """
+
+    split = [(file, split_functions(commands)) for file, commands in sources]
+
+    call_graph = {}
+    for file, functions in split:
+        for function_name, commands in functions:
+            call_graph[function_name] = get_calls(commands)
+
+    if entry not in call_graph:
+        return sources, []
+
+    reachable = find_reachable(call_graph, entry)
+    reachable.add(None)
+
+    kept = []
+    dropped = []
+    for file, functions in split:
+        commands = []
+        for function_name, body in functions:
+            if function_name in reachable:
+                commands.extend(body)
+            else:
+                dropped.append((file, function_name, body))
+
+        kept.append((file, commands))
+
+    return kept, dropped
+
+def format_report(kept, dropped, dropped_code):
+    """
+    Accepts kept and dropped lists from eliminate(), and list of assembly code of each
+    dropped function, in the same order. Returns (report, words), where report lists dropped
+    functions and ROM words saved, as a string, and words is total ROM words saved.
+    """
+
+    words = [peephole.count_instructions(peephole.get_instructions(code)) for code in dropped_code]
+    num_kept = sum(1 for file, commands in kept for command in commands if command[0] == 'C_FUNCTION')
+
+    report = 'Dead-function elimination from ' + entry_function + '\n\n'
+    report += 'Functions kept: ' + str(num_kept) + '\n'
+    report += 'Functions dropped: ' + str(len(dropped)) + '\n'
+    report += 'ROM words saved: ' + str(sum(words)) + '\n'
+
+    if dropped:
+        report += '\n{:<40}{:<20}{:>10}\n'.format('function', 'file', 'ROM words')
+
+    for (file, function_name, commands), count in zip(dropped, words):
+        report += '{:<40}{:<20}{:>10}\n'.format(function_name, file, count)
+
+    return report, sum(words)
@@ -0,0 +1,301 @@
+# -*- coding: utf-8 -*-
+
+"""
+Two-pass assembler that translates Hack assembly code, such as the VM Translator's output,
+into Hack machine code.
+
+FROM vm_translator DIRECTORY:
+-prompt> python hack_assembler.py Xxx.asm
+-prompt> python hack_assembler.py Xxx.asm --binary
+
+Writes Xxx.hack, or Xxx.bin with --binary, to the same directory as Xxx.asm.
+
+AS AN OUTPUT SINK of CodeWriter, to translate and assemble in one process:
+>>> sink = hack_assembler.AssemblerSink()
+>>> writer = code_writer.CodeWriter(sink)
+>>> ... writer.close()
+>>> sink.words
+
+The first pass runs as code is written: each label is given the ROM address of the instruction
+after it, and instructions are encoded right away, except for @symbol when symbol isn't a label
+yet, which is left for the second pass. The second pass runs on close(), and resolves those
+symbols, giving each new variable the next free RAM address from 16.
+
+.hack files have one line of 16 binary digits for each word, and .bin files have two bytes
+for each word, with the most significant byte first.
+"""
+
+import os, sys, argparse
+from array import array
+
+
+#symbols that are defined in every program
+predefined_symbols = {
+    'SP': 0,
+    'LCL': 1,
+    'ARG': 2,
+    'THIS': 3,
+    'THAT': 4,
+    'SCREEN': 16384,
+    'KBD': 24576
+}
+predefined_symbols.update({'R' + str(register): register for register in range(16)})
+
+#first RAM address given to variables
+first_variable = 16
+
+#largest value an A instruction can load, as its first bit is 0
+max_address = 0x7fff
+
+#a bit and 6 control bits of each computation, with both orders of commutative operators
+comp_table = {
+    '0': 0b0101010,
+    '1': 0b0111111,
+    '-1': 0b0111010,
+    'D': 0b0001100,
+    'A': 0b0110000,
+    '!D': 0b0001101,
+    '!A': 0b0110001,
+    '-D': 0b0001111,
+    '-A': 0b0110011,
+    'D+1': 0b0011111,
+    'A+1': 0b0110111,
+    'D-1': 0b0001110,
+    'A-1': 0b0110010,
+    'D+A': 0b0000010,
+    'D-A': 0b0010011,
+    'A-D': 0b0000111,
+    'D&A': 0b0000000,
+    'D|A': 0b0010101,
+    'M': 0b1110000,
+    '!M': 0b1110001,
+    '-M': 0b1110011,
+    'M+1': 0b1110111,
+    'M-1': 0b1110010,
+    'D+M': 0b1000010,
+    'D-M': 0b1010011,
+    'M-D': 0b1000111,
+    'D&M': 0b1000000,
+    'D|M': 0b1010101
+}
+comp_table.update({comp[::-1]: code for comp, code in list(comp_table.items())
+                   if len(comp) == 3 and comp[1] in '+&|' and comp[::-1] not in comp_table})
+
+jump_codes = {
+    '': 0,
+    'JGT': 1,
+    'JEQ': 2,
+    'JGE': 3,
+    'JLT': 4,
+    'JNE': 5,
+    'JLE': 6,
+    'JMP': 7
+}
+
+
+def encode_c(instruction):
+    """
+    Returns C instruction, such as AM=M-1 or D;JGT, encoded as a 16-bit word.
+    """
+
+    dest, sep, rest = instruction.rpartition('=')
+    comp, sep, jump = rest.partition(';')
+
+    try:
+        code = comp_table[comp.replace(' ', '')]
+        jump_code = jump_codes[jump.strip()]
+    except KeyError:
+        raise ValueError('invalid instruction: ' + instruction)
+
+    dest_code = ('A' in dest) << 2 | ('D' in dest) << 1 | ('M' in dest)
+    return 0xe000 | code << 6 | dest_code << 3 | jump_code
+
+def get_labels(instructions):
+    """
+    First pass: accepts list of instructions and labels from peephole.get_instructions(),
+    and returns dictionary of labels and their ROM addresses.
+    """
+
+    labels = {}
+    address = 0
+
+    for instruction in instructions:
+        if instruction.startswith('('):
+            labels[instruction[1:-1]] = address
+        else:
+            address += 1
+
+    return labels
+
+def assemble(code):
+    """
+    Accepts Hack assembly code as a string, and returns (words, symbols), where words is its
+    machine code, as an array of unsigned 16-bit words, and symbols is a dictionary of the
+    address of each symbol, including labels and variables.
+    """
+
+    sink = AssemblerSink()
+    sink.write(code)
+    sink.close()
+    return sink.words, sink.symbols
+
+def get_hack(words):
+    """
+    Returns machine code as .hack text, one line of 16 binary digits for each word.
+    """
+
+    return ''.join(format(word, '016b') + '\n' for word in words)
+
+def get_binary(words):
+    """
+    Returns machine code as bytes, two for each word, with the most significant byte first.
+    """
+
+    words = array('H', words)
+    if sys.byteorder == 'little':
+        words.byteswap()
+
+    return words.tobytes()
+
+def write_hack(words, fname):
+    """
+    Writes machine code to .hack file.
+    """
+
+    with open(fname, 'w') as f:
+        f.write(get_hack(words))
+
+def write_binary(words, fname):
+    """
+    Writes machine code to binary file, two bytes for each word, most significant byte first.
+    """
+
+    with open(fname, 'wb') as f:
+        f.write(get_binary(words))
+
+
+class AssemblerSink:
+    """
+    Output sink for CodeWriter, which assembles code as it's written, instead of keeping it
+    as text. Machine code is in words, and symbols has the address of each symbol, once
+    close() has run the second pass.
+    """
+
+    def __init__(self):
+        """
+        Prepares empty program and symbol table.
+        """
+
+        self.words = array('H')
+        self.symbols = dict(predefined_symbols)
+        self._labels = {}
+        self._encoded = {}
+        self._closed = False
+
+        #(index in words, symbol) of each @symbol left for the second pass
+        self._fixups = []
+
+    def __str__(self):
+        to_print =  '    Instructions: ' + str(len(self.words)) + '\n'
+        to_print += '          Labels: ' + str(len(self._labels)) + '\n'
+        to_print += '  Unresolved @symbols: ' + str(0 if self._closed else len(self._fixups)) + '\n'
+        return to_print
+
+    def write(self, code):
+        """
+        First pass: accepts assembly code, records its labels, and encodes its instructions.
+        """
+
+        words = self.words
+        symbols = self.symbols
+        encoded = self._encoded
+
+        for line in code.split('\n'):
+            if '//' in line:
+                line = line.split('//', 1)[0]
+
+            line = line.strip()
+            if not line:
+                continue
+
+            first = line[0]
+
+            if first == '@':
+                symbol = line[1:]
+                value = symbols.get(symbol)
+
+                if value is None:
+                    if not symbol.isdigit():
+                        self._fixups.append((len(words), symbol))
+                        words.append(0)
+                        continue
+
+                    value = int(symbol)
+
+                if value > max_address:
+                    raise ValueError('value of ' + line + ' is bigger than ' + str(max_address))
+                words.append(value)
+
+            elif first == '(':
+                label = line[1:-1]
+                self._labels[label] = symbols[label] = len(words)
+
+            else:
+                word = encoded.get(line)
+                if word is None:
+                    word = encoded[line] = encode_c(line)
+                words.append(word)
+
+    def close(self):
+        """
+        Second pass: resolves @symbol instructions whose symbol wasn't a label when they were
+        written, to a label, or else to a variable.
+        """
+
+        if self._closed:
+            return
+
+        words = self.words
+        symbols = self.symbols
+        next_variable = first_variable
+
+        for index, symbol in self._fixups:
+            value = symbols.get(symbol)
+
+            if value is None:
+                value = symbols[symbol] = next_variable
+                next_variable += 1
+
+            if value > max_address:
+                raise ValueError('value of @' + symbol + ' is bigger than ' + str(max_address))
+
+            words[index] = value
+
+        self._fixups = []
+        self._closed = True
+
+
+def main():
+    """
+    Assembles .asm file into .hack file.
+    """
+
+    parser = argparse.ArgumentParser(description='Assembles Hack assembly code into machine code.')
+    parser.add_argument('file', help='.asm file to assemble')
+    parser.add_argument('--binary', action='store_true', help='write packed 16-bit Xxx.bin instead of Xxx.hack')
+    args = parser.parse_args()
+
+    with open(args.file) as f:
+        words, symbols = assemble(f.read())
+
+    if args.binary:
+        to_write = os.path.splitext(args.file)[0] + '.bin'
+        write_binary(words, to_write)
+    else:
+        to_write = os.path.splitext(args.file)[0] + '.hack'
+        write_hack(words, to_write)
+
+    print('Assembled ' + str(len(words)) + ' instructions to: \n\t' + to_write)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,477 @@
+# -*- coding: utf-8 -*-
+
+"""
+Headless emulator of the Hack computer, which runs Hack machine code, such as the Xxx.hack
+files of project6, or the VM Translator's output once it's assembled, and counts cycles.
+
+FROM vm_translator DIRECTORY:
+-prompt> python hack_emulator.py Xxx.hack
+-prompt> python hack_emulator.py Xxx.hack -n 5000000
+-prompt> python hack_emulator.py ../project6/Pong.hack -n 5000000 --benchmark
+
+Runs Xxx.hack until it halts, or for the given number of cycles, and reports cycles run,
+time taken and cycles per second. With --benchmark, runs it with both the compiled basic
+blocks and the plain interpreter loop, and reports instructions per second of each.
+
+The emulator follows the CPU of project5: each instruction takes one cycle, an instruction
+that writes to M writes to RAM[A] of before the instruction, and a jump goes to A of before
+the instruction too, so AM=M-1;JMP jumps to where A pointed. RAM has 32K words, and addresses
+are 15 bits, like addressM. Hack has no halt instruction, so a program halts when it jumps to
+an @ instruction that loads its own address, which is the infinite loop @END, 0;JMP that Hack
+programs end with, or when it runs past the end of ROM.
+
+run() doesn't decode each instruction each time it runs it. ROM is split into basic blocks,
+which run from an address that's jumped to, up to and including the next jump, and the first
+time a block is run, it's compiled into a Python function, with A folded into the code as a
+constant after each @ instruction, and the ALU computations written out as expressions. A
+block is then run with one call, until ROM changes. interpret() is the plain loop, that
+decodes each instruction as it runs it, and is what run() falls back to for the last cycles
+of max_cycles, which may end in the middle of a block.
+"""
+
+import argparse, time
+from array import array
+
+
+ram_size = 32768
+rom_size = 32768
+
+#addresses of memory maps
+screen = 16384
+keyboard = 24576
+
+
+def _alu(control):
+    """
+    Returns function that computes ALU output for 6 control bits zx, nx, zy, ny, f, no,
+    from x = D and y = A or M, as unsigned 16-bit integers, like the ALU of project2.
+    """
+
+    zx, nx, zy, ny, f, no = [(control >> bit) & 1 for bit in range(5, -1, -1)]
+
+    def compute(x, y):
+        if zx: x = 0
+        if nx: x = ~x & 0xffff
+        if zy: y = 0
+        if ny: y = ~y & 0xffff
+        out = (x + y) & 0xffff if f else x & y
+        return ~out & 0xffff if no else out
+
+    return compute
+
+#ALU function for each of the 64 control codes, with the computations of the Hack
+#machine language replaced by faster functions that give the same results
+alu_table = [_alu(control) for control in range(64)]
+alu_table[0b101010] = lambda x, y: 0
+alu_table[0b111111] = lambda x, y: 1
+alu_table[0b111010] = lambda x, y: 0xffff
+alu_table[0b001100] = lambda x, y: x
+alu_table[0b110000] = lambda x, y: y
+alu_table[0b001101] = lambda x, y: ~x & 0xffff
+alu_table[0b110001] = lambda x, y: ~y & 0xffff
+alu_table[0b001111] = lambda x, y: -x & 0xffff
+alu_table[0b110011] = lambda x, y: -y & 0xffff
+alu_table[0b011111] = lambda x, y: (x + 1) & 0xffff
+alu_table[0b110111] = lambda x, y: (y + 1) & 0xffff
+alu_table[0b001110] = lambda x, y: (x - 1) & 0xffff
+alu_table[0b110010] = lambda x, y: (y - 1) & 0xffff
+alu_table[0b000010] = lambda x, y: (x + y) & 0xffff
+alu_table[0b010011] = lambda x, y: (x - y) & 0xffff
+alu_table[0b000111] = lambda x, y: (y - x) & 0xffff
+alu_table[0b000000] = lambda x, y: x & y
+alu_table[0b010101] = lambda x, y: x | y
+
+#for each jump code, whether jump is taken when ALU output is zero, positive and negative
+jump_table = [
+    (False, False, False),
+    (False, True, False),
+    (True, False, False),
+    (True, True, False),
+    (False, False, True),
+    (False, True, True),
+    (True, False, True),
+    (True, True, True)
+]
+
+#Python expression of ALU output for the computations of the Hack machine language, from
+#x = d and y = {y}, which is A or M, for compiled blocks, and the other control codes are
+#compiled into calls of alu_table
+alu_expressions = {
+    0b101010: '0',
+    0b111111: '1',
+    0b111010: '0xffff',
+    0b001100: 'd',
+    0b110000: '{y}',
+    0b001101: 'd ^ 0xffff',
+    0b110001: '{y} ^ 0xffff',
+    0b001111: '-d & 0xffff',
+    0b110011: '-{y} & 0xffff',
+    0b011111: '(d + 1) & 0xffff',
+    0b110111: '({y} + 1) & 0xffff',
+    0b001110: '(d - 1) & 0xffff',
+    0b110010: '({y} - 1) & 0xffff',
+    0b000010: '(d + {y}) & 0xffff',
+    0b010011: '(d - {y}) & 0xffff',
+    0b000111: '({y} - d) & 0xffff',
+    0b000000: 'd & {y}',
+    0b010101: 'd | {y}'
+}
+
+#Python condition on ALU output, out, of each jump code but 0, for compiled blocks
+jump_conditions = [
+    None,
+    '0 < out < 0x8000',
+    'out == 0',
+    'out < 0x8000',
+    'out >= 0x8000',
+    'out != 0',
+    'out == 0 or out >= 0x8000',
+    'True'
+]
+
+
+def parse_hack(lines):
+    """
+    Accepts Hack machine code as any iterable of lines of 16 binary digits, such as an open
+    .hack file, and returns it as an array of unsigned 16-bit words. Blank lines are skipped.
+    """
+
+    return array('H', (int(line, 2) for line in lines if line.strip()))
+
+def read_hack(fname):
+    """
+    Reads .hack file and returns its machine code as an array of unsigned 16-bit words.
+    """
+
+    with open(fname) as f:
+        return parse_hack(f)
+
+def compile_block(rom, start):
+    """
+    Compiles basic block of rom that starts at address start, and ends with the first jump
+    from there, or at the end of rom. Returns (function, length), where length is the number
+    of instructions, and function(a, d, ram) runs them and returns (a, d, pc, status), where
+    status is 0 if no jump was taken, 1 if it was, and 2 if it halted the program.
+    """
+
+    lines = []
+    a = None
+    pc = start
+    size = len(rom)
+    ended = False
+
+    while pc < size and not ended:
+        instruction = rom[pc]
+        pc += 1
+
+        #A instruction, whose value is used as a constant until a C instruction sets A
+        if instruction < 0x8000:
+            a = instruction
+            continue
+
+        #C instruction, with the address of M and the jump target from A of before it
+        address = 'a & 0x7fff' if a is None else str(a)
+        target = 'a' if a is None else str(a)
+        y = 'ram[' + address + ']' if instruction & 0x1000 else target
+
+        control = (instruction >> 6) & 0x3f
+        if control in alu_expressions:
+            out = alu_expressions[control].format(y=y)
+        else:
+            out = 'alu[' + str(control) + '](d, ' + y + ')'
+
+        dests = []
+        if instruction & 0x8:
+            dests.append('ram[' + address + ']')
+        if instruction & 0x10:
+            dests.append('d')
+        if instruction & 0x20:
+            dests.append('a')
+
+        jump = instruction & 0x7
+        if jump and a is None and instruction & 0x20:
+            lines.append('target = a')
+            target = 'target'
+
+        if jump or len(dests) > 1:
+            lines.append('out = ' + out)
+            out = 'out'
+        for dest in dests:
+            lines.append(dest + ' = ' + out)
+
+        if instruction & 0x20:
+            a = None
+
+        if not jump:
+            continue
+
+        #jump to @ instruction that loads its own address, so it never leaves the loop
+        jumped = '1'
+        if pc >= 2 and rom[pc - 2] == pc - 2:
+            if target == str(pc - 2):
+                jumped = '2'
+            elif not target.isdigit():
+                jumped = '2 if ' + target + ' == ' + str(pc - 2) + ' else 1'
+
+        result = 'a' if a is None else str(a)
+        lines.append('if ' + jump_conditions[jump] + ': return ' + result + ', d, ' + target + ', ' + jumped)
+        ended = True
+
+    lines.append('return ' + ('a' if a is None else str(a)) + ', d, ' + str(pc) + ', 0')
+
+    source = 'def block(a, d, ram):\n    ' + '\n    '.join(lines) + '\n'
+    namespace = {'alu': alu_table}
+    exec(compile(source, '<block ' + str(start) + '>', 'exec'), namespace)
+    return namespace['block'], pc - start
+
+
+class Emulator:
+    """
+    Runs Hack machine code. ROM and RAM are arrays of unsigned 16-bit words, so a program's
+    memory can be read and written directly, such as ram[keyboard] to press a key, while
+    it's not running. A, D and PC are kept as attributes between calls to step() and run().
+    Compiled blocks are kept for the rom array that load() creates, so a program is changed
+    with load(), or by assigning a new array to rom, and not by writing into rom.
+    """
+
+    def __init__(self, program=()):
+        """
+        Accepts Hack machine code, as an iterable of 16-bit words, and loads it into ROM.
+        """
+
+        self.ram = array('H', bytes(2 * ram_size))
+
+        #compiled block at each ROM address, or None, and the rom they were compiled from
+        self._blocks = None
+        self._blocks_rom = None
+        self.load(program)
+
+    def __str__(self):
+        to_print =  '        A: ' + str(self.a) + '\n'
+        to_print += '        D: ' + str(self.d) + '\n'
+        to_print += '       PC: ' + str(self.pc) + '\n'
+        to_print += '   Cycles: ' + str(self.cycles) + '\n'
+        to_print += '   Halted: ' + str(self.halted) + '\n'
+        return to_print
+
+    def load(self, program):
+        """
+        Loads Hack machine code into ROM and resets CPU. RAM is left as it is.
+        """
+
+        rom = array('H', program)
+        if len(rom) > rom_size:
+            raise ValueError('program has ' + str(len(rom)) + ' instructions, ROM has '
+                             + str(rom_size) + ' words')
+
+        self.rom = rom
+        self.reset()
+
+    def reset(self, clear_ram=False):
+        """
+        Resets A, D, PC and cycle count to 0, like the reset input of the CPU, and clears RAM
+        if clear_ram is true.
+        """
+
+        self.a = 0
+        self.d = 0
+        self.pc = 0
+        self.cycles = 0
+        self.halted = len(self.rom) == 0
+
+        if clear_ram:
+            self.ram = array('H', bytes(2 * ram_size))
+
+    def step(self):
+        """
+        Runs one instruction, unless program has halted. Returns number of cycles run, 1 or 0.
+        """
+
+        return self.interpret(1)
+
+    def run(self, max_cycles=None, breakpoints=frozenset()):
+        """
+        Runs program until it halts, or for max_cycles cycles, or until a jump is taken to one
+        of the ROM addresses in breakpoints, such as function entries for a profiler. Returns
+        number of cycles run, which is also added to cycles. Runs compiled basic blocks, which
+        gives the same results as interpret().
+        """
+
+        if self.halted:
+            return 0
+
+        rom = self.rom
+        if self._blocks_rom is not rom:
+            self._blocks = [None] * len(rom)
+            self._blocks_rom = rom
+
+        blocks = self._blocks
+        ram = self.ram
+        size = len(rom)
+        limit = float('inf') if max_cycles is None else max_cycles
+
+        a = self.a
+        d = self.d
+        pc = self.pc
+        count = 0
+
+        while True:
+            if pc >= size:
+                self.halted = True
+                break
+
+            block = blocks[pc]
+            if block is None:
+                block = blocks[pc] = compile_block(rom, pc)
+
+            function, length = block
+            if count + length > limit:
+                #interpret the last cycles, which end in the middle of the block
+                self.a = a
+                self.d = d
+                self.pc = pc
+                self.cycles += count
+                return count + self.interpret(limit - count, breakpoints)
+
+            a, d, pc, status = function(a, d, ram)
+            count += length
+
+            if status:
+                if status == 2:
+                    self.halted = True
+                    break
+                if pc in breakpoints:
+                    break
+
+        self.a = a
+        self.d = d
+        self.pc = pc
+        self.cycles += count
+        return count
+
+    def interpret(self, max_cycles=None, breakpoints=frozenset()):
+        """
+        Same as run(), but decodes and runs one instruction at a time, without compiling.
+        """
+
+        if self.halted:
+            return 0
+
+        rom = self.rom
+        ram = self.ram
+        alu = alu_table
+        jumps = jump_table
+        size = len(rom)
+        limit = float('inf') if max_cycles is None else max_cycles
+
+        a = self.a
+        d = self.d
+        pc = self.pc
+        count = 0
+
+        while count < limit:
+            if pc >= size:
+                self.halted = True
+                break
+
+            instruction = rom[pc]
+            count += 1
+
+            #A instruction
+            if instruction < 0x8000:
+                a = instruction
+                pc += 1
+                continue
+
+            #C instruction
+            out = alu[(instruction >> 6) & 0x3f](d, ram[a & 0x7fff] if instruction & 0x1000 else a)
+            target = a
+
+            if instruction & 0x8:
+                ram[a & 0x7fff] = out
+            if instruction & 0x20:
+                a = out
+            if instruction & 0x10:
+                d = out
+
+            if instruction & 0x7 and jumps[instruction & 0x7][0 if out == 0 else 2 if out & 0x8000 else 1]:
+                #jump to @ instruction that loads its own address, so it never leaves the loop
+                if target == pc - 1 and rom[target] == target:
+                    pc = target
+                    self.halted = True
+                    break
+
+                pc = target
+                if target in breakpoints:
+                    break
+            else:
+                pc += 1
+
+        self.a = a
+        self.d = d
+        self.pc = pc
+        self.cycles += count
+        return count
+
+
+def time_run(program, max_cycles=None, compiled=True):
+    """
+    Runs program on a new emulator, with run(), or with interpret() if compiled is false.
+    Returns emulator and seconds taken, including compiling blocks.
+    """
+
+    emulator = Emulator(program)
+
+    start = time.perf_counter()
+    if compiled:
+        emulator.run(max_cycles)
+    else:
+        emulator.interpret(max_cycles)
+
+    return emulator, time.perf_counter() - start
+
+def main():
+    """
+    Runs .hack file and reports cycles run and cycles per second, or instructions per second
+    of compiled blocks and of the interpreter loop.
+    """
+
+    parser = argparse.ArgumentParser(description='Headless emulator of the Hack computer.')
+    parser.add_argument('file', help='.hack file to run')
+    parser.add_argument('-n', '--cycles', type=int, default=None,
+                        help='most cycles to run, default is to run until program halts')
+    parser.add_argument('--interpret', action='store_true',
+                        help='run with the interpreter loop, without compiling blocks')
+    parser.add_argument('--benchmark', action='store_true',
+                        help='run with compiled blocks and with the interpreter loop, and compare')
+    args = parser.parse_args()
+
+    program = read_hack(args.file)
+    print('\nRan: ' + args.file + '\n')
+
+    if not args.benchmark:
+        emulator, seconds = time_run(program, args.cycles, not args.interpret)
+        print(emulator)
+        print('  Seconds: {:.3f}'.format(seconds))
+        print(' Cycles/s: {:,.0f}'.format(emulator.cycles / seconds if seconds else 0))
+        return
+
+    compiled, compiled_seconds = time_run(program, args.cycles)
+    interpreted, interpreted_seconds = time_run(program, args.cycles, compiled=False)
+
+    same = ((compiled.a, compiled.d, compiled.pc, compiled.cycles, compiled.halted, compiled.ram)
+            == (interpreted.a, interpreted.d, interpreted.pc, interpreted.cycles, interpreted.halted,
+                interpreted.ram))
+
+    print('{:<14}{:>14}{:>10}{:>16}'.format('loop', 'instructions', 'seconds', 'instructions/s'))
+    for name, emulator, seconds in [('compiled', compiled, compiled_seconds),
+                                    ('interpreter', interpreted, interpreted_seconds)]:
+        print('{:<14}{:>14,}{:>10.3f}{:>16,.0f}'.format(name, emulator.cycles, seconds,
+                                                      emulator.cycles / seconds if seconds else 0))
+
+    print('\n  Speedup: {:.2f}x'.format(interpreted_seconds / compiled_seconds if compiled_seconds else 0))
+    print('  Compiled blocks: ' + str(sum(block is not None for block in compiled._blocks)))
+    print('  Same state: ' + str(same))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+
+"""
+This class is a machine code backend for CodeWriter, which writes Hack machine code into an
+array of 16-bit words, instead of assembly code, for builds where nobody reads the assembly
+code. The assembly code backend, output_sink, is still the one to use for debugging.
+
+CodeWriter writes the same snippets over and over, such as each push and pop, and with
+comments off its snippet cache returns the very same strings. So each distinct snippet is
+assembled once, into a fragment of words with the offsets of its labels and @symbols, and
+after that, writing it is only a dictionary lookup and copying its words. Snippets that are
+written once, such as calls, which have their own return address label, are made of lines
+that are written over and over, so each distinct line is decoded once too.
+
+Labels are resolved in one pass, with back-patching: an @symbol whose label isn't defined yet
+goes on that symbol's fixup list, and is patched when the label is defined. What's left on
+fixup lists at close() are variables, which get RAM addresses from 16 in order of first use,
+the same as the two-pass hack_assembler.
+"""
+
+from array import array
+
+#imported as part of a package, or run as a script from this directory
+if __package__:
+    from . import hack_assembler
+
+else:
+    import hack_assembler
+
+
+class MachineCodeSink:
+    """
+    Output sink for CodeWriter that writes machine code into words, an array of unsigned 16-bit
+    words, which is complete once close() has allocated variables.
+    """
+
+    def __init__(self, cache_size=4096):
+        """
+        Prepares empty program. cache_size is the most fragments, and the most lines, kept,
+        and each cache is emptied when it's full.
+        """
+
+        self.words = array('H')
+        self.symbols = dict(hack_assembler.predefined_symbols)
+        self._fixups = {}
+        self._fragments = {}
+        self._lines = {}
+        self._cache_size = cache_size
+        self._hits = 0
+        self._misses = 0
+        self._closed = False
+
+    def __str__(self):
+        to_print =  '    Instructions: ' + str(len(self.words)) + '\n'
+        to_print += '  Fragment hits: ' + str(self._hits) + '\n'
+        to_print += 'Fragment misses: ' + str(self._misses) + '\n'
+        return to_print
+
+    def _decode_line(self, line):
+        """
+        Returns (word, label, symbol) for a line of assembly code, where word is its machine
+        code, or None if it's a label, comment or blank line, label is its label, if it's
+        one, and symbol is the symbol of an @symbol instruction that isn't predefined, with
+        word left as 0.
+        """
+
+        line = line.split('//', 1)[0].strip()
+
+        if not line:
+            return None, None, None
+
+        if line[0] == '(':
+            return None, line[1:-1], None
+
+        if line[0] != '@':
+            return hack_assembler.encode_c(line), None, None
+
+        symbol = line[1:]
+        if not symbol.isdigit() and symbol not in hack_assembler.predefined_symbols:
+            return 0, None, symbol
+
+        value = int(symbol) if symbol.isdigit() else hack_assembler.predefined_symbols[symbol]
+        if value > hack_assembler.max_address:
+            raise ValueError('value of ' + line + ' is bigger than ' + str(hack_assembler.max_address))
+
+        return value, None, None
+
+    def _assemble_fragment(self, code):
+        """
+        Returns (words, labels, references) for a snippet of assembly code, where labels and
+        references are lists of (offset, symbol) of each label and each @symbol that isn't
+        predefined. References are left as 0 in words.
+        """
+
+        words = array('H')
+        labels = []
+        references = []
+        decoded = self._lines
+
+        for line in code.split('\n'):
+            line_code = decoded.get(line)
+
+            if line_code is None:
+                line_code = self._decode_line(line)
+                if len(decoded) >= self._cache_size:
+                    decoded.clear()
+                decoded[line] = line_code
+
+            word, label, symbol = line_code
+
+            if label is not None:
+                labels.append((len(words), label))
+            elif word is not None:
+                if symbol is not None:
+                    references.append((len(words), symbol))
+                words.append(word)
+
+        return words, labels, references
+
+    def _define(self, label, address):
+        """
+        Gives label its ROM address, and patches @label instructions written before it.
+        """
+
+        self.symbols[label] = address
+
+        for index in self._fixups.pop(label, ()):
+            self._patch(index, address, label)
+
+    def _patch(self, index, value, symbol):
+        """
+        Sets word at index to value of symbol.
+        """
+
+        if value > hack_assembler.max_address:
+            raise ValueError('value of @' + symbol + ' is bigger than ' + str(hack_assembler.max_address))
+
+        self.words[index] = value
+
+    def write(self, code):
+        """
+        Accepts assembly code, and writes its machine code.
+        """
+
+        fragment = self._fragments.get(code)
+
+        if fragment is None:
+            self._misses += 1
+            fragment = self._assemble_fragment(code)
+
+            if len(self._fragments) >= self._cache_size:
+                self._fragments.clear()
+            self._fragments[code] = fragment
+
+        else:
+            self._hits += 1
+
+        words, labels, references = fragment
+        base = len(self.words)
+        self.words.extend(words)
+
+        for offset, label in labels:
+            self._define(label, base + offset)
+
+        for offset, symbol in references:
+            value = self.symbols.get(symbol)
+
+            if value is None:
+                self._fixups.setdefault(symbol, []).append(base + offset)
+            else:
+                self._patch(base + offset, value, symbol)
+
+    def close(self):
+        """
+        Gives each symbol that's still on a fixup list, which is never defined as a label,
+        the next free RAM address, in order of first use.
+        """
+
+        if self._closed:
+            return
+
+        next_variable = hack_assembler.first_variable
+
+        for symbol, indexes in self._fixups.items():
+            self.symbols[symbol] = next_variable
+            for index in indexes:
+                self._patch(index, next_variable, symbol)
+            next_variable += 1
+
+        self._fixups = {}
+        self._closed = True
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+
+"""
+These classes collect assembly code written by CodeWriter, so it's written out in large
+chunks instead of once for each VM command.
+"""
+
+
+class FileSink:
+    """
+    Buffers assembly code in memory, and writes it to a file in chunks of about chunk_size characters.
+    """
+
+    def __init__(self, full_path, chunk_size=1 << 20):
+        """
+        Opens output file and prepares to buffer code for it.
+        """
+
+        self._file_path = full_path
+        self._file_open = open(full_path, 'w')
+        self._chunk_size = chunk_size
+        self._chunks = []
+        self._size = 0
+
+    def __str__(self):
+        to_print =  '       File path: ' + self._file_path + '\n'
+        to_print += 'Buffered characters: ' + str(self._size) + '\n'
+        return to_print
+
+    def write(self, code):
+        """
+        Adds code to buffer, and writes buffer to file once it reaches chunk size.
+        """
+
+        self._chunks.append(code)
+        self._size += len(code)
+
+        if self._size >= self._chunk_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes buffer to file.
+        """
+
+        self._file_open.write(''.join(self._chunks))
+        self._chunks = []
+        self._size = 0
+
+    def close(self):
+        """
+        Writes what's left in buffer and closes file.
+        """
+
+        self.flush()
+        self._file_open.close()
+
+
+class MemorySink:
+    """
+    Keeps assembly code in memory, and returns it as a string or as bytes. Nothing is written to disk.
+    """
+
+    def __init__(self):
+        """
+        Prepares empty buffer.
+        """
+
+        self._chunks = []
+
+    def __str__(self):
+        return '   Chunks: ' + str(len(self._chunks)) + '\n'
+
+    def write(self, code):
+        """
+        Adds code to buffer.
+        """
+
+        self._chunks.append(code)
+
+    def getvalue(self):
+        """
+        Returns all code written so far as a string.
+        """
+
+        code = ''.join(self._chunks)
+        self._chunks = [code]
+        return code
+
+    def get_bytes(self, encoding='ascii'):
+        """
+        Returns all code written so far as bytes.
+        """
+
+        return self.getvalue().encode(encoding)
+
+    def take(self):
+        """
+        Returns all code written since the last take() as a string, and empties buffer.
+        """
+
+        code = ''.join(self._chunks)
+        self._chunks = []
+        return code
+
+    def close(self):
+        """
+        Does nothing, so code can still be read after CodeWriter closes its sink.
+        """
+
+        pass
@@ -0,0 +1,331 @@
+# -*- coding: utf-8 -*-
+
+"""
+Functions that run a peephole optimization pass over assembly code written by CodeWriter.
+
+Each VM command is translated on its own, so the assembly code has long redundant sequences
+where one command's template meets the next one's. For example, a push followed by a pop
+increments SP, and then right away decrements SP to read back the value that was just written.
+
+The pass sweeps over the instructions once for each group of rules, and rewrites windows that
+match a rule. Labels are never part of a window, so code that's entered by a jump is never
+rewritten across.
+"""
+
+import re
+
+
+pointer_segments = ['LCL', 'ARG', 'THIS', 'THAT']
+
+#highest index that's cheaper to reach with repeated A=A+1 than with @index, D=A, D=D+M
+max_steps = 5
+
+#most instructions any rule reads, in rule_pop_segment
+window_width = 12
+
+_REGISTER_REGEX = re.compile('^@R([0-9]|1[0-5])$')
+
+
+def get_instructions(code):
+    """
+    Accepts assembly code as a string, and returns a list of instructions and labels,
+    with all comments and white space removed.
+    """
+
+    instructions = []
+    for line in code.split('\n'):
+        if '//' in line:
+            line = line.split('//', 1)[0]
+
+        line = line.strip()
+        if line:
+            instructions.append(line)
+
+    return instructions
+
+def count_instructions(instructions):
+    """
+    Returns number of ROM words used by a list of instructions, which doesn't include labels.
+    """
+
+    return sum(1 for instruction in instructions if not instruction.startswith('('))
+
+def _is_index(instruction):
+    """
+    Checks if instruction loads a number into A, as in @index.
+    """
+
+    return instruction.startswith('@') and instruction[1:].isdigit()
+
+def _sets_only_a(instruction):
+    """
+    Checks if instruction sets nothing but A, with no jump and no write to RAM.
+    """
+
+    if instruction.startswith('@'):
+        return True
+
+    return instruction.startswith('A=') and ';' not in instruction
+
+def _keeps_a(instruction):
+    """
+    Checks if C instruction leaves A as it is and doesn't jump.
+    """
+
+    if instruction.startswith('@') or instruction.startswith('(') or ';' in instruction:
+        return False
+
+    return 'A' not in instruction.split('=', 1)[0]
+
+def _steps(count):
+    """
+    Returns list of A=A+1 instructions to step A forward count times.
+    """
+
+    return ['A=A+1'] * count
+
+def rule_decrement_sp(instructions, i):
+    """
+    M=M-1, A=M => AM=M-1
+    """
+
+    if instructions[i] == 'M=M-1' and instructions[i+1:i+2] == ['A=M']:
+        return 2, ['AM=M-1']
+
+def rule_fold_register(instructions, i):
+    """
+    @index, D=A, @Rx, D=D+A | A=D+A => @R(x+index), D=A | A=A
+    Resolves base address plus index for temp and pointer segments, and the
+    registers saved by call.
+    """
+
+    window = instructions[i:i+4]
+    if len(window) < 4 or not _is_index(window[0]) or window[1] != 'D=A':
+        return None
+
+    match = _REGISTER_REGEX.match(window[2])
+    if not match or window[3] not in ['D=D+A', 'A=D+A']:
+        return None
+
+    register = int(match.group(1)) + int(window[0][1:])
+    if register > 15:
+        return None
+
+    if window[3] == 'D=D+A':
+        return 4, ['@R' + str(register), 'D=A']
+
+    #A=D+A is always followed by D=M in push templates, so D is dead here
+    if instructions[i+4:i+5] == ['D=M']:
+        return 5, ['@R' + str(register), 'D=M']
+
+def rule_pop_address(instructions, i):
+    """
+    @addr, D=A, @R13, M=D, @SP, AM=M-1, D=M, @R13, A=M, M=D => @SP, AM=M-1, D=M, @addr, M=D
+    Pops straight into a fixed address, such as a static, temp or pointer variable.
+    """
+
+    window = instructions[i:i+10]
+    if (len(window) == 10 and window[0].startswith('@') and window[0] not in ['@SP', '@R13']
+        and window[1:] == ['D=A', '@R13', 'M=D', '@SP', 'AM=M-1', 'D=M', '@R13', 'A=M', 'M=D']):
+        return 10, ['@SP', 'AM=M-1', 'D=M', window[0], 'M=D']
+
+def rule_pop_segment(instructions, i):
+    """
+    @index, D=A, @seg, D=D+M, @R13, M=D, @SP, AM=M-1, D=M, @R13, A=M, M=D
+    => @SP, AM=M-1, D=M, @seg, A=M, (A=A+1)*index, M=D
+    Pops into local, argument, this or that, when index is small.
+    """
+
+    window = instructions[i:i+12]
+    if (len(window) == 12 and _is_index(window[0]) and int(window[0][1:]) <= max_steps
+        and window[1] == 'D=A' and window[2][1:] in pointer_segments
+        and window[3:] == ['D=D+M', '@R13', 'M=D', '@SP', 'AM=M-1', 'D=M', '@R13', 'A=M', 'M=D']):
+        return 12, ['@SP', 'AM=M-1', 'D=M', window[2], 'A=M'] + _steps(int(window[0][1:])) + ['M=D']
+
+def rule_push_segment(instructions, i):
+    """
+    @index, D=A, @seg, A=D+M, D=M => @seg, A=M, (A=A+1)*index, D=M
+    Pushes from local, argument, this or that, when index is small.
+    """
+
+    window = instructions[i:i+5]
+    if (len(window) == 5 and _is_index(window[0]) and int(window[0][1:]) <= 1
+        and window[1] == 'D=A' and window[2][1:] in pointer_segments
+        and window[3:] == ['A=D+M', 'D=M']):
+        return 5, [window[2], 'A=M'] + _steps(int(window[0][1:])) + ['D=M']
+
+def rule_small_constant(instructions, i):
+    """
+    @0 | @1, D=A, @x => D=0 | D=1, @x
+    """
+
+    window = instructions[i:i+3]
+    if (len(window) == 3 and window[0] in ['@0', '@1'] and window[1] == 'D=A'
+        and window[2].startswith('@')):
+        return 2, ['D=' + window[0][1:]]
+
+def rule_stack_round_trip(instructions, i):
+    """
+    @SP, A=M, M=D, @SP, M=M+1, @SP, AM=M-1, D=M => @SP, A=M
+    A push that is popped right away. The value is still in D, and the write
+    above the top of the stack is never read.
+    """
+
+    if instructions[i:i+8] == ['@SP', 'A=M', 'M=D', '@SP', 'M=M+1', '@SP', 'AM=M-1', 'D=M']:
+        return 8, ['@SP', 'A=M']
+
+def rule_top_of_stack(instructions, i):
+    """
+    A=M, A=A-1 => A=M-1
+    """
+
+    if instructions[i] == 'A=M' and instructions[i+1:i+2] == ['A=A-1']:
+        return 2, ['A=M-1']
+
+def rule_push_store(instructions, i):
+    """
+    @SP, A=M, M=D, @SP, M=M+1, @x => @SP, AM=M+1, A=A-1, M=D, @x
+    """
+
+    window = instructions[i:i+6]
+    if (len(window) == 6 and window[:5] == ['@SP', 'A=M', 'M=D', '@SP', 'M=M+1']
+        and window[5].startswith('@')):
+        return 5, ['@SP', 'AM=M+1', 'A=A-1', 'M=D']
+
+def rule_dead_address(instructions, i):
+    """
+    @x | A=..., @y => @y
+    A is set and then set again before it's used.
+    """
+
+    if _sets_only_a(instructions[i]) and instructions[i+1:i+2] and instructions[i+1].startswith('@'):
+        return 1, []
+
+def rule_reload_address(instructions, i):
+    """
+    @x, (instruction that keeps A), @x => @x, (instruction that keeps A)
+    """
+
+    window = instructions[i:i+3]
+    if (len(window) == 3 and window[0].startswith('@') and window[0] == window[2]
+        and _keeps_a(window[1])):
+        return 3, window[:2]
+
+#rules that rewrite the templates of VM commands, and rules that clean up what's left, which
+#run after the others, as they remove @ instructions that the others match on
+template_rules = [
+    rule_decrement_sp,
+    rule_fold_register,
+    rule_pop_address,
+    rule_pop_segment,
+    rule_push_segment,
+    rule_small_constant,
+    rule_stack_round_trip,
+    rule_top_of_stack,
+    rule_push_store
+]
+
+cleanup_rules = [
+    rule_dead_address,
+    rule_reload_address
+]
+
+rules = template_rules + cleanup_rules
+
+#test of the first two instructions of a window for each rule, which has to pass for the rule
+#to match, so apply_rules() only calls the rules that can match at each position
+rule_starts = {
+    rule_decrement_sp: lambda first, second: first == 'M=M-1' and second == 'A=M',
+    rule_fold_register: lambda first, second: second == 'D=A' and _is_index(first),
+    rule_pop_address: lambda first, second: second == 'D=A' and first.startswith('@'),
+    rule_pop_segment: lambda first, second: second == 'D=A' and _is_index(first),
+    rule_push_segment: lambda first, second: second == 'D=A' and _is_index(first),
+    rule_small_constant: lambda first, second: second == 'D=A' and first in ['@0', '@1'],
+    rule_stack_round_trip: lambda first, second: first == '@SP' and second == 'A=M',
+    rule_top_of_stack: lambda first, second: first == 'A=M' and second == 'A=A-1',
+    rule_push_store: lambda first, second: first == '@SP' and second == 'A=M',
+    rule_dead_address: lambda first, second: second.startswith('@') and _sets_only_a(first),
+    rule_reload_address: lambda first, second: first.startswith('@') and _keeps_a(second)
+}
+
+def apply_rule(instructions, rule):
+    """
+    Slides rule over list of instructions and returns (new list, number of rewrites).
+    """
+
+    return apply_rules(instructions, [rule])
+
+def apply_rules(instructions, rules=rules):
+    """
+    Slides rules over list of instructions in one sweep, and returns (new list, number of
+    rewrites), where none of the rules match anymore. At each position, the rules that can
+    match, by rule_starts, are tried in order, on a window of the next window_width
+    instructions.
+
+    The sweep runs from the last instruction to the first, so the code after a position is
+    already rewritten as far as it goes when rules are tried there, and a rule that needs
+    another rule's rewrite further on sees it. Rewritten code goes back in front of what's
+    left of the sweep, so it's matched again, and the code before it, which is the only
+    other place a new match can start, is still ahead of the sweep.
+    """
+
+    #instructions left to sweep, last one on top, and instructions swept, in reverse order
+    pending = list(instructions)
+    swept = []
+    rewrites = 0
+    last = -window_width
+
+    #rules that can match after each pair of first two instructions
+    candidates = {}
+    get_candidates = candidates.get
+    pop = pending.pop
+    append = swept.append
+
+    while pending:
+        instruction = pop()
+        pair = instruction, swept[-1] if swept else ''
+
+        to_try = get_candidates(pair)
+        if to_try is None:
+            to_try = candidates[pair] = [rule for rule in rules
+                                         if rule not in rule_starts or rule_starts[rule](*pair)]
+
+        match = None
+        if to_try:
+            window = [instruction] + swept[:last:-1]
+            for rule in to_try:
+                match = rule(window, 0)
+                if match:
+                    break
+
+        if not match:
+            append(instruction)
+            continue
+
+        consumed, replacement = match
+        rewrites += 1
+        if consumed > 1:
+            del swept[1 - consumed:]
+        pending.extend(replacement)
+
+    swept.reverse()
+    return swept, rewrites
+
+def optimize(code):
+    """
+    Accepts assembly code as a string, and runs all rules over it until none of them
+    match anymore. Returns optimized code without comments, with ROM size before and after.
+    Template rules run first, over the whole code, and then the cleanup rules, which can
+    make new matches for the template rules, so both run again until cleanup changes nothing.
+    """
+
+    instructions = get_instructions(code)
+    before = count_instructions(instructions)
+
+    rewrites = True
+    while rewrites:
+        instructions = apply_rules(instructions, template_rules)[0]
+        instructions, rewrites = apply_rules(instructions, cleanup_rules)
+
+    after = count_instructions(instructions)
+    return '\n'.join(instructions) + '\n', before, after
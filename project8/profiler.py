@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+
+"""
+Profiler that runs a translated program on the Hack emulator, and reports the cycles used by
+each VM function.
+
+FROM vm_translator DIRECTORY:
+-prompt> python profiler.py Xxx -n 20000000
+-prompt> python profiler.py Xxx -n 20000000 -t --collapsed Xxx.folded
+-prompt> python profiler.py Xxx.asm --function Math.multiply --function Memory.alloc
+
+Where Xxx is a directory of .vm files, which is translated in memory with bootstrap code,
+and with the translator options given, or Xxx.asm is a program that's already translated.
+
+CodeWriter writes a label for each function, Foo.bar, and a label for each return address,
+Foo.bar$return.n. Functions are only entered by a jump from a call, and return addresses are
+only reached by a jump from a return, so the profiler runs the emulator until a jump lands on
+one of these labels, and then pushes the function called, or pops back to the function named
+in the return address. Every cycle in between is charged to the function on top of the call
+stack, including cycles in shared call, return and comparison routines.
+
+For each function, the report has:
+- calls: times it was called
+- exclusive: cycles run in the function itself
+- inclusive: cycles run in the function and everything it called, counted once for
+  recursive calls
+
+Cycles that run before Sys.init is called are charged to bootstrap. Collapsed stacks have one
+line for each call stack, with its frames separated by semicolons and its exclusive cycles,
+such as bootstrap;Sys.init;Main.main;Math.multiply 1234, which flamegraph.pl reads.
+"""
+
+import os, bisect, argparse
+from collections import Counter
+
+#imported as part of a package, or run as a script from this directory
+if __package__:
+    from . import VMTranslator
+    from . import hack_assembler
+    from . import hack_emulator
+    from . import peephole
+
+else:
+    import VMTranslator
+    import hack_assembler
+    import hack_emulator
+    import peephole
+
+
+#name of the frame at the bottom of the call stack, before any function is called
+root_frame = 'bootstrap'
+
+
+class Profiler:
+    """
+    Runs a program on the Hack emulator and counts cycles and calls of each VM function.
+    """
+
+    def __init__(self, code):
+        """
+        Accepts assembly code of a program, as written by CodeWriter, and assembles it.
+        """
+
+        words, symbols = hack_assembler.assemble(code)
+        labels = hack_assembler.get_labels(peephole.get_instructions(code))
+        self.emulator = hack_emulator.Emulator(words)
+
+        #ROM addresses where functions start, and return addresses with the function returned
+        #to, including those that are also a label in the function, as when a call is followed
+        #by a VM label. Only return addresses where a function or shared routine starts are
+        #left out, as the return address of the bootstrap code is where the next one starts
+        self._entries = {address: name for name, address in labels.items() if '$' not in name}
+        functions = set(self._entries.values())
+        others = {address for name, address in labels.items()
+                  if '$return.' not in name and name.split('$')[0] not in functions}
+        self._returns = {address: name.split('$')[0] for name, address in labels.items()
+                         if '$return.' in name and address not in others}
+        self._breakpoints = frozenset(self._entries) | frozenset(self._returns)
+
+        #function start addresses in order, for function_at()
+        self._starts = sorted(self._entries)
+
+        self.calls = Counter()
+        self.exclusive = Counter()
+        self.stacks = Counter()
+        self._inclusive = Counter()
+
+        #call stack of function names, cycle count when each outermost call of a function
+        #started, or None for recursive calls, and number of active calls of each function
+        self._stack = [root_frame]
+        self._started = [0]
+        self._active = Counter({root_frame: 1})
+
+    def __str__(self):
+        to_print =  '   Call stack: ' + ';'.join(self._stack) + '\n'
+        to_print += str(self.emulator)
+        return to_print
+
+    def function_at(self, address):
+        """
+        Returns name of function whose code is at ROM address, or root_frame for code
+        before the first function.
+        """
+
+        index = bisect.bisect_right(self._starts, address)
+        return self._entries[self._starts[index - 1]] if index else root_frame
+
+    def _enter(self, function_name):
+        """
+        Pushes function onto call stack.
+        """
+
+        self.calls[function_name] += 1
+        self._started.append(None if self._active[function_name] else self.emulator.cycles)
+        self._active[function_name] += 1
+        self._stack.append(function_name)
+
+    def _leave(self, function_name):
+        """
+        Pops call stack back to function returned to, or to root_frame if function isn't
+        on the stack, which is the case for the return address of the bootstrap code.
+        """
+
+        while len(self._stack) > 1:
+            name = self._stack.pop()
+            started = self._started.pop()
+            self._active[name] -= 1
+
+            if started is not None:
+                self._inclusive[name] += self.emulator.cycles - started
+
+            if self._stack[-1] == function_name:
+                break
+
+    def run(self, max_cycles=None):
+        """
+        Runs program until it halts, or for max_cycles cycles, and counts cycles and calls.
+        Can be called again to run on. Returns number of cycles run.
+        """
+
+        emulator = self.emulator
+        total = 0
+
+        while not emulator.halted and (max_cycles is None or total < max_cycles):
+            count = emulator.run(None if max_cycles is None else max_cycles - total, self._breakpoints)
+            total += count
+
+            self.exclusive[self._stack[-1]] += count
+            self.stacks[tuple(self._stack)] += count
+
+            #the run stops on a breakpoint, or on max_cycles, and either way it's only
+            #possible to be on a breakpoint by jumping to it
+            pc = emulator.pc
+            if not count or emulator.halted:
+                continue
+
+            if pc in self._entries:
+                self._enter(self._entries[pc])
+            elif pc in self._returns:
+                self._leave(self._returns[pc])
+
+        return total
+
+    def get_inclusive(self):
+        """
+        Returns Counter of inclusive cycles of each function, including calls that
+        haven't returned yet.
+        """
+
+        inclusive = Counter(self._inclusive)
+        for name, started in zip(self._stack, self._started):
+            if started is not None:
+                inclusive[name] += self.emulator.cycles - started
+
+        return inclusive
+
+    def format_report(self, functions=None, top=20):
+        """
+        Returns report of calls, exclusive and inclusive cycles of each function in functions,
+        or the top functions by exclusive cycles, as a string.
+        """
+
+        inclusive = self.get_inclusive()
+        total = self.emulator.cycles or 1
+
+        if functions is None:
+            functions = [name for name, cycles in self.exclusive.most_common(top)]
+
+        report = 'Cycles run: ' + str(self.emulator.cycles) + '\n\n'
+        report += '{:<36}{:>10}{:>14}{:>8}{:>14}{:>8}\n'.format(
+                  'function', 'calls', 'exclusive', '%', 'inclusive', '%')
+
+        for name in functions:
+            report += '{:<36}{:>10}{:>14}{:>8.1f}{:>14}{:>8.1f}\n'.format(
+                      name, self.calls[name], self.exclusive[name], 100 * self.exclusive[name] / total,
+                      inclusive[name], 100 * inclusive[name] / total)
+
+        return report
+
+    def get_collapsed(self):
+        """
+        Returns collapsed stacks, one line for each call stack and its exclusive cycles,
+        as a string.
+        """
+
+        return ''.join(';'.join(stack) + ' ' + str(cycles) + '\n'
+                       for stack, cycles in sorted(self.stacks.items()) if cycles)
+
+
+def read_program(to_profile, **options):
+    """
+    Accepts .asm file, or directory of .vm files and VMTranslator.translate() options, and
+    returns assembly code of program.
+    """
+
+    if to_profile.endswith('.asm'):
+        with open(to_profile) as f:
+            return f.read()
+
+    sources = {}
+    for file in sorted(os.listdir(to_profile)):
+        if file.endswith('.vm'):
+            with open(os.path.join(to_profile, file)) as f:
+                sources[file] = f.read()
+
+    return VMTranslator.translate(sources, **options)
+
+def main():
+    """
+    Profiles program, prints report, and writes collapsed stacks if asked to.
+    """
+
+    parser = argparse.ArgumentParser(description='Profiles cycles of each VM function on the Hack emulator.')
+    parser.add_argument('to_profile', help='Xxx.asm file, or Xxx directory of .vm files')
+    parser.add_argument('-n', '--cycles', type=int, default=None,
+                        help='most cycles to run, default is to run until program halts')
+    parser.add_argument('--function', action='append', default=None,
+                        help='function to report, can be given more than once (default: top functions)')
+    parser.add_argument('--top', type=int, default=20, help='number of top functions to report')
+    parser.add_argument('--collapsed', default=None, help='file to write collapsed stacks to')
+    parser.add_argument('-O', '--optimize', action='store_true', help='run peephole optimization pass')
+    parser.add_argument('-c', '--compact', action='store_true', help='use shared call and return routines')
+    parser.add_argument('-t', '--top-of-stack', action='store_true', help='hold top of stack in D register')
+    parser.add_argument('-f', '--fold', action='store_true', help='fold constants in VM commands')
+    parser.add_argument('-s', '--shared-compare', action='store_true', help='use shared eq, gt and lt routines')
+    args = parser.parse_args()
+
+    code = read_program(args.to_profile, optimize=args.optimize, fold=args.fold, compact=args.compact,
+                        top_of_stack=args.top_of_stack, shared_compare=args.shared_compare)
+
+    profiler = Profiler(code)
+    profiler.run(args.cycles)
+
+    print('\nProfiled: ' + args.to_profile + '\n')
+    print(profiler.format_report(args.function, args.top))
+
+    if args.collapsed:
+        with open(args.collapsed, 'w') as f:
+            f.write(profiler.get_collapsed())
+
+        print('Collapsed stacks written to: \n\t' + args.collapsed)
+
+if __name__ == '__main__':
+    main()
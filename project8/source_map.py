@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+
+"""
+This class maps each ROM address of a translated program back to the VM command it was
+translated from, so profilers, debuggers and coverage tools can find the .vm file, line and
+function of an instruction, without parsing comments.
+
+CodeWriter adds a record to the map each time it writes code, with the number of instructions
+in the code, which is counted with str.count(), without splitting it into lines. Code that
+isn't translated from a VM command, such as bootstrap code and shared routines, has no file,
+line, function or command index. The map is only valid for the code as CodeWriter writes it,
+and not after the peephole pass, which moves instructions.
+
+The map is saved as JSON, with one record for each VM command, not each ROM address, and
+lookup() finds the record of an address in O(1), with an array of record indexes that's built
+the first time it's called.
+"""
+
+import re, json
+from array import array
+
+
+#number of the format of saved maps
+version = 1
+
+#matches the first character of each line that's an instruction, not a label, comment or blank
+_INSTRUCTION_REGEX = re.compile(r'^[^(/\n]', re.M)
+
+
+def count_instructions(code):
+    """
+    Returns number of lines of assembly code that are instructions, not labels, comments or
+    blank lines. Lines that start with something else are counted from the number of newlines,
+    which is faster than matching each line, unless blank lines follow each other, as
+    str.count() doesn't count overlapping matches.
+    """
+
+    if '\n\n\n' in code:
+        return len(_INSTRUCTION_REGEX.findall(code))
+
+    lines = code.count('\n') + (not code.endswith('\n'))
+    skipped = code.count('\n(') + code.count('\n/') + code.count('\n\n') + (code[:1] in ('(', '/', '\n'))
+    return lines - skipped if code else 0
+
+
+class SourceMap:
+    """
+    Records which VM command each ROM address of a translated program comes from.
+    """
+
+    def __init__(self):
+        """
+        Creates empty map, which starts at ROM address 0.
+        """
+
+        self.files = []
+        self.functions = []
+        self._file_ids = {}
+        self._function_ids = {}
+
+        #(address, count, file id, line number, function id, command index) of each record
+        self.records = []
+        self.size = 0
+        self._record_at = None
+
+    def __str__(self):
+        to_print =  '      Files: ' + str(len(self.files)) + '\n'
+        to_print += '  Functions: ' + str(len(self.functions)) + '\n'
+        to_print += '    Records: ' + str(len(self.records)) + '\n'
+        to_print += '   ROM size: ' + str(self.size) + '\n'
+        return to_print
+
+    def _add_name(self, names, ids, name):
+        """
+        Adds name to list of names, unless it's None, and returns its index.
+        """
+
+        if name is None:
+            return None
+
+        ids[name] = len(names)
+        names.append(name)
+        return ids[name]
+
+    def add(self, code, file=None, line_no=None, function=None, index=None):
+        """
+        Accepts assembly code that's written next, and the name of the .vm file, without .vm,
+        line number, function name and index in its file of the VM command it's translated
+        from. Maps its instructions to the next ROM addresses. Returns number of instructions.
+        """
+
+        count = count_instructions(code)
+        if not count:
+            return 0
+
+        file_id = self._file_ids.get(file)
+        if file_id is None:
+            file_id = self._add_name(self.files, self._file_ids, file)
+
+        function_id = self._function_ids.get(function)
+        if function_id is None:
+            function_id = self._add_name(self.functions, self._function_ids, function)
+
+        self.records.append((self.size, count, file_id, line_no, function_id, index))
+        self.size += count
+        self._record_at = None
+        return count
+
+    def lookup(self, address):
+        """
+        Returns (file, line_no, function, index) of the VM command that the instruction at
+        ROM address was translated from, with None for what's unknown.
+        """
+
+        if self._record_at is None:
+            self._record_at = array('I')
+            for record_id, record in enumerate(self.records):
+                self._record_at.extend([record_id] * record[1])
+
+        start, count, file_id, line_no, function_id, index = self.records[self._record_at[address]]
+        file = None if file_id is None else self.files[file_id]
+        function = None if function_id is None else self.functions[function_id]
+        return file, line_no, function, index
+
+    def to_json(self):
+        """
+        Returns map as a JSON string.
+        """
+
+        return json.dumps({
+            'version': version,
+            'files': self.files,
+            'functions': self.functions,
+            'records': self.records
+        }, separators=(',', ':'))
+
+    def write(self, fname):
+        """
+        Saves map to JSON file.
+        """
+
+        with open(fname, 'w') as f:
+            f.write(self.to_json())
+
+def read_source_map(fname):
+    """
+    Reads map saved by SourceMap.write() and returns it as a SourceMap.
+    """
+
+    with open(fname) as f:
+        saved = json.load(f)
+
+    if saved.get('version') != version:
+        raise ValueError('unknown source map version in ' + fname)
+
+    source_map = SourceMap()
+    source_map.files = saved['files']
+    source_map.functions = saved['functions']
+    source_map._file_ids = {name: name_id for name_id, name in enumerate(source_map.files)}
+    source_map._function_ids = {name: name_id for name_id, name in enumerate(source_map.functions)}
+    source_map.records = [tuple(record) for record in saved['records']]
+    source_map.size = sum(record[1] for record in source_map.records)
+    return source_map
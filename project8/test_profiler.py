@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+
+"""
+Tests of how Profiler follows calls and returns, when a call is followed right away by a VM
+label, so its return address has the same ROM address as the label.
+"""
+
+import unittest
+
+import VMTranslator
+import profiler
+
+
+sources = {
+    'Sys.vm': 'function Sys.init 0\n'
+              'call Main.f 0\n'
+              'label L\n'
+              'pop temp 0\n'
+              'call Main.f 0\n'
+              'label M\n'
+              'pop temp 0\n'
+              'label END\n'
+              'goto END\n',
+    'Main.vm': 'function Main.f 0\n'
+               'push constant 7\n'
+               'return\n'
+}
+
+
+class CallFollowedByLabelTest(unittest.TestCase):
+    """
+    Return to a call followed by a label pops the call stack.
+    """
+
+    def check_returns(self, **options):
+        """
+        Profiles sources translated with options, and checks that each call to Main.f returned.
+        """
+
+        profile = profiler.Profiler(VMTranslator.translate(sources, **options))
+        profile.run(2000)
+
+        self.assertEqual(profile.calls['Main.f'], 2)
+        self.assertEqual(profile._stack, [profiler.root_frame, 'Sys.init'])
+        self.assertEqual(set(profile.stacks), {(profiler.root_frame,),
+                                               (profiler.root_frame, 'Sys.init'),
+                                               (profiler.root_frame, 'Sys.init', 'Main.f')})
+
+        inclusive = profile.get_inclusive()
+        self.assertEqual(inclusive['Main.f'], profile.exclusive['Main.f'])
+
+    def test_call_followed_by_label(self):
+        self.check_returns()
+
+    def test_compact(self):
+        self.check_returns(compact=True)
+
+    def test_top_of_stack(self):
+        self.check_returns(compact=True, top_of_stack=True, shared_compare=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
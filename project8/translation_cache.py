@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+
+"""
+This class keeps an on-disk cache of translated .vm files, so only files that changed are
+translated again on the next build.
+
+CodeWriter.set_file_name() resets labels and counters for each file, so the translation of
+one file doesn't depend on any other file. Each file's translation is stored as a fragment,
+keyed by a hash of its content, its name, which static variables are named after, the
+translator options and the translator version. The version is a hash of the translator's own
+source code, so fragments from an older translator are never reused.
+"""
+
+import os, json, time, hashlib
+
+#seconds after which a temporary fragment file is left over from a build that was stopped
+stale_temp_age = 3600
+
+
+class TranslationCache:
+    """
+    Stores assembly code fragments in a directory, one file for each fragment. Each file has 
+    vm_optimizer statistics as JSON on its first line, and assembly code after it.
+    """
+
+    def __init__(self, cache_dir, version, max_size=256 << 20):
+        """
+        Accepts cache directory, which is created if it doesn't exist, translator version
+        string, and maximum size of cache in bytes. Least recently used fragments are
+        removed by evict() when the cache is bigger than max_size.
+        """
+
+        self._cache_dir = cache_dir
+        self._version = version
+        self._max_size = max_size
+        self._hits = 0
+        self._misses = 0
+
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def __str__(self):
+        to_print =  '  Cache directory: ' + self._cache_dir + '\n'
+        to_print += '       Cache hits: ' + str(self._hits) + '\n'
+        to_print += '     Cache misses: ' + str(self._misses) + '\n'
+        return to_print
+
+    def get_key(self, name, content, options):
+        """
+        Accepts name of .vm file, its content as a string or bytes, and dictionary of
+        translator options. Returns key of its fragment.
+        """
+
+        if isinstance(content, str):
+            content = content.encode('utf-8')
+
+        header = json.dumps([self._version, name.replace('.vm', ''), sorted(options.items())])
+
+        key = hashlib.sha256(header.encode('utf-8'))
+        key.update(b'\0')
+        key.update(content)
+        return key.hexdigest()
+
+    def _get_path(self, key):
+        """
+        Returns path of fragment file for key.
+        """
+
+        return os.path.join(self._cache_dir, key + '.asm')
+
+    def get(self, key):
+        """
+        Returns (code, stats) tuple stored for key, where stats is a dictionary of
+        vm_optimizer statistics, or None if key isn't cached.
+        """
+
+        path = self._get_path(key)
+
+        try:
+            with open(path) as f:
+                stats = json.loads(f.readline())
+                code = f.read()
+
+        except (OSError, ValueError):
+            self._misses += 1
+            return None
+
+        #mark fragment as recently used, for evict(), which only changes what is evicted first
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+        self._hits += 1
+        return code, stats
+
+    def put(self, key, code, stats=None):
+        """
+        Stores code and dictionary of vm_optimizer statistics for key. Fragment is written to
+        a temporary file first, so a build that's stopped halfway never leaves a broken fragment.
+        """
+
+        path = self._get_path(key)
+        temp_path = path + '.' + str(os.getpid()) + '.tmp'
+
+        try:
+            with open(temp_path, 'w') as f:
+                f.write(json.dumps(dict(stats or {})) + '\n')
+                f.write(code)
+
+            os.replace(temp_path, path)
+
+        except OSError:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    def evict(self):
+        """
+        Removes least recently used fragments until cache is no bigger than max size, and
+        temporary files that a build stopped halfway through put() left behind. Returns number
+        of fragments removed.
+        """
+
+        fragments = []
+        size = 0
+        stale = time.time() - stale_temp_age
+
+        for entry in os.scandir(self._cache_dir):
+            if entry.name.endswith('.asm'):
+                status = entry.stat()
+                fragments.append((status.st_mtime, status.st_size, entry.path))
+                size += status.st_size
+
+            #a temporary file that's recent may still be written by another build
+            elif entry.name.endswith('.tmp') and entry.stat().st_mtime < stale:
+                os.remove(entry.path)
+
+        fragments.sort()
+        removed = 0
+
+        for mtime, fragment_size, path in fragments:
+            if size <= self._max_size:
+                break
+
+            os.remove(path)
+            size -= fragment_size
+            removed += 1
+
+        return removed
+
+def get_version(modules):
+    """
+    Accepts list of translator modules and returns hash of their source code,
+    which changes whenever the translator does.
+    """
+
+    version = hashlib.sha256()
+
+    for module in modules:
+        with open(module.__file__, 'rb') as f:
+            version.update(f.read())
+
+    return version.hexdigest()
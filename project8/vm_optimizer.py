@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+
+"""
+Functions that run an optimization pass over VM commands, before CodeWriter translates them.
+
+The pass folds arithmetic, comparison and logic commands whose operands are constants, such as
+push constant 3, push constant 4, add => push constant 7, and removes identities, such as
+push constant 0, add or neg, neg. The Jack compiler writes true as push constant 0, not, which
+is folded into push constant -1. The VM language has no negative constants, so CodeWriter
+translates them as @n, D=-A. They only ever exist between this pass and CodeWriter.
+
+Rules only match commands that are next to each other, and labels, calls and all other
+commands are never part of a match, so code that's entered by a jump is never rewritten across.
+Folded values are the same as the Hack code computes, in 16 bits, with eq, gt and lt testing
+the sign of x-y like the compare template does.
+"""
+
+from collections import Counter
+
+
+#VM commands that can be rewritten, besides push constant
+binary_commands = ['add', 'sub', 'and', 'or', 'eq', 'gt', 'lt']
+unary_commands = ['neg', 'not']
+
+#commands that leave the value under them as it is when they follow push constant n
+identities = {
+    (0, 'add'),
+    (0, 'sub'),
+    (0, 'or'),
+    (-1, 'and')
+}
+
+#largest value that can be pushed with one command, in either sign
+max_constant = 32767
+
+
+def _to_signed(value):
+    """
+    Returns 16-bit value as a signed integer.
+    """
+
+    value &= 0xffff
+    return value - 0x10000 if value & 0x8000 else value
+
+def _get_constant(command):
+    """
+    Returns value of a push constant command as an integer, or None if it's any other command.
+    """
+
+    command_type, args, line_no = command
+    if command_type == 'C_PUSH' and args[1] == 'constant':
+        return int(args[2])
+
+    return None
+
+def _push_constant(value, line_no):
+    """
+    Returns push constant command record for value, or None if value can't be pushed
+    with one command.
+    """
+
+    if abs(value) > max_constant:
+        return None
+
+    return ('C_PUSH', ['push', 'constant', str(value)], line_no)
+
+def compute(command, x, y=None):
+    """
+    Accepts arithmetic or logic command and its operands, as integers, and returns
+    result as a signed 16-bit integer.
+    """
+
+    if command == 'neg':
+        return _to_signed(-x)
+
+    if command == 'not':
+        return _to_signed(~x)
+
+    if command == 'add':
+        return _to_signed(x + y)
+
+    if command == 'sub':
+        return _to_signed(x - y)
+
+    if command == 'and':
+        return _to_signed(x & y)
+
+    if command == 'or':
+        return _to_signed(x | y)
+
+    difference = _to_signed(x - y)
+
+    if command == 'eq':
+        return -1 if difference == 0 else 0
+
+    if command == 'gt':
+        return -1 if difference > 0 else 0
+
+    #if command == 'lt'
+    return -1 if difference < 0 else 0
+
+def rule_fold_binary(pending):
+    """
+    push constant x, push constant y, command => push constant (x command y)
+    """
+
+    if len(pending) < 3 or pending[-1][1][0] not in binary_commands:
+        return None
+
+    x = _get_constant(pending[-3])
+    y = _get_constant(pending[-2])
+    if x is None or y is None:
+        return None
+
+    folded = _push_constant(compute(pending[-1][1][0], x, y), pending[-3][2])
+    if folded:
+        return 3, [folded]
+
+def rule_fold_unary(pending):
+    """
+    push constant x, command => push constant (command x)
+    """
+
+    if len(pending) < 2 or pending[-1][1][0] not in unary_commands:
+        return None
+
+    x = _get_constant(pending[-2])
+    if x is None:
+        return None
+
+    folded = _push_constant(compute(pending[-1][1][0], x), pending[-2][2])
+    if folded:
+        return 2, [folded]
+
+def rule_identity(pending):
+    """
+    push constant 0, add | sub | or => (nothing)
+    push constant -1, and => (nothing)
+    """
+
+    if len(pending) < 2:
+        return None
+
+    if (_get_constant(pending[-2]), pending[-1][1][0]) in identities:
+        return 2, []
+
+def rule_double_unary(pending):
+    """
+    neg, neg | not, not => (nothing)
+    """
+
+    if (len(pending) >= 2 and pending[-1][1][0] in unary_commands
+        and pending[-2][1] == pending[-1][1]):
+        return 2, []
+
+#rules and the statistic each of them counts
+rules = [
+    (rule_fold_binary, 'folded'),
+    (rule_fold_unary, 'folded'),
+    (rule_identity, 'simplified'),
+    (rule_double_unary, 'simplified')
+]
+
+def _can_match(command):
+    """
+    Checks if command can be part of a rule's match.
+    """
+
+    command_type, args, line_no = command
+    if command_type == 'C_ARITHMETIC':
+        return True
+
+    return command_type == 'C_PUSH' and args[1] == 'constant'
+
+def fold_commands(commands, stats=None):
+    """
+    Generator that accepts (command_type, args, line_no) records from vm_parser, and yields
+    them with constants folded and identities removed. Commands that can be part of a match
+    are held back, until a command that can't be arrives, and all other commands pass
+    straight through.
+
+    If stats is a Counter, it's updated with number of commands
+    'before' and 'after' the pass, and number of rewrites that 'folded' constants and that
+    'simplified' identities.
+    """
+
+    if stats is None:
+        stats = Counter()
+
+    pending = []
+
+    for command in commands:
+        stats['before'] += 1
+
+        if not _can_match(command):
+            stats['after'] += len(pending) + 1
+            yield from pending
+            pending = []
+            yield command
+            continue
+
+        pending.append(command)
+
+        rewritten = True
+        while rewritten:
+            rewritten = False
+            for rule, statistic in rules:
+                match = rule(pending)
+
+                if match:
+                    consumed, replacement = match
+                    pending[-consumed:] = replacement
+                    stats[statistic] += 1
+                    rewritten = True
+                    break
+
+    stats['after'] += len(pending)
+    yield from pending
@@ -4,21 +4,60 @@
 This class handles parsing of a single .vm file
 """
 
-import os
-
-if os.getcwd().endswith('VMTranslator'):
-    from vm_translator import assembly_code as asm
+#imported as part of a package, or run as a script from this directory
+if __package__:
+    from . import assembly_code as asm
     
 else:
     import assembly_code as asm
     
 
+#maps the first word of each VM command to its command type 
+command_type_table = {
+    'pop': 'C_POP',
+    'push': 'C_PUSH',            
+    'label': 'C_LABEL',
+    'goto': 'C_GOTO',
+    'if-goto': 'C_IF',
+    'function': 'C_FUNCTION',
+    'call': 'C_CALL', 
+    'return': 'C_RETURN'                  
+}
+command_type_table.update({command: 'C_ARITHMETIC' for command in asm.math_table}) 
+
+
+def parse_lines(lines):
+    """
+    Generator that accepts VM code as any iterable of lines, such as an open file or 
+    a list of strings. Removes white space and comments, and yields each VM command as 
+    a pre-classified record: (command_type, args, line_no), where line_no starts at 1. 
+    Lines that don't start with a known VM command are skipped.
+    """
+    
+    for line_no, line in enumerate(lines, 1):
+        args = line.split('//', 1)[0].split()
+        
+        if args and args[0] in command_type_table:
+            yield command_type_table[args[0]], args, line_no
+
+def read_commands(fname):
+    """
+    Generator that reads a .vm file one line at a time, in a single pass and with constant memory, 
+    and yields each VM command as a record from parse_lines().
+    """
+    
+    with open(fname) as f:
+        yield from parse_lines(f)
+    
+
 class Parser:
     """
     Encapsulates access to input code. 
     
     Reads a VM command, parses it and provides convenient access
     to its components. In addition, removes all white space and comments. 
+    
+    This is a thin wrapper over read_commands(), which does the actual reading and parsing.
     """
     
     def __init__(self, fname):
@@ -27,77 +66,41 @@ class Parser:
         """
         
         self._file_path = fname  
-        with open(fname) as f:
-            self._content = [line.strip() for line in f.readlines()]            
-                  
-        self._current_command = 0                
-        self._next_command = 0
-        self._current_args = []
-        
-        self._math_commands = list(asm.math_table.keys()) 
-        self._command_type_table = {
-            'pop': 'C_POP',
-            'push': 'C_PUSH',            
-            'label': 'C_LABEL',
-            'goto': 'C_GOTO',
-            'if-goto': 'C_IF',
-            'function': 'C_FUNCTION',
-            'call': 'C_CALL', 
-            'return': 'C_RETURN'                  
-        }
-        self._command_types = list(self._command_type_table.keys()) 
+        self._commands = read_commands(fname)
+        self._current = None                
+        self._next = None
    
     def __str__(self):        
         to_print =  '           Reading file: ' + self._file_path + '\n'
-        to_print += '    Current line number: ' + str(self._current_command) + '\n'
-        to_print += '           Current line: ' + self._content[self._current_command] + '\n'
-        to_print += '      Next command line: ' + str(self._next_command) + '\n'
-        to_print += '           Next command: ' + self._content[self._next_command] + '\n' 
+        if self._current:
+            to_print += '    Current line number: ' + str(self._current[2]) + '\n'
+            to_print += '           Current line: ' + ' '.join(self._current[1]) + '\n'
+        if self._next:
+            to_print += '      Next command line: ' + str(self._next[2]) + '\n'
+            to_print += '           Next command: ' + ' '.join(self._next[1]) + '\n' 
         return to_print 
                 
     def has_more_commands(self):
         """
         Checks to see if there are any more commands in input.
-        Sets line index of next command, if there is one, and returns Boolean.  
+        Reads next command, if there is one and it hasn't been read yet, and returns Boolean.  
         """
         
-        #if current command has already run once, then increment by 1  
-        start = 0
-        if self._current_command:
-            start = self._current_command + 1
-        end = len(self._content) 
-        
-        for index in range(start, end):
-            line = self._content[index]
+        if self._next is None:
+            self._next = next(self._commands, None)
             
-            if not len(line) or line.replace(' ','').startswith('//'):
-                continue
-            
-            elif line.split()[0] in self._math_commands + self._command_types:                
-                self._next_command = index    
-                return True 
-
-            else:
-                continue            
-
-        return False       
+        return self._next is not None       
     
     def advance(self):
         """
-        Reads the next command from input, makes it the current command and runs parse_command(). 
+        Reads the next command from input and makes it the current command. 
         Should be called only if has_more_commands() is true. Initially there is no current command.
+        Returns line number of current command.
         """     
         
-        self._current_command = self._next_command  
-        self._parse_command()        
-        return self._current_command   
-
-    def _parse_command(self):
-        """
-        Parses command into its parts and saves it as a list to self._current_args 
-        """
-    
-        self._current_args = self._content[self._current_command].split('//')[0].split()
+        self._current = self._next
+        self._next = None
+        return self._current[2]   
     
     def command_type(self):
         """
@@ -113,26 +116,11 @@ class Parser:
         C_ARITHMETIC is returned for all arithmetic VM commands.
         """ 
         
-        command = self._current_args[0]
-        
-        #if command in ['add','sub','neg','eq','gt','lt','and','or','not']
-        if command in self._math_commands:                
-            return 'C_ARITHMETIC'
-        
-        elif command in self._command_type_table:
-            return self._command_type_table[command]
-            
-        return None               
+        return self._current[0]               
         
     def get_args(self):  
         """
         Returns current args as list.       
         """    
         
-        return self._current_args  
-        
-    
-    
-    
-    
-    
\ No newline at end of file
+        return self._current[1]  